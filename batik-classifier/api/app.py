@@ -1,18 +1,13 @@
 import os
 import json
 import numpy as np
-# Using standard TensorFlow Lite interpreter
-try:
-    from tensorflow.lite import Interpreter
-except ImportError:
-    from tflite_runtime.interpreter import Interpreter
-# Import MobileNetV2 preprocessing
-try:
-    from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
-    USE_MOBILENET_PREPROCESSING = True
-except ImportError:
-    USE_MOBILENET_PREPROCESSING = False
-    print("⚠️  TensorFlow not available, using standard normalization")
+# Lightest available TFLite runtime (ai-edge-litert > tflite_runtime > tensorflow)
+from runtime import get_interpreter_class, runtime_name
+Interpreter = get_interpreter_class()
+# prepare_image() applies x/127.5 - 1.0, which is exactly what
+# tensorflow.keras.applications.mobilenet_v2.preprocess_input does, so the
+# full TensorFlow import is not needed just for preprocessing.
+USE_MOBILENET_PREPROCESSING = True
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
@@ -25,12 +20,12 @@ CORS(app)
 # --- KONFIGURASI ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Pastikan path ini sesuai struktur folder kamu
-MODEL_PATH = os.path.join(BASE_DIR, 'models', 'batik_model.tflite') 
-CLASSES_PATH = os.path.join(BASE_DIR, 'models', 'batik_classes_mobilenet_ultimate.json')
+MODEL_PATH = os.environ.get('BATIK_MODEL_PATH') or os.path.join(BASE_DIR, 'models', 'batik_model.tflite')
+CLASSES_PATH = os.environ.get('BATIK_LABELS_PATH') or os.path.join(BASE_DIR, 'models', 'batik_classes_mobilenet_ultimate.json')
 
 print("==================================================")
 print("🚀 MEMULAI BATIK CLASSIFIER (TFLITE ENGINE V2)")
-print("⚡ Mode: ai-edge-litert Runtime (38 Batik Classes)")
+print(f"⚡ Mode: {runtime_name()} Runtime (38 Batik Classes)")
 print("==================================================")
 
 # --- 1. LOAD MODEL TFLITE ---
@@ -1,11 +1,9 @@
 import os
 import json
 import numpy as np
-# Using standard TensorFlow Lite interpreter for HuggingFace Spaces
-try:
-    from tensorflow.lite import Interpreter
-except ImportError:
-    from tflite_runtime.interpreter import Interpreter
+# Lightest available TFLite runtime (ai-edge-litert > tflite_runtime > tensorflow)
+from runtime import get_interpreter_class
+Interpreter = get_interpreter_class()
 
 import gradio as gr
 from PIL import Image
@@ -13,8 +11,8 @@ import io
 
 # --- CONFIGURATION ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_PATH = os.path.join(BASE_DIR, 'batik_model.tflite') 
-CLASSES_PATH = os.path.join(BASE_DIR, 'batik_labels_v2.json')
+MODEL_PATH = os.environ.get('BATIK_MODEL_PATH') or os.path.join(BASE_DIR, 'batik_model.tflite')
+CLASSES_PATH = os.environ.get('BATIK_LABELS_PATH') or os.path.join(BASE_DIR, 'batik_labels_v2.json')
 
 print("==================================================")
 print("🚀 BATIK CLASSIFIER - HUGGINGFACE SPACES")
@@ -1,11 +1,9 @@
 import os
 import json
 import numpy as np
-# Using standard TensorFlow Lite interpreter
-try:
-    from tensorflow.lite import Interpreter
-except ImportError:
-    from tflite_runtime.interpreter import Interpreter
+# Lightest available TFLite runtime (ai-edge-litert > tflite_runtime > tensorflow)
+from runtime import get_interpreter_class
+Interpreter = get_interpreter_class()
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
@@ -18,8 +16,8 @@ CORS(app)
 # --- KONFIGURASI ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Pastikan path ini sesuai struktur folder kamu
-MODEL_PATH = os.path.join(BASE_DIR, 'models', 'batik_model.tflite') 
-CLASSES_PATH = os.path.join(BASE_DIR, 'models', 'batik_classes_mobilenet_ultimate.json')
+MODEL_PATH = os.environ.get('BATIK_MODEL_PATH') or os.path.join(BASE_DIR, 'models', 'batik_model.tflite')
+CLASSES_PATH = os.environ.get('BATIK_LABELS_PATH') or os.path.join(BASE_DIR, 'models', 'batik_classes_mobilenet_ultimate.json')
 
 print("==================================================")
 print("🚀 MEMULAI BATIK CLASSIFIER (TFLITE ENGINE V2)")
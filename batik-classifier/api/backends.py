@@ -0,0 +1,303 @@
+"""
+Inference backends behind ``LoadedModel`` and ``run_inference``.
+
+A backend owns one loaded model and turns an input batch into class scores;
+labels, locking, warm-up, hot reload and the registry stay in ``serving.py``.
+
+- ``tflite``: a TensorFlow Lite interpreter from the lightest runtime
+  ``runtime.py`` finds. Serves ``.tflite`` files, as before.
+- ``keras``: the training notebooks' ``best_model_batik.keras`` /
+  ``final_model_batik.h5`` (or ``train.py``'s), run through a ``tf.function``
+  traced once for a fixed batch shape. It takes uint8 pixels and applies the
+  model's input scaling inside that graph. Needs full TensorFlow.
+  The scaling is ``BATIK_KERAS_INPUT_SCALE`` or a registry entry's
+  ``"input_scale"`` (``serving``, ``unit`` or ``none``, as in
+  ``training/export.py``); by default ``none`` for ``train.py``'s
+  ``batik_*`` models and ``unit`` (the notebooks' ``rescale=1./255``) for
+  any other.
+
+``BATIK_INFERENCE_BACKEND`` or a registry entry's ``"backend"`` picks one;
+``auto`` (the default) goes by the model file's extension.
+
+Both return the model's pooled features next to its scores from the same
+invoke when it has them: a ``training/export.py --embeddings`` TFLite model's
+``embeddings`` output, or a Keras model's ``features`` /
+``GlobalAveragePooling2D`` layer.
+
+``BATIK_KERAS_JIT_COMPILE=1`` compiles the Keras graph with XLA. It is off by
+default: XLA's CPU depthwise convolution is 50-100x slower than TensorFlow's
+kernel, which makes MobileNetV2 and EfficientNet ~15x slower compiled.
+"""
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import runtime
+
+SERVING_SIGNATURE = "serving_default"
+KERAS_SUFFIXES = {".keras", ".h5", ".hdf5"}
+KERAS_JIT_COMPILE = os.environ.get("BATIK_KERAS_JIT_COMPILE", "0") == "1"
+# Keras backend input scaling from [0, 255], as in training/export.py.
+INPUT_SCALES = {
+    "serving": lambda x: x / 127.5 - 1.0,
+    "unit": lambda x: x / 255.0,
+    "none": lambda x: x,
+}
+
+
+def _load_interpreter(model_path: Path, num_threads: Optional[int] = None):
+    # Prefers ai_edge_litert / tflite_runtime; TensorFlow is only a fallback.
+    Interpreter = runtime.get_interpreter_class()
+    if num_threads:
+        interpreter = Interpreter(model_path=str(model_path), num_threads=num_threads)
+    else:
+        interpreter = Interpreter(model_path=str(model_path))
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+def _signature_io(interpreter) -> Tuple[dict, dict]:
+    """(input, output) tensor details to feed and read: ``image`` and
+    ``probabilities`` of the named signature ``training/export.py`` writes,
+    or the model's first input and output."""
+    try:
+        io = interpreter.get_signature_list().get(SERVING_SIGNATURE, {})
+    except Exception:
+        io = {}
+    if "image" in io.get("inputs", ()) and "probabilities" in io.get("outputs", ()):
+        runner = interpreter.get_signature_runner(SERVING_SIGNATURE)
+        return runner.get_input_details()["image"], runner.get_output_details()["probabilities"]
+    return interpreter.get_input_details()[0], interpreter.get_output_details()[0]
+
+
+def _embedding_output(interpreter) -> Optional[dict]:
+    """Details of the signature's ``embeddings`` output, if it has one."""
+    try:
+        if "embeddings" in interpreter.get_signature_list().get(SERVING_SIGNATURE, {}).get("outputs", ()):
+            return interpreter.get_signature_runner(SERVING_SIGNATURE).get_output_details()["embeddings"]
+    except Exception:
+        pass
+    return None
+
+
+def _feature_layer(model):
+    # As training/export.py's feature_layer: train.py's "features", else the
+    # last top-level GlobalAveragePooling2D.
+    import keras
+
+    try:
+        return model.get_layer("features")
+    except ValueError:
+        pass
+    pools = [layer for layer in model.layers if isinstance(layer, keras.layers.GlobalAveragePooling2D)]
+    return pools[-1] if pools else None
+
+
+def takes_pixels(detail: dict) -> bool:
+    """True if the model normalizes its own input (``training/export.py``):
+    it is fed the uint8 pixels ``resize_for_model`` returns, as they are.
+    Quantized uint8 inputs have a scale and still need the float path."""
+    return np.dtype(detail["dtype"]) == np.uint8 and not detail["quantization"][0]
+
+
+def _synthetic_input(shape: Tuple[int, ...], dtype) -> np.ndarray:
+    dtype = np.dtype(dtype)
+    rng = np.random.default_rng(0)
+    if np.issubdtype(dtype, np.floating):
+        return rng.uniform(-1.0, 1.0, size=shape).astype(dtype)
+    info = np.iinfo(dtype)
+    return rng.integers(info.min, info.max, size=shape, endpoint=True, dtype=dtype)
+
+
+class InferenceBackend:
+    """One loaded model. Callers serialize ``predict`` calls."""
+
+    name = ""
+    input_shape: List[int]  # (batch, height, width, 3) of one call
+    input_dtype: np.dtype
+    output_shape: List[int]
+    takes_pixels: bool  # uint8 resize_for_model pixels, not normalized floats
+    memory_bytes: int
+    embedding_size = 0  # length of the pooled features; 0 if the model has none
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def predict_with_embeddings(self, batch: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(scores, float32 embeddings) for a batch of any size, both from the
+        same invokes. Only for models with ``embedding_size``."""
+        raise NotImplementedError
+
+    def _chunks(self, batch: np.ndarray) -> Iterator[Tuple[np.ndarray, int]]:
+        """``batch`` in the model's batch size, the last chunk zero-padded:
+        (chunk, rows of it that are real)."""
+        size = self.input_shape[0]
+        for start in range(0, len(batch), size):
+            chunk = batch[start:start + size]
+            count = len(chunk)
+            if count < size:
+                padded = np.zeros((size,) + chunk.shape[1:], dtype=chunk.dtype)
+                padded[:count] = chunk
+                chunk = padded
+            yield chunk, count
+
+    def synthetic_input(self) -> np.ndarray:
+        """A valid input batch, for warm-up."""
+        return _synthetic_input(tuple(self.input_shape), self.input_dtype)
+
+    def describe(self) -> dict:
+        return {"backend": self.name}
+
+
+class TFLiteBackend(InferenceBackend):
+    name = "tflite"
+
+    def __init__(self, model_path: Path, num_threads: Optional[int] = None):
+        self.model_path = Path(model_path)
+        self.interpreter = _load_interpreter(self.model_path, num_threads)
+        self.input_detail, self.output_detail = _signature_io(self.interpreter)
+        self.input_index = self.input_detail["index"]
+        self.output_index = self.output_detail["index"]
+        self.input_shape = [int(d) for d in self.input_detail["shape"]]
+        self.input_dtype = np.dtype(self.input_detail["dtype"])
+        self.output_shape = [int(d) for d in self.output_detail["shape"]]
+        self.takes_pixels = takes_pixels(self.input_detail)
+        self.embedding_detail = _embedding_output(self.interpreter)
+        if self.embedding_detail is not None:
+            self.embedding_size = int(self.embedding_detail["shape"][-1])
+        self.memory_bytes = self._estimate_memory()
+
+    def _estimate_memory(self) -> int:
+        """Upper bound on what this interpreter holds: every tensor (weights
+        and activations, ignoring arena reuse) or at least the file size."""
+        tensor_bytes = 0
+        try:
+            for detail in self.interpreter.get_tensor_details():
+                shape = detail.get("shape")
+                if shape is None or len(shape) == 0:
+                    continue
+                tensor_bytes += int(np.prod(shape)) * np.dtype(detail["dtype"]).itemsize
+        except Exception:
+            pass
+        return max(tensor_bytes, self.model_path.stat().st_size)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        self.interpreter.set_tensor(self.input_index, batch)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index)
+
+    def predict_with_embeddings(self, batch: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        scores, embeddings = [], []
+        for chunk, count in self._chunks(batch):
+            self.interpreter.set_tensor(self.input_index, chunk)
+            self.interpreter.invoke()
+            scores.append(self.interpreter.get_tensor(self.output_index)[:count].copy())
+            embeddings.append(self.interpreter.get_tensor(self.embedding_detail["index"])[:count].copy())
+        return np.concatenate(scores), np.concatenate(embeddings)
+
+    def describe(self) -> dict:
+        return {"backend": self.name, "runtime": runtime.runtime_name(), "embedding_size": self.embedding_size}
+
+
+class KerasBackend(InferenceBackend):
+    """A Keras model as one graph for a fixed batch shape (XLA-compiled if
+    ``jit``); smaller batches are padded, larger ones run in several calls."""
+
+    name = "keras"
+
+    def __init__(
+        self,
+        model_path: Path,
+        batch_size: int = 1,
+        input_scale: Optional[str] = None,
+        jit: Optional[bool] = None,
+    ):
+        tf = runtime.load_tensorflow()
+        import keras
+
+        self.model_path = Path(model_path)
+        model = keras.models.load_model(self.model_path, compile=False)
+        self.model = model
+        height, width = (int(d) for d in model.input_shape[1:3])
+        # train.py names its models batik_<backbone> and scales inside them;
+        # the notebooks' models were trained on ImageDataGenerator(rescale=1./255).
+        self.input_scale = input_scale or ("none" if model.name.startswith("batik_") else "unit")
+        if self.input_scale not in INPUT_SCALES:
+            raise ValueError(f"Unknown input scale '{self.input_scale}'; choose from {', '.join(INPUT_SCALES)}")
+        scale = INPUT_SCALES[self.input_scale]
+        self.batch_size = batch_size
+        self.input_shape = [batch_size, height, width, 3]
+        self.input_dtype = np.dtype(np.uint8)
+        self.output_shape = [batch_size, int(model.output_shape[-1])]
+        self.takes_pixels = True
+        self.memory_bytes = max(
+            sum(int(np.prod(w.shape)) * np.dtype(w.dtype).itemsize for w in model.weights),
+            self.model_path.stat().st_size,
+        )
+
+        # One graph for scores and pooled features; predict() drops the latter.
+        layer = _feature_layer(model)
+        if layer is not None:
+            network = keras.Model(model.inputs, [model.outputs[0], layer.output], name=model.name)
+            self.embedding_size = int(layer.output.shape[-1])
+        else:
+            network = keras.Model(model.inputs, [model.outputs[0]], name=model.name)
+
+        def run(pixels):
+            return tuple(network(scale(tf.cast(pixels, tf.float32)), training=False))
+
+        spec = [tf.TensorSpec(self.input_shape, tf.uint8, name="image")]
+        self.jit = KERAS_JIT_COMPILE if jit is None else jit
+        self._run = tf.function(run, input_signature=spec, jit_compile=self.jit)
+        # Trace and compile now, so it counts as load time rather than the first request's.
+        try:
+            self._run(self.synthetic_input())
+        except Exception as exc:
+            if not self.jit:
+                raise
+            print(f"XLA compilation failed for {self.model_path.name}, running without jit_compile: {exc}")
+            self.jit = False
+            self._run = tf.function(run, input_signature=spec)
+            self._run(self.synthetic_input())
+
+    def _outputs(self, batch: np.ndarray) -> List[np.ndarray]:
+        chunks = [[output.numpy()[:count] for output in self._run(chunk)] for chunk, count in self._chunks(batch)]
+        return [np.concatenate(outputs) for outputs in zip(*chunks)]
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self._outputs(batch)[0]
+
+    def predict_with_embeddings(self, batch: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        scores, embeddings = self._outputs(batch)
+        return scores, embeddings
+
+    def describe(self) -> dict:
+        return {
+            "backend": self.name,
+            "jit_compile": self.jit,
+            "input_scale": self.input_scale,
+            "embedding_size": self.embedding_size,
+        }
+
+
+BACKENDS: Dict[str, type] = {"tflite": TFLiteBackend, "keras": KerasBackend}
+
+
+def backend_name(name: str, model_path: Path) -> str:
+    """Resolve ``auto`` by the model file's extension."""
+    if name in ("", "auto"):
+        return "keras" if Path(model_path).suffix.lower() in KERAS_SUFFIXES else "tflite"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}'; choose from auto, {', '.join(BACKENDS)}")
+    return name
+
+
+def load_backend(name: str, model_path: Path, input_scale: Optional[str] = None) -> InferenceBackend:
+    """The backend for ``model_path``; ``input_scale`` only applies to Keras
+    models (a TFLite model's preprocessing is fixed by how it was exported)."""
+    name = backend_name(name, model_path)
+    if name == "keras":
+        return KerasBackend(model_path, input_scale=input_scale)
+    return BACKENDS[name](model_path)
@@ -0,0 +1,299 @@
+"""
+Offline batch classifier: the serving preprocessing and model, without HTTP.
+
+Walks a directory tree (or reads a manifest), decodes and resizes images on a
+process pool, runs batched inference in this process and streams one row per
+image to CSV or JSONL. The output file doubles as the checkpoint: rerunning
+the same command skips every path already written, so an interrupted run
+resumes where it stopped.
+
+    python batch_classify.py /data/arsip_batik --output hasil.csv
+    python batch_classify.py --manifest daftar.txt --output hasil.jsonl --top-k 5
+    python batch_classify.py /data/arsip_batik --output hasil.csv --workers 8 --batch-size 64
+    python batch_classify.py /data/arsip_batik --output hasil.csv --quarantine /data/arsip_batik.quarantine.json
+"""
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+from serving import (
+    BatchPredictor,
+    _load_class_names,
+    _resolve_first_existing,
+    resize_for_model,
+    top_k_indices,
+)
+
+BASE_DIR = Path(__file__).parent
+MODEL_CANDIDATES = [
+    BASE_DIR / "batik_model.tflite",
+    BASE_DIR / "models" / "batik_model.tflite",
+]
+LABEL_CANDIDATES = [
+    BASE_DIR / "batik_labels_v2.json",
+    BASE_DIR / "models" / "batik_labels_v2.json",
+    BASE_DIR / "models" / "batik_classes_mobilenet_ultimate.json",
+]
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+
+def walk_images(root: Path) -> Iterator[Tuple[str, Path]]:
+    """(path relative to root, absolute path) in a stable, sorted order, lazily."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except OSError as exc:
+            print(f"Skipping unreadable directory {directory}: {exc}", file=sys.stderr)
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(Path(entry.path))
+            elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                yield os.path.relpath(entry.path, root), Path(entry.path)
+        stack.extend(reversed(subdirs))
+
+
+def read_manifest(manifest: Path) -> Iterator[Tuple[str, Path]]:
+    """One path per line, or a CSV with a ``path`` column; relative to the manifest."""
+    base = manifest.parent
+    with manifest.open("r", encoding="utf-8", newline="") as f:
+        if manifest.suffix.lower() == ".csv":
+            rows = csv.DictReader(f)
+            column = "path" if rows.fieldnames and "path" in rows.fieldnames else rows.fieldnames[0]
+            names = (row[column] for row in rows)
+        else:
+            names = (line.strip() for line in f)
+        for name in names:
+            if name and not name.startswith("#"):
+                yield name, (base / name if not os.path.isabs(name) else Path(name))
+
+
+def _decode_chunk(items: List[Tuple[str, str]], target_size: Tuple[int, int], fast_jpeg: bool):
+    """Worker: decode and resize a chunk; returns (keys, uint8 pixels, errors)."""
+    keys, pixels, errors = [], [], []
+    for key, path in items:
+        try:
+            with Image.open(path) as image:
+                if fast_jpeg and image.format == "JPEG":
+                    # Let libjpeg decode at a reduced scale (>= 2x the target).
+                    image.draft("RGB", (target_size[0] * 2, target_size[1] * 2))
+                pixels.append(resize_for_model(image, target_size))
+            keys.append(key)
+        except Exception as exc:
+            errors.append((key, f"{type(exc).__name__}: {exc}".replace("\n", " ")))
+    stacked = np.stack(pixels) if pixels else np.zeros((0, target_size[1], target_size[0], 3), np.uint8)
+    return keys, stacked, errors
+
+
+def load_quarantine(path: Path) -> Dict[str, str]:
+    """path -> reason from a quarantine list written by training/scan.py."""
+    with path.open("r", encoding="utf-8") as f:
+        return {entry["path"]: entry["error"] for entry in json.load(f)["quarantined"]}
+
+
+class ResultWriter:
+    """Appends result rows, flushing after each batch; also reads back finished paths."""
+
+    def __init__(self, path: Path, fmt: str, top_k: int, overwrite: bool = False, retry_errors: bool = False):
+        self.path = path
+        self.fmt = fmt
+        self.top_k = top_k
+        self.done: Set[str] = set() if overwrite else self._finished_paths(retry_errors)
+        exists = path.exists() and not overwrite and path.stat().st_size > 0
+        self._file = path.open("a" if exists else "w", encoding="utf-8", newline="")
+        self._csv = None
+        if fmt == "csv":
+            fields = ["path", "prediction", "confidence"]
+            for rank in range(1, top_k + 1):
+                fields += [f"top{rank}_class", f"top{rank}_confidence"]
+            fields.append("error")
+            self._csv = csv.DictWriter(self._file, fieldnames=fields)
+            if not exists:
+                self._csv.writeheader()
+
+    def _finished_paths(self, retry_errors: bool) -> Set[str]:
+        if not self.path.exists():
+            return set()
+        data = self.path.read_bytes()
+        if data and not data.endswith(b"\n"):
+            # The previous run died mid-row: drop the partial line.
+            data = data[: data.rfind(b"\n") + 1]
+            self.path.write_bytes(data)
+        text = data.decode("utf-8")
+        if self.fmt == "csv":
+            reader = csv.DictReader(io.StringIO(text, newline=""))
+            rows = list(reader)
+        else:
+            rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+        if retry_errors:
+            rows = [row for row in rows if not row.get("error")]
+            with self.path.open("w", encoding="utf-8", newline="") as f:
+                if self.fmt == "csv":
+                    rewriter = csv.DictWriter(f, fieldnames=reader.fieldnames)
+                    rewriter.writeheader()
+                    rewriter.writerows(rows)
+                else:
+                    f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+        return {row["path"] for row in rows}
+
+    def write(self, key: str, scores: Optional[np.ndarray], class_names: List[str], indices=None, error: str = ""):
+        if self.fmt == "csv":
+            row = {"path": key, "error": error}
+            if scores is not None:
+                row["prediction"] = class_names[indices[0]]
+                row["confidence"] = f"{float(scores[indices[0]]):.6f}"
+                for rank, idx in enumerate(indices, start=1):
+                    row[f"top{rank}_class"] = class_names[idx]
+                    row[f"top{rank}_confidence"] = f"{float(scores[idx]):.6f}"
+            self._csv.writerow(row)
+        else:
+            row = {"path": key}
+            if scores is not None:
+                row["prediction"] = class_names[indices[0]]
+                row["confidence"] = float(scores[indices[0]])
+                row["top_k"] = [{"class": class_names[i], "confidence": float(scores[i])} for i in indices]
+            if error:
+                row["error"] = error
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def flush(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
+
+def _chunks(items: Iterator[Tuple[str, Path]], size: int) -> Iterator[List[Tuple[str, str]]]:
+    chunk = []
+    for key, path in items:
+        chunk.append((key, str(path)))
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _skip_quarantined(items, quarantined: Dict[str, str], writer: "ResultWriter", class_names: List[str]):
+    for key, path in items:
+        reason = quarantined.get(key.replace(os.sep, "/"))
+        if reason is None:
+            yield key, path
+        else:
+            writer.write(key, None, class_names, error=f"quarantined: {reason}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", nargs="?", type=Path, help="Directory tree of images")
+    parser.add_argument("--manifest", type=Path, help="Text file (one path per line) or CSV with a 'path' column")
+    parser.add_argument("--output", type=Path, required=True, help="Results file (.csv or .jsonl); also the checkpoint")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="Defaults to the output file's extension")
+    parser.add_argument("--model", type=Path, default=os.environ.get("BATIK_MODEL_PATH"))
+    parser.add_argument("--labels", type=Path, default=os.environ.get("BATIK_LABELS_PATH"))
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Decode processes")
+    parser.add_argument("--threads", type=int, default=None, help="Interpreter threads")
+    parser.add_argument("--fast-jpeg", action="store_true",
+                        help="Decode large JPEGs at reduced scale (faster; pixels differ slightly from the server)")
+    parser.add_argument("--overwrite", action="store_true", help="Start over instead of resuming")
+    parser.add_argument("--retry-errors", action="store_true", help="On resume, redo files that failed to decode")
+    parser.add_argument("--quarantine", type=Path,
+                        help="Quarantine list from training/scan.py; those files are recorded as failed, not decoded")
+    args = parser.parse_args()
+
+    if (args.input is None) == (args.manifest is None):
+        parser.error("give either an input directory or --manifest")
+    fmt = args.format or ("jsonl" if args.output.suffix.lower() in (".jsonl", ".json") else "csv")
+
+    model_path = args.model or _resolve_first_existing(MODEL_CANDIDATES)
+    class_names = _load_class_names(args.labels or _resolve_first_existing(LABEL_CANDIDATES))
+    if not 1 <= args.top_k <= len(class_names):
+        parser.error(f"--top-k must be between 1 and {len(class_names)}")
+
+    writer = ResultWriter(args.output, fmt, args.top_k, args.overwrite, args.retry_errors)
+    if writer.done:
+        print(f"Resuming: {len(writer.done)} files already in {args.output}")
+
+    source = walk_images(args.input) if args.input else read_manifest(args.manifest)
+    pending = ((key, path) for key, path in source if key not in writer.done)
+    if args.quarantine:
+        quarantined = load_quarantine(args.quarantine)
+        print(f"{len(quarantined)} files quarantined in {args.quarantine}")
+        pending = _skip_quarantined(pending, quarantined, writer, class_names)
+
+    # Workers start from a fresh forkserver (spawn where there is none), never
+    # by forking this process once the interpreter's threads exist; the pool
+    # only starts them at the first submit(), after BatchPredictor is built.
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    pool = ProcessPoolExecutor(max_workers=max(1, args.workers), mp_context=multiprocessing.get_context(start_method))
+    predictor = BatchPredictor(Path(model_path), args.batch_size, args.threads)
+    if predictor.num_classes != len(class_names):
+        raise SystemExit(f"Model has {predictor.num_classes} outputs but the labels list {len(class_names)} classes")
+
+    processed = failed = 0
+    started = last_report = time.perf_counter()
+    in_flight: deque = deque()
+    chunks = _chunks(pending, predictor.batch_size)
+    try:
+        while True:
+            # Keep every worker busy, but bound how far decoding runs ahead.
+            while len(in_flight) < 2 * args.workers:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                in_flight.append(pool.submit(_decode_chunk, chunk, predictor.target_size, args.fast_jpeg))
+            if not in_flight:
+                break
+
+            keys, pixels, errors = in_flight.popleft().result()
+            if len(keys):
+                scores = predictor.predict(predictor.prepare(pixels))
+                top = top_k_indices(scores, args.top_k)
+                for key, row_scores, row_top in zip(keys, scores, top):
+                    writer.write(key, row_scores, class_names, row_top)
+            for key, error in errors:
+                writer.write(key, None, class_names, error=error)
+            writer.flush()
+
+            processed += len(keys)
+            failed += len(errors)
+            if time.perf_counter() - last_report > 10:
+                last_report = time.perf_counter()
+                rate = processed / (last_report - started)
+                print(f"{processed} classified, {failed} failed, {rate:.1f} images/s")
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume.")
+    finally:
+        for future in in_flight:
+            future.cancel()
+        pool.shutdown(cancel_futures=True)
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Done: {processed} classified, {failed} failed in {elapsed:.1f}s "
+        f"({processed / elapsed if elapsed else 0:.1f} images/s) -> {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,72 @@
+import asyncio
+import base64
 import json
 import os
+import secrets
+import time
 from io import BytesIO
 from pathlib import Path
 import threading
-from typing import List
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
+
+_imports_started = time.perf_counter()
 
 import numpy as np
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import Depends, FastAPI, File, Header, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image, ImageOps
+from fastapi.responses import JSONResponse, Response
+from PIL import Image
 
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
 
+import memory
+import metrics
+import profiler
+import runtime
+import tracing
+from serving import (
+    ModelBudgetError,
+    ModelRegistry,
+    ModelSpec,
+    ReloadError,
+    UnknownModelError,
+    _load_class_names,  # noqa: F401  (re-exported for tools importing main)
+    _load_interpreter,  # noqa: F401
+    _resolve_first_existing,  # noqa: F401
+    load_registry_specs,
+    top_k_indices,
+)
+
+runtime.record_startup_phase("import numpy/fastapi/pillow", time.perf_counter() - _imports_started)
+
 BASE_DIR = Path(__file__).parent
+# Synthetic inferences per interpreter before /ready reports ready (0 disables).
+WARMUP_RUNS = int(os.environ.get("BATIK_WARMUP_RUNS", "3"))
+# Poll the model/label files every N seconds and hot-reload on change (0 disables).
+RELOAD_POLL_SECONDS = float(os.environ.get("BATIK_RELOAD_POLL_SECONDS", "0"))
+# Inference backend: auto (by model file extension), tflite or keras (see backends.py).
+INFERENCE_BACKEND = os.environ.get("BATIK_INFERENCE_BACKEND", "auto")
+# Input scaling for Keras models: serving, unit or none (unset: chosen per model, see backends.py).
+KERAS_INPUT_SCALE = os.environ.get("BATIK_KERAS_INPUT_SCALE", "") or None
+# Optional JSON registry of models to serve side by side (see model_registry.example.json).
+REGISTRY_PATH = os.environ.get("BATIK_MODEL_REGISTRY", "")
+# Total estimated memory for loaded models; idle models are unloaded LRU-first (0 = unlimited).
+MEMORY_BUDGET_MB = float(os.environ.get("BATIK_MODEL_MEMORY_BUDGET_MB", "0"))
+# Shared secret for /admin/* endpoints (sent as X-Admin-Token); unset disables them.
+ADMIN_TOKEN = os.environ.get("BATIK_ADMIN_TOKEN", "")
+# Fraction of /predict requests exported as spans; errors and requests with a
+# sampled W3C traceparent are always exported.
+TRACE_SAMPLE_RATE = float(os.environ.get("BATIK_TRACE_SAMPLE_RATE", "0.01"))
+# OTLP/JSON span file, rotated by size (empty disables span export).
+TRACE_FILE = os.environ.get("BATIK_TRACE_FILE", str(BASE_DIR / "traces" / "spans.jsonl"))
+TRACE_MAX_MB = float(os.environ.get("BATIK_TRACE_MAX_MB", "10"))
+TRACE_BACKUPS = int(os.environ.get("BATIK_TRACE_BACKUPS", "3"))
+# Most images one /embed request may carry.
+EMBED_MAX_FILES = int(os.environ.get("BATIK_EMBED_MAX_FILES", "32"))
+# Longest run accepted by GET /admin/profile.
+PROFILE_MAX_SECONDS = float(os.environ.get("BATIK_PROFILE_MAX_SECONDS", "60"))
 MODEL_CANDIDATES = [
     BASE_DIR / "batik_model.tflite",
     BASE_DIR / "models" / "batik_model.tflite",
@@ -22,150 +76,281 @@ LABEL_CANDIDATES = [
     BASE_DIR / "models" / "batik_labels_v2.json",
     BASE_DIR / "models" / "batik_classes_mobilenet_ultimate.json",
 ]
+# Explicit paths (e.g. from the benchmark harness) take precedence over the candidates.
+if os.environ.get("BATIK_MODEL_PATH"):
+    MODEL_CANDIDATES.insert(0, Path(os.environ["BATIK_MODEL_PATH"]))
+if os.environ.get("BATIK_LABELS_PATH"):
+    LABEL_CANDIDATES.insert(0, Path(os.environ["BATIK_LABELS_PATH"]))
 
 
-def _resolve_first_existing(paths: List[Path]) -> Path:
-    for path in paths:
-        if path.exists():
-            return path
-    raise FileNotFoundError("No valid file found in candidates: " + ", ".join(str(p) for p in paths))
+if REGISTRY_PATH:
+    model_specs, default_model = load_registry_specs(Path(REGISTRY_PATH), INFERENCE_BACKEND, KERAS_INPUT_SCALE)
+else:
+    model_specs = [
+        ModelSpec(
+            "mobilenetv2", MODEL_CANDIDATES, LABEL_CANDIDATES, backend=INFERENCE_BACKEND, input_scale=KERAS_INPUT_SCALE
+        )
+    ]
+    default_model = "mobilenetv2"
+
+runtime.get_interpreter_class()
+registry = ModelRegistry(
+    model_specs,
+    default=default_model,
+    memory_budget_bytes=int(MEMORY_BUDGET_MB * 1024 * 1024),
+    warmup_runs=WARMUP_RUNS,
+    reload_poll_seconds=RELOAD_POLL_SECONDS,
+)
+# The default model loads eagerly (so a broken deploy fails fast); the
+# warm-up thread started by lifespan() warms it before /ready turns green.
+with runtime.startup_phase("load model"):
+    registry.slot(warm=False)
 
+print(runtime.format_startup_report())
 
-def _load_class_names(path: Path) -> List[str]:
-    with path.open("r", encoding="utf-8") as f:
-        data = json.load(f)
+# In execution order. resolve: registry lookup (a cold model loads here);
+# dispatch: waiting for a threadpool worker.
+PREDICT_STAGES = (
+    "resolve", "read", "decode", "dispatch", "preprocess", "lock_wait", "invoke", "postprocess", "serialize",
+)
+# Server-Timing entries and the stages each one sums.
+SERVER_TIMING_GROUPS = (
+    ("model", ("resolve",)),
+    ("upload", ("read",)),
+    ("decode", ("decode",)),
+    ("preprocess", ("preprocess",)),
+    ("queue", ("dispatch", "lock_wait")),
+    ("inference", ("invoke",)),
+    ("postprocess", ("postprocess",)),
+    ("serialize", ("serialize",)),
+)
+STAGE_SECONDS = metrics.Histogram("batik_predict_stage_seconds", "Time spent in each /predict stage", ["stage"])
+for _stage in PREDICT_STAGES:
+    STAGE_SECONDS.labels(_stage)
+REQUEST_SECONDS = metrics.Histogram("batik_predict_seconds", "End-to-end /predict handler time")
+REQUESTS = metrics.Counter("batik_predict_requests_total", "Finished /predict requests by HTTP status", ["status"])
+REJECTED = metrics.Counter("batik_requests_rejected_total", "Requests refused before inference", ["reason"])
+IN_FLIGHT = metrics.Gauge("batik_predict_in_flight", "/predict requests currently being handled")
+QUEUE_DEPTH = metrics.Gauge("batik_interpreter_queue_depth", "Requests waiting for or holding an interpreter lock")
+MODEL_CACHE = metrics.Counter("batik_model_cache_total", "Registry lookups that found the model loaded (hit) or loaded it (miss)", ["result"])
+MODELS_LOADED_BYTES = metrics.Gauge("batik_models_loaded_bytes", "Estimated memory held by loaded models")
+PROCESS_RSS = metrics.Gauge("batik_process_resident_memory_bytes", "Resident set size of this worker")
+MALLOC_IN_USE = metrics.Gauge("batik_malloc_in_use_bytes", "C heap handed out by glibc malloc (Pillow/NumPy buffers)")
+MALLOC_FREE = metrics.Gauge("batik_malloc_free_bytes", "Free memory glibc holds in its arenas (fragmentation)")
+PYTHON_BLOCKS = metrics.Gauge("batik_python_allocated_blocks", "Blocks held by the Python object allocator")
+OPEN_FDS = metrics.Gauge("batik_process_open_fds", "Open file descriptors (spooled uploads are temp files)")
+
+span_exporter = tracing.SpanExporter(
+    Path(TRACE_FILE) if TRACE_FILE else None,
+    sample_rate=TRACE_SAMPLE_RATE,
+    max_bytes=int(TRACE_MAX_MB * 1024 * 1024),
+    backups=TRACE_BACKUPS,
+    service_name="batik-classifier-api",
+    service_version="2.0.0",
+)
 
-    if isinstance(data, dict) and "classes" in data:
-        return list(data["classes"])
-    if isinstance(data, dict):
-        try:
-            sorted_keys = sorted(data.keys(), key=lambda x: int(x))
-            return [data[k] for k in sorted_keys]
-        except ValueError:
-            return list(data.values())
-    if isinstance(data, list):
-        return data
-    raise ValueError("Unrecognized label file format")
 
+def _reject(status_code: int, reason: str, detail: str) -> HTTPException:
+    REJECTED.labels(reason).inc()
+    return HTTPException(status_code=status_code, detail=detail)
 
-def _load_interpreter(model_path: Path):
-    try:
-        import tensorflow as tf
-        interpreter = tf.lite.Interpreter(model_path=str(model_path))
-    except Exception:
-        try:
-            from tflite_runtime.interpreter import Interpreter
-            interpreter = Interpreter(model_path=str(model_path))
-        except Exception as exc:
-            raise RuntimeError("TensorFlow Lite interpreter is not available") from exc
-    interpreter.allocate_tensors()
-    return interpreter
-
-
-MODEL_PATH = _resolve_first_existing(MODEL_CANDIDATES)
-LABEL_PATH = _resolve_first_existing(LABEL_CANDIDATES)
-class_names = _load_class_names(LABEL_PATH)
 
-interpreter = _load_interpreter(MODEL_PATH)
-input_details = interpreter.get_input_details()
-output_details = interpreter.get_output_details()
-input_index = input_details[0]["index"]
-output_index = output_details[0]["index"]
+def format_top_k(output: np.ndarray, indices: np.ndarray, class_names: List[str]) -> List[dict]:
+    return [
+        {
+            "class": class_names[idx],
+            "confidence": float(output[idx]),
+            "percentage": f"{float(output[idx]):.2%}",
+        }
+        for idx in indices
+    ]
 
-# Keep interpreter calls thread-safe
-_interpreter_lock = threading.Lock()
 
-# Derive target size from model input (height, width)
-if len(input_details[0]["shape"]) >= 3:
-    target_height = int(input_details[0]["shape"][1])
-    target_width = int(input_details[0]["shape"][2])
-else:
-    target_height = target_width = 224
-TARGET_SIZE = (target_width, target_height)
-
-
-def preprocess_image(image: Image.Image) -> np.ndarray:
-    # Handle EXIF orientation (important for mobile photos)
-    image = ImageOps.exif_transpose(image) or image
-    rgb_image = image.convert("RGB")
-    
-    # Debug: log original size and mode
-    print(f"DEBUG: Original image size={image.size}, mode={image.mode}, format={image.format}")
-    
-    # CENTER CROP to square (prevent distortion from different aspect ratios)
-    width, height = rgb_image.size
-    min_side = min(width, height)
-    left = (width - min_side) // 2
-    top = (height - min_side) // 2
-    right = left + min_side
-    bottom = top + min_side
-    rgb_image = rgb_image.crop((left, top, right, bottom))
-    
-    print(f"DEBUG: After center crop to square: {rgb_image.size}")
-    
-    # Use BILINEAR resampling for consistency with training (Google Colab default)
-    resized = rgb_image.resize(TARGET_SIZE, Image.Resampling.BILINEAR)
-    arr = np.array(resized, dtype=np.float32)
-    
-    # Debug: log pixel stats before normalization
-    print(f"DEBUG: Before norm - min={arr.min():.2f}, max={arr.max():.2f}, mean={arr.mean():.2f}")
-    
-    arr = arr / 127.5 - 1.0
-    
-    # Debug: log pixel stats after normalization
-    print(f"DEBUG: After norm - min={arr.min():.2f}, max={arr.max():.2f}, mean={arr.mean():.2f}")
-    
-    return np.expand_dims(arr, axis=0)
-
-
-def run_inference(image: Image.Image) -> dict:
-    input_data = preprocess_image(image)
-    with _interpreter_lock:
-        interpreter.set_tensor(input_index, input_data)
-        interpreter.invoke()
-        output = interpreter.get_tensor(output_index)[0]
+def run_inference(
+    image: Image.Image, k: int = 5, model_name: Optional[str] = None, timings: Optional[dict] = None
+) -> dict:
+    """Classify one image. Stage durations (seconds) go into ``timings`` if given."""
+    timings = {} if timings is None else timings
+    # Pin one model for the whole request so a hot reload can't mix the
+    # new labels with the old model's output.
+    with registry.acquire(model_name) as model:
+        started = time.perf_counter()
+        input_data = model.preprocess(image)
+        timings["preprocess"] = time.perf_counter() - started
+        QUEUE_DEPTH.inc()
+        try:
+            output = model.predict(input_data, timings)[0]
+        finally:
+            QUEUE_DEPTH.dec()
+        class_names = model.class_names
 
+    started = time.perf_counter()
     predicted_idx = int(np.argmax(output))
     predicted_label = class_names[predicted_idx]
     confidence = float(output[predicted_idx])
 
-    top_indices = np.argsort(output)[-5:][::-1]
-    top_5 = [
-        {
-            "class": class_names[idx],
-            "confidence": float(output[idx]),
-            "percentage": f"{float(output[idx]):.2%}",
-        }
-        for idx in top_indices
-    ]
+    top_predictions = format_top_k(output, top_k_indices(output, k), class_names)
+    # top_5_predictions keeps its meaning for existing clients whatever k is.
+    top_5 = min(5, len(class_names))
+    top_5_predictions = top_predictions if k == top_5 else format_top_k(output, top_k_indices(output, top_5), class_names)
+    timings["postprocess"] = time.perf_counter() - started
 
     return {
         "success": True,
         "prediction": predicted_label,
         "confidence": confidence,
         "percentage": f"{confidence:.2%}",
-        "top_5_predictions": top_5,
+        "model": model_name or registry.default,
+        "top_k": k,
+        "top_predictions": top_predictions,
+        "top_5_predictions": top_5_predictions,
     }
 
 
-app = FastAPI(title="Batik Classifier API", version="2.0.0")
+def run_embeddings(
+    images: List[Image.Image],
+    k: int = 0,
+    encoding: str = "json",
+    model_name: Optional[str] = None,
+    timings: Optional[dict] = None,
+) -> dict:
+    """Float16 embeddings of a batch of images and, if ``k``, their top k
+    predictions, both from the same invokes. ``encoding`` is ``json`` (lists
+    of numbers) or ``base64`` (little-endian float16 bytes per image)."""
+    timings = {} if timings is None else timings
+    with registry.acquire(model_name) as model:
+        started = time.perf_counter()
+        batch = np.concatenate([model.preprocess(image) for image in images])
+        timings["preprocess"] = time.perf_counter() - started
+        QUEUE_DEPTH.inc()
+        try:
+            scores, embeddings = model.embed(batch, timings)
+        finally:
+            QUEUE_DEPTH.dec()
+        class_names = model.class_names
+
+    started = time.perf_counter()
+    embeddings = embeddings.astype("<f2")
+    results = []
+    for output, embedding in zip(scores, embeddings):
+        if encoding == "base64":
+            entry = {"embedding": base64.b64encode(embedding.tobytes()).decode("ascii")}
+        else:
+            entry = {"embedding": embedding.tolist()}
+        if k:
+            predicted_idx = int(np.argmax(output))
+            entry["prediction"] = class_names[predicted_idx]
+            entry["confidence"] = float(output[predicted_idx])
+            entry["top_predictions"] = format_top_k(output, top_k_indices(output, k), class_names)
+        results.append(entry)
+    timings["postprocess"] = time.perf_counter() - started
+
+    return {
+        "success": True,
+        "model": model_name or registry.default,
+        "dtype": "float16",
+        "encoding": encoding,
+        "dimensions": int(embeddings.shape[-1]),
+        "count": len(results),
+        "results": results,
+    }
+
+
+_ready = threading.Event()
+_warmup_report: dict = {"state": "pending"}
+
+
+def _run_warmup() -> None:
+    global _warmup_report
+    _warmup_report = {"state": "running", "runs": WARMUP_RUNS}
+    started = time.perf_counter()
+    per_model = {}
+    try:
+        for name, slot in registry.loaded():
+            model = slot.current
+            latencies = model.warm_up(WARMUP_RUNS)
+            # One pass through the image path faults in the Pillow/NumPy code too.
+            model.preprocess(Image.new("RGB", model.target_size))
+            per_model[name] = {
+                "first_ms": round(latencies[0], 2) if latencies else None,
+                "last_ms": round(latencies[-1], 2) if latencies else None,
+            }
+    except Exception as exc:
+        _warmup_report = {"state": "failed", "error": str(exc)}
+        print(f"Warm-up failed: {exc}")
+        return
+
+    _warmup_report = {
+        "state": "done",
+        "runs": WARMUP_RUNS,
+        "models": per_model,
+        "total_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    runtime.record_startup_phase("warm-up", time.perf_counter() - started)
+    print(f"Warm-up finished: {_warmup_report}")
+    _ready.set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up off the event loop so /health answers while /ready stays 503.
+    threading.Thread(target=_run_warmup, name="warmup", daemon=True).start()
+    span_exporter.start()
+    yield
+    registry.stop()
+    span_exporter.stop()
+
+
+def _model_slot(name: Optional[str]):
+    """Resolve a model selector to its (loaded) slot, as an HTTP error if it can't be."""
+    try:
+        slot = registry.slot(name, load=False)
+        MODEL_CACHE.labels("miss" if slot is None else "hit").inc()
+        return slot or registry.slot(name)
+    except UnknownModelError as exc:
+        raise _reject(
+            404, "unknown_model", f"Unknown model '{name}'; available: {', '.join(registry.names())}"
+        ) from exc
+    except ModelBudgetError as exc:
+        raise _reject(503, "memory_budget", str(exc)) from exc
+    except FileNotFoundError as exc:
+        raise _reject(503, "model_missing", f"Model '{name}' is not installed: {exc}") from exc
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set BATIK_ADMIN_TOKEN)")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+app = FastAPI(title="Batik Classifier API", version="2.0.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Request-ID", "traceparent"],
 )
 
 
 @app.get("/")
 async def root():
+    model = registry.slot().current
     return {
         "status": "online",
-        "model_path": str(MODEL_PATH.name),
-        "labels_path": str(LABEL_PATH.name),
-        "classes_loaded": len(class_names),
-        "input_shape": input_details[0]["shape"].tolist() if hasattr(input_details[0]["shape"], "tolist") else input_details[0]["shape"],
+        "default_model": registry.default,
+        "models": registry.names(),
+        "model_path": model.model_path.name,
+        "labels_path": model.label_path.name,
+        "model_version": model.version,
+        "classes_loaded": len(model.class_names),
+        "backend": model.backend.name,
+        "runtime": runtime.runtime_name(),
+        "startup": runtime.startup_report(),
+        "input_shape": model.input_shape,
+        "tracing": span_exporter.info(),
     }
 
 
@@ -174,30 +359,323 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def ready():
+    if not _ready.is_set():
+        return JSONResponse(status_code=503, content={"status": "warming_up", "warmup": _warmup_report})
+    return {"status": "ready", "warmup": _warmup_report}
+
+
+@app.get("/models")
+async def models():
+    return {
+        "success": True,
+        "default": registry.default,
+        "memory_budget_bytes": registry.memory_budget_bytes,
+        "loaded_bytes": registry.loaded_bytes(),
+        "models": registry.describe(),
+    }
+
+
 @app.get("/classes")
-async def classes():
+async def classes(model: Optional[str] = Query(None, description="Registry model name (default model if omitted)")):
+    slot = await run_in_threadpool(_model_slot, model)
+    class_names = slot.current.class_names
     return {"success": True, "classes": class_names, "total": len(class_names)}
 
 
+def _update_memory_gauges() -> None:
+    rss = memory.rss_bytes()
+    if rss is not None:
+        PROCESS_RSS.set(rss)
+    heap = memory.malloc_stats()
+    if heap is not None:
+        MALLOC_IN_USE.set(heap["in_use_bytes"])
+        MALLOC_FREE.set(heap["free_bytes"])
+    PYTHON_BLOCKS.set(memory.python_allocated_blocks())
+    fds = memory.open_fds()
+    if fds is not None:
+        OPEN_FDS.set(fds)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    MODELS_LOADED_BYTES.set(registry.loaded_bytes())
+    _update_memory_gauges()
+    return Response(metrics.render_latest(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
-    if not file:
-        raise HTTPException(status_code=400, detail="File is required")
+async def predict(
+    request: Request,
+    file: UploadFile = File(...),
+    k: int = Query(5, ge=1, description="Number of top predictions to return"),
+    model: Optional[str] = Query(None, description="Registry model name (default model if omitted)"),
+):
+    trace = tracing.RequestTrace.from_headers(request.headers)
+    timings = {}
+    IN_FLIGHT.inc()
+    status = 500
+    try:
+        response = await _predict(file, k, model, timings)
+        status = response.status_code
+    except HTTPException as exc:
+        status = exc.status_code
+        exc.headers = {**(exc.headers or {}), **_finish_trace(trace, timings, status, k, model)}
+        raise
+    except Exception as exc:
+        # Unexpected failures (e.g. a model whose labels no longer match)
+        # are errors too: always exported, then left to the default 500 handler.
+        _finish_trace(trace, timings, status, k, model, error=exc)
+        raise
+    finally:
+        IN_FLIGHT.dec()
+        REQUESTS.labels(str(status)).inc()
+        REQUEST_SECONDS.observe(time.perf_counter() - trace.start_perf)
+    response.headers.update(_finish_trace(trace, timings, status, k, model))
+    return response
+
+
+def _finish_trace(
+    trace: tracing.RequestTrace,
+    timings: dict,
+    status: int,
+    k: int,
+    model: Optional[str],
+    error: Optional[BaseException] = None,
+) -> dict:
+    """Export the request if sampled and return its tracing response headers."""
+    total = time.perf_counter() - trace.start_perf
+    sampled = span_exporter.should_sample(trace, status)
+    if sampled:
+        attributes = {
+            "http.request.method": "POST",
+            "url.path": "/predict",
+            "batik.model": model or registry.default,
+            "batik.k": k,
+        }
+        if error is not None:
+            attributes["error.type"] = type(error).__name__
+        span_exporter.export(
+            trace,
+            "POST /predict",
+            timings,
+            PREDICT_STAGES,
+            total,
+            status,
+            attributes,
+        )
+    return {
+        "Server-Timing": tracing.server_timing(timings, SERVER_TIMING_GROUPS, total),
+        "X-Request-ID": trace.request_id,
+        "traceparent": trace.traceparent(sampled),
+    }
+
 
+async def _predict(file: UploadFile, k: int, model: Optional[str], timings: dict) -> Response:
+    if not file:
+        raise _reject(400, "bad_request", "File is required")
+    # Loading a cold model can take a while; keep it off the event loop.
+    started = time.perf_counter()
+    slot = await run_in_threadpool(_model_slot, model)
+    timings["resolve"] = time.perf_counter() - started
+    num_classes = len(slot.current.class_names)
+    if k > num_classes:
+        raise _reject(400, "bad_request", f"k must be between 1 and {num_classes}")
+
+    started = time.perf_counter()
     content = await file.read()
+    timings["read"] = time.perf_counter() - started
     if not content:
-        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+        raise _reject(400, "bad_request", "Uploaded file is empty")
 
+    started = time.perf_counter()
     try:
         image = Image.open(BytesIO(content))
     except Exception as exc:
-        raise HTTPException(status_code=400, detail="Unable to read image") from exc
+        raise _reject(400, "bad_image", "Unable to read image") from exc
+    timings["decode"] = time.perf_counter() - started
 
     try:
-        return run_inference(image)
+        # Off the event loop, so uploads keep streaming in while we infer
+        # and concurrent requests actually queue on the interpreter lock.
+        submitted = time.perf_counter()
+
+        def infer() -> dict:
+            timings["dispatch"] = time.perf_counter() - submitted
+            return run_inference(image, k, model, timings)
+
+        result = await run_in_threadpool(infer)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Inference failed: {exc}") from exc
 
+    started = time.perf_counter()
+    body = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    timings["serialize"] = time.perf_counter() - started
+
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+    return Response(body, media_type="application/json")
+
+
+@app.post("/embed")
+async def embed(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    classify: bool = Query(False, description="Also return the top k predictions, from the same invoke"),
+    k: int = Query(5, ge=1, description="Number of top predictions to return with classify"),
+    encoding: Literal["json", "base64"] = Query("json", description="Embeddings as number lists or base64 float16 bytes"),
+    model: Optional[str] = Query(None, description="Registry model name (default model if omitted)"),
+):
+    """Pooled backbone features of one or more images (the ``files`` field,
+    repeated), as float16, in upload order."""
+    trace = tracing.RequestTrace.from_headers(request.headers)
+    timings = {}
+    if len(files) > EMBED_MAX_FILES:
+        raise _reject(400, "bad_request", f"At most {EMBED_MAX_FILES} files per request")
+    started = time.perf_counter()
+    slot = await run_in_threadpool(_model_slot, model)
+    timings["resolve"] = time.perf_counter() - started
+    if not slot.current.backend.embedding_size:
+        raise _reject(
+            400,
+            "bad_request",
+            f"Model '{model or registry.default}' has no embeddings output; export it with training/export.py --embeddings",
+        )
+    num_classes = len(slot.current.class_names)
+    if classify and k > num_classes:
+        raise _reject(400, "bad_request", f"k must be between 1 and {num_classes}")
+
+    images = []
+    timings["read"] = timings["decode"] = 0.0
+    for upload in files:
+        started = time.perf_counter()
+        content = await upload.read()
+        timings["read"] += time.perf_counter() - started
+        if not content:
+            raise _reject(400, "bad_request", f"Uploaded file {upload.filename!r} is empty")
+        started = time.perf_counter()
+        try:
+            images.append(Image.open(BytesIO(content)))
+        except Exception as exc:
+            raise _reject(400, "bad_image", f"Unable to read image {upload.filename!r}") from exc
+        timings["decode"] += time.perf_counter() - started
+
+    try:
+        submitted = time.perf_counter()
+
+        def infer() -> dict:
+            timings["dispatch"] = time.perf_counter() - submitted
+            return run_embeddings(images, k if classify else 0, encoding, model, timings)
+
+        result = await run_in_threadpool(infer)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Inference failed: {exc}") from exc
+    result["results"] = [{"filename": upload.filename, **entry} for upload, entry in zip(files, result["results"])]
+
+    started = time.perf_counter()
+    body = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    timings["serialize"] = time.perf_counter() - started
+    total = time.perf_counter() - trace.start_perf
+    return Response(
+        body,
+        media_type="application/json",
+        headers={
+            "Server-Timing": tracing.server_timing(timings, SERVER_TIMING_GROUPS, total),
+            "X-Request-ID": trace.request_id,
+        },
+    )
+
+
+@app.post("/admin/reload", dependencies=[Depends(require_admin)])
+async def admin_reload(model: Optional[str] = None, allow_shape_change: bool = False):
+    """Load, warm and validate the model/label files on disk, then swap them in."""
+    slot = await run_in_threadpool(_model_slot, model)
+    try:
+        result = await run_in_threadpool(slot.reload, allow_shape_change)
+    except ReloadError as exc:
+        raise HTTPException(status_code=409, detail=f"Reload rejected: {exc}") from exc
+    return {"success": True, "reload": result, "model": slot.current.info()}
+
+
+@app.get("/admin/reload", dependencies=[Depends(require_admin)])
+async def admin_reload_status(model: Optional[str] = None):
+    slot = await run_in_threadpool(_model_slot, model)
+    return {"last_reload": slot.last_reload, "model": slot.current.info()}
+
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+async def admin_memory():
+    return {"success": True, **await run_in_threadpool(memory.summary)}
+
+
+@app.post("/admin/memory/tracemalloc", dependencies=[Depends(require_admin)])
+async def admin_tracemalloc_start(frames: int = Query(1, ge=1, le=50, description="Stack depth per allocation")):
+    """Start tracemalloc and take the baseline snapshot later diffs compare against."""
+    return {"success": True, "tracemalloc": await run_in_threadpool(memory.tracer.start, frames)}
+
+
+@app.get("/admin/memory/tracemalloc", dependencies=[Depends(require_admin)])
+async def admin_tracemalloc_diff(
+    top: int = Query(25, ge=1, le=500),
+    key: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    rebase: bool = Query(False, description="Make this snapshot the new baseline"),
+):
+    try:
+        diff = await run_in_threadpool(memory.tracer.diff, top, key, rebase)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    return {
+        "success": True,
+        "tracemalloc": memory.tracer.info(),
+        "rss_bytes": memory.rss_bytes(),
+        "diff": diff,
+    }
+
+
+@app.delete("/admin/memory/tracemalloc", dependencies=[Depends(require_admin)])
+async def admin_tracemalloc_stop():
+    return {"success": True, "tracemalloc": memory.tracer.stop()}
+
+
+@app.post("/admin/memory/trim", dependencies=[Depends(require_admin)])
+async def admin_malloc_trim():
+    """Hand free glibc heap back to the OS; a large drop means fragmentation, not a leak."""
+    released = await run_in_threadpool(memory.malloc_trim)
+    if released is None:
+        raise HTTPException(status_code=501, detail="malloc_trim is not available on this platform")
+    return {"success": True, "released_bytes": released, "rss_bytes": memory.rss_bytes()}
+
+
+_profile_lock = asyncio.Lock()
+
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def admin_profile(
+    seconds: float = Query(10.0, gt=0, le=PROFILE_MAX_SECONDS, description="How long to sample"),
+    interval_ms: float = Query(10.0, ge=1, le=1000, description="Time between samples"),
+    format: str = Query("collapsed", pattern="^(collapsed|json)$"),
+    idle: bool = Query(False, description="Also count threads parked in waits/selects"),
+):
+    """Sample every thread's stack for a while; returns collapsed stacks for a flame graph."""
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with _profile_lock:
+        # The sampler runs in its own thread; traffic keeps flowing meanwhile.
+        sampler = profiler.SamplingProfiler(interval_ms / 1000, include_idle=idle).start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await run_in_threadpool(sampler.stop)
+
+    if format == "json":
+        return {"success": True, **sampler.summary(), "stacks": dict(sampler.stacks.most_common())}
+    return Response(
+        sampler.collapsed(),
+        media_type="text/plain; charset=utf-8",
+        headers={"X-Profile-Samples": str(sampler.samples)},
+    )
+
 
 # For manual execution
 if __name__ == "__main__":
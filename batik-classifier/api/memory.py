@@ -0,0 +1,173 @@
+"""
+Process memory diagnostics: RSS, the C heap as glibc sees it, Python
+allocator blocks, open file descriptors, and tracemalloc snapshot diffs.
+
+Growth in RSS alone doesn't say who holds the memory. Comparing it with the
+glibc heap (Pillow and NumPy buffers are plain ``malloc``), the Python
+object allocator and the descriptor count (spooled uploads end up as temp
+files) narrows it down; a tracemalloc diff then names the allocating lines.
+"""
+import ctypes
+import ctypes.util
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import List, Optional
+
+
+class _MallInfo2(ctypes.Structure):
+    _fields_ = [
+        (name, ctypes.c_size_t)
+        for name in (
+            "arena", "ordblks", "smblks", "hblks", "hblkhd", "usmblks", "fsmblks", "uordblks", "fordblks", "keepcost",
+        )
+    ]
+
+
+def _load_libc():
+    name = ctypes.util.find_library("c")
+    if not name:
+        return None
+    try:
+        libc = ctypes.CDLL(name)
+        libc.mallinfo2.restype = _MallInfo2
+        libc.malloc_trim.argtypes = [ctypes.c_size_t]
+        return libc
+    except (OSError, AttributeError):
+        # Not glibc, or glibc older than 2.33 (no mallinfo2).
+        return None
+
+
+_libc = _load_libc()
+
+
+def malloc_stats() -> Optional[dict]:
+    """glibc heap usage: bytes handed out to the program vs. held free in arenas."""
+    if _libc is None:
+        return None
+    info = _libc.mallinfo2()
+    return {
+        "in_use_bytes": info.uordblks + info.hblkhd,
+        "free_bytes": info.fordblks,
+        "mmapped_bytes": info.hblkhd,
+        "arena_bytes": info.arena,
+    }
+
+
+def malloc_trim() -> Optional[int]:
+    """Return free heap pages to the OS; the RSS change (bytes) or None if unsupported."""
+    if _libc is None:
+        return None
+    before = rss_bytes() or 0
+    _libc.malloc_trim(0)
+    return before - (rss_bytes() or 0)
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process (Linux), or None."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def python_allocated_blocks() -> int:
+    return sys.getallocatedblocks()
+
+
+def open_fds() -> Optional[int]:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def summary() -> dict:
+    return {
+        "rss_bytes": rss_bytes(),
+        "malloc": malloc_stats(),
+        "python_allocated_blocks": python_allocated_blocks(),
+        "gc_objects": len(gc.get_objects()),
+        "gc_counts": gc.get_count(),
+        "open_fds": open_fds(),
+        "tracemalloc": tracer.info(),
+    }
+
+
+class SnapshotTracer:
+    """Start tracemalloc with a baseline snapshot, then diff the heap against it.
+
+    Tracing slows every allocation down noticeably, so it only runs between
+    ``start()`` and ``stop()``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.started_at: Optional[float] = None
+        self.frames = 0
+
+    def start(self, frames: int = 1) -> dict:
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            tracemalloc.start(frames)
+            self.frames = frames
+            self.started_at = time.time()
+            self.baseline = self._snapshot()
+        return self.info()
+
+    def stop(self) -> dict:
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self.baseline = None
+            self.started_at = None
+        return self.info()
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        gc.collect()
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def diff(self, top: int = 25, key: str = "lineno", rebase: bool = False) -> List[dict]:
+        """Largest size changes since the baseline, grouped by ``key``."""
+        with self._lock:
+            if self.baseline is None or not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc is not running; start it first")
+            current = self._snapshot()
+            stats = current.compare_to(self.baseline, key)
+            if rebase:
+                self.baseline = current
+        return [
+            {
+                "where": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "size_diff_bytes": stat.size_diff,
+                "size_bytes": stat.size,
+                "count_diff": stat.count_diff,
+                "count": stat.count,
+            }
+            for stat in stats[:top]
+        ]
+
+    def info(self) -> dict:
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": True,
+            "frames": self.frames,
+            "started_at": self.started_at,
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+        }
+
+
+tracer = SnapshotTracer()
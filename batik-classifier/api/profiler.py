@@ -0,0 +1,126 @@
+"""
+Statistical wall-clock profiler for a live server process.
+
+A background thread snapshots every thread's Python stack with
+``sys._current_frames()`` at a fixed interval and counts identical stacks.
+Time spent in C code (Pillow decode/resize, NumPy, the TFLite ``invoke``)
+is attributed to the Python frame that called into it, which is exactly
+where it shows up in the request path. Nothing is installed into the
+interpreter (no ``sys.setprofile``), so requests run at full speed; the cost
+is one stack walk per thread per sample.
+
+Output is collapsed stacks (``thread;frame;frame count`` per line), which
+flamegraph.pl, speedscope and inferno read directly.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+# Leaf frames of threads that are parked rather than working.
+IDLE_LEAVES = {
+    "threading.py:Condition.wait",
+    "threading.py:Thread._wait_for_tstate_lock",
+    "selectors.py:EpollSelector.select",
+    "selectors.py:PollSelector.select",
+    "selectors.py:KqueueSelector.select",
+    "selectors.py:SelectSelector.select",
+    "socket.py:socket.accept",
+}
+
+
+def _short_path(filename: str) -> str:
+    marker = "site-packages/"
+    index = filename.rfind(marker)
+    if index >= 0:
+        return filename[index + len(marker):]
+    return filename.rsplit("/", 1)[-1]
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self._labels: Dict[object, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = f"{_short_path(code.co_filename)}:{name}"
+            self._labels[code] = label
+        return label
+
+    def _sample(self, own_ident: int, thread_names: Dict[int, str]) -> None:
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            frames: List[str] = []
+            while frame is not None:
+                frames.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if not frames or (not self.include_idle and frames[0] in IDLE_LEAVES):
+                continue
+            frames.append(thread_names.get(ident, f"thread-{ident}"))
+            frames.reverse()
+            self.stacks[";".join(frames)] += 1
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        thread_names: Dict[int, str] = {}
+        next_tick = time.perf_counter()
+        while not self._stop.is_set():
+            if self.samples % 50 == 0:
+                # Thread pools grow and shrink; refresh names now and then.
+                thread_names = {t.ident: t.name.replace(";", ",") for t in threading.enumerate()}
+            self._sample(own_ident, thread_names)
+            self.samples += 1
+            next_tick += self.interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                next_tick = time.perf_counter()  # fell behind; don't burst to catch up
+
+    def start(self) -> "SamplingProfiler":
+        self.started_at = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 25) -> List[dict]:
+        """Frames ranked by samples in which they were the leaf (self time)."""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(self.stacks.values()) or 1
+        return [
+            {"frame": frame, "samples": count, "share": round(count / total, 4)}
+            for frame, count in leaves.most_common(limit)
+        ]
+
+    def summary(self) -> dict:
+        return {
+            "duration_s": round(self.duration, 3),
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "effective_hz": round(self.samples / self.duration, 1) if self.duration else None,
+            "stack_samples": sum(self.stacks.values()),
+            "unique_stacks": len(self.stacks),
+            "top_functions": self.top_functions(),
+        }
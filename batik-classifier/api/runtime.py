@@ -0,0 +1,109 @@
+"""
+TensorFlow Lite runtime selection.
+
+The serving apps only need a TFLite interpreter, and importing full TensorFlow
+for that costs seconds of cold start and hundreds of MB of RSS. This module
+prefers the standalone runtimes and only imports TensorFlow when nothing
+lighter is installed or a feature explicitly asks for it.
+
+Set ``BATIK_TFLITE_RUNTIME`` to ``ai_edge_litert``, ``tflite_runtime`` or
+``tensorflow`` to force a specific runtime.
+"""
+import importlib
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+# Lightest first. Each entry: (runtime name, module to import, attribute path).
+RUNTIME_CANDIDATES = (
+    ("ai_edge_litert", "ai_edge_litert.interpreter", "Interpreter"),
+    ("tflite_runtime", "tflite_runtime.interpreter", "Interpreter"),
+    ("tensorflow", "tensorflow", "lite.Interpreter"),
+)
+
+# Wall-clock seconds per startup phase, in the order they were recorded.
+STARTUP_TIMINGS: Dict[str, float] = {}
+
+_interpreter_class = None
+_runtime_name: Optional[str] = None
+_tensorflow = None
+
+
+def record_startup_phase(name: str, seconds: float) -> None:
+    STARTUP_TIMINGS[name] = STARTUP_TIMINGS.get(name, 0.0) + seconds
+
+
+@contextmanager
+def startup_phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_startup_phase(name, time.perf_counter() - started)
+
+
+def _resolve_attr(module, path: str):
+    for part in path.split("."):
+        module = getattr(module, part)
+    return module
+
+
+def get_interpreter_class():
+    """Return the ``Interpreter`` class of the lightest available runtime."""
+    global _interpreter_class, _runtime_name, _tensorflow
+    if _interpreter_class is not None:
+        return _interpreter_class
+
+    forced = os.environ.get("BATIK_TFLITE_RUNTIME", "").strip()
+    candidates = [c for c in RUNTIME_CANDIDATES if not forced or c[0] == forced]
+    if not candidates:
+        raise RuntimeError(f"Unknown BATIK_TFLITE_RUNTIME: {forced}")
+
+    errors = []
+    for name, module_name, attr in candidates:
+        try:
+            with startup_phase(f"import {name}"):
+                module = importlib.import_module(module_name)
+            _interpreter_class = _resolve_attr(module, attr)
+            _runtime_name = name
+            if name == "tensorflow":
+                _tensorflow = module
+            return _interpreter_class
+        except Exception as exc:
+            errors.append(f"{name}: {exc}")
+
+    raise RuntimeError("TensorFlow Lite interpreter is not available (" + "; ".join(errors) + ")")
+
+
+def runtime_name() -> Optional[str]:
+    return _runtime_name
+
+
+def load_tensorflow():
+    """Import full TensorFlow on demand, for features that really need it."""
+    global _tensorflow
+    if _tensorflow is None:
+        with startup_phase("import tensorflow"):
+            import tensorflow as tf
+        _tensorflow = tf
+    return _tensorflow
+
+
+def startup_report() -> dict:
+    return {
+        "runtime": _runtime_name,
+        "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in STARTUP_TIMINGS.items()},
+        "total_ms": round(sum(STARTUP_TIMINGS.values()) * 1000, 1),
+    }
+
+
+def format_startup_report() -> str:
+    report = startup_report()
+    lines = [f"Startup timing (runtime: {report['runtime'] or 'not loaded'})"]
+    for name, ms in report["phases_ms"].items():
+        lines.append(f"  {name:<32} {ms:>9.1f} ms")
+    lines.append(f"  {'total':<32} {report['total_ms']:>9.1f} ms")
+    return "\n".join(lines)
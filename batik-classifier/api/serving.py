@@ -0,0 +1,733 @@
+"""
+Inference core shared by the FastAPI server and offline tools: label and
+model loading, preprocessing, top-k post-processing and the model lifecycle
+(warm-up, hot reload with draining).
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from backends import InferenceBackend, _load_interpreter, _signature_io, load_backend, takes_pixels
+from memory import rss_bytes
+
+
+def _resolve_first_existing(paths: List[Path]) -> Path:
+    for path in paths:
+        if path.exists():
+            return path
+    raise FileNotFoundError("No valid file found in candidates: " + ", ".join(str(p) for p in paths))
+
+
+def _load_class_names(path: Path) -> List[str]:
+    with path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    if isinstance(data, dict) and "classes" in data:
+        return list(data["classes"])
+    if isinstance(data, dict):
+        try:
+            sorted_keys = sorted(data.keys(), key=lambda x: int(x))
+            return [data[k] for k in sorted_keys]
+        except ValueError:
+            return list(data.values())
+    if isinstance(data, list):
+        return data
+    raise ValueError("Unrecognized label file format")
+
+
+def _center_square(image: Image.Image) -> Image.Image:
+    width, height = image.size
+    min_side = min(width, height)
+    left = (width - min_side) // 2
+    top = (height - min_side) // 2
+    return image.crop((left, top, left + min_side, top + min_side))
+
+
+def resize_for_model(image: Image.Image, target_size: Tuple[int, int] = (224, 224)) -> np.ndarray:
+    """The pixels ``preprocess_image`` feeds the model, before normalization:
+    upright, RGB, center-cropped and resized, as uint8 (height, width, 3).
+
+    Offline tools ship these between processes and normalize whole batches
+    with ``normalize_batch``; the result is identical to ``preprocess_image``.
+    """
+    image = ImageOps.exif_transpose(image) or image
+    resized = _center_square(image.convert("RGB")).resize(target_size, Image.Resampling.BILINEAR)
+    return np.asarray(resized, dtype=np.uint8)
+
+
+def normalize_batch(pixels: np.ndarray) -> np.ndarray:
+    """uint8 pixels, (H, W, 3) or (N, H, W, 3), to the model's [-1, 1] float32 batch."""
+    arr = pixels.astype(np.float32) / 127.5 - 1.0
+    return arr if arr.ndim == 4 else arr[np.newaxis]
+
+
+def preprocess_image(image: Image.Image, target_size: Tuple[int, int] = (224, 224)) -> np.ndarray:
+    # Handle EXIF orientation (important for mobile photos)
+    image = ImageOps.exif_transpose(image) or image
+    rgb_image = image.convert("RGB")
+
+    # CENTER CROP to square (prevent distortion from different aspect ratios)
+    rgb_image = _center_square(rgb_image)
+
+    # Use BILINEAR resampling for consistency with training (Google Colab default)
+    resized = rgb_image.resize(target_size, Image.Resampling.BILINEAR)
+    arr = np.array(resized, dtype=np.float32)
+    arr = arr / 127.5 - 1.0
+
+    return np.expand_dims(arr, axis=0)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores along the last axis, best first.
+
+    Works on a single row of logits or a whole (batch, classes) array. Uses
+    ``np.argpartition`` so only the k winners are sorted. That order is only
+    unique without ties, so rows with a tie among or across the k winners
+    (rare with softmax outputs) use the previous ``np.argsort(row)[-k:][::-1]``
+    and come out exactly as before.
+    """
+    scores = np.asarray(scores)
+    num_classes = scores.shape[-1]
+    if not 1 <= k <= num_classes:
+        raise ValueError(f"k must be between 1 and {num_classes}, got {k}")
+
+    if k == num_classes:
+        candidates = np.broadcast_to(np.arange(num_classes), scores.shape)
+    else:
+        candidates = np.argpartition(scores, num_classes - k, axis=-1)[..., num_classes - k:]
+    values = np.take_along_axis(scores, candidates, axis=-1)
+    order = np.argsort(-values.astype(np.float64), axis=-1)
+    top = np.take_along_axis(candidates, order, axis=-1)
+
+    # A tie straddling the k-th place, or one among the winners.
+    ranked = np.take_along_axis(values, order, axis=-1)
+    tied = (scores == ranked[..., -1:]).sum(axis=-1) > 1
+    if k > 1:
+        tied |= (ranked[..., 1:] == ranked[..., :-1]).any(axis=-1)
+    if np.any(tied):
+        top = np.array(top)
+        for index in map(tuple, np.argwhere(tied)):
+            top[index] = np.argsort(scores[index])[-k:][::-1]
+    return top
+
+
+def _file_fingerprint(*paths: Path) -> tuple:
+    fingerprint = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            fingerprint.append((str(path), st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            fingerprint.append((str(path), None, None))
+    return tuple(fingerprint)
+
+
+class LoadedModel:
+    """One inference backend plus the labels it was validated against."""
+
+    def __init__(
+        self,
+        model_path: Path,
+        label_path: Path,
+        version: int = 1,
+        backend: str = "auto",
+        input_scale: Optional[str] = None,
+    ):
+        self.model_path = Path(model_path)
+        self.label_path = Path(label_path)
+        self.version = version
+        self.fingerprint = _file_fingerprint(self.model_path, self.label_path)
+        self.class_names = _load_class_names(self.label_path)
+        rss_before = rss_bytes()
+        self.backend: InferenceBackend = load_backend(backend, self.model_path, input_scale)
+        rss_after = rss_bytes()
+        self.rss_delta_bytes = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        self.memory_bytes = self.backend.memory_bytes
+        self.takes_pixels = self.backend.takes_pixels
+        self.loaded_at = time.time()
+        self.warmup_ms: List[float] = []
+
+        # Backends are not thread-safe; one call at a time
+        self.lock = threading.Lock()
+        self._inflight = 0
+        self._idle = threading.Condition()
+
+        # Derive target size from model input (height, width)
+        shape = self.backend.input_shape
+        if len(shape) >= 3:
+            self.target_size = (int(shape[2]), int(shape[1]))
+        else:
+            self.target_size = (224, 224)
+
+        num_outputs = int(self.backend.output_shape[-1])
+        if num_outputs != len(self.class_names):
+            raise ValueError(
+                f"{self.model_path.name} has {num_outputs} outputs but "
+                f"{self.label_path.name} lists {len(self.class_names)} classes"
+            )
+
+    @property
+    def input_shape(self) -> List[int]:
+        return list(self.backend.input_shape)
+
+    @property
+    def output_shape(self) -> List[int]:
+        return list(self.backend.output_shape)
+
+    def signature(self) -> tuple:
+        return (
+            tuple(self.input_shape),
+            self.backend.input_dtype.name,
+            tuple(self.output_shape),
+        )
+
+    def preprocess(self, image: Image.Image) -> np.ndarray:
+        """The input batch for one image: bare uint8 pixels if the model does
+        its own normalization, else ``preprocess_image``'s floats."""
+        if self.takes_pixels:
+            return resize_for_model(image, self.target_size)[np.newaxis]
+        return preprocess_image(image, self.target_size)
+
+    def predict(self, input_data: np.ndarray, timings: Optional[dict] = None) -> np.ndarray:
+        """Run one invoke. If ``timings`` is given, seconds spent waiting for
+        the backend lock and inside the invoke are stored in it."""
+        started = time.perf_counter()
+        with self.lock:
+            acquired = time.perf_counter()
+            output = self.backend.predict(input_data)
+        if timings is not None:
+            timings["lock_wait"] = acquired - started
+            timings["invoke"] = time.perf_counter() - acquired
+        return output
+
+    def embed(self, input_data: np.ndarray, timings: Optional[dict] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(scores, float32 embeddings) for a batch, from the same invokes;
+        ``timings`` as in ``predict``."""
+        if not self.backend.embedding_size:
+            raise ValueError(f"{self.model_path.name} has no embeddings output")
+        started = time.perf_counter()
+        with self.lock:
+            acquired = time.perf_counter()
+            scores, embeddings = self.backend.predict_with_embeddings(input_data)
+        if timings is not None:
+            timings["lock_wait"] = acquired - started
+            timings["invoke"] = time.perf_counter() - acquired
+        return scores, embeddings
+
+    def warm_up(self, runs: int) -> List[float]:
+        """Invoke on synthetic input so arena allocation, delegate setup and
+        model page-faults happen before real traffic. Returns per-run ms."""
+        data = self.backend.synthetic_input()
+        latencies = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            with self.lock:
+                self.backend.predict(data)
+            latencies.append((time.perf_counter() - started) * 1000)
+        self.warmup_ms = latencies
+        return latencies
+
+    def _enter(self) -> None:
+        with self._idle:
+            self._inflight += 1
+
+    def _exit(self) -> None:
+        with self._idle:
+            self._inflight -= 1
+            if self._inflight == 0:
+                self._idle.notify_all()
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        with self._idle:
+            return self._idle.wait_for(lambda: self._inflight == 0, timeout=timeout)
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "model_path": self.model_path.name,
+            "labels_path": self.label_path.name,
+            "classes_loaded": len(self.class_names),
+            **self.backend.describe(),
+            "input_shape": self.input_shape,
+            "input_dtype": self.backend.input_dtype.name,
+            "output_shape": self.output_shape,
+            "memory_bytes": self.memory_bytes,
+            "rss_delta_bytes": self.rss_delta_bytes,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class BatchPredictor:
+    """A private interpreter resized to a fixed batch size, for offline tools.
+
+    Models whose batch dimension can't be resized run one invoke per image.
+    """
+
+    def __init__(self, model_path: Path, batch_size: int = 32, num_threads: Optional[int] = None):
+        self.model_path = Path(model_path)
+        self.interpreter = _load_interpreter(self.model_path, num_threads)
+        detail, output = _signature_io(self.interpreter)
+        self.input_index = detail["index"]
+        self.output_index = output["index"]
+        self.takes_pixels = takes_pixels(detail)
+        shape = [int(d) for d in detail["shape"]]
+        self.target_size = (shape[2], shape[1])
+        self.batch_size = 1
+        if batch_size > 1:
+            try:
+                self.interpreter.resize_tensor_input(self.input_index, [batch_size] + shape[1:])
+                self.interpreter.allocate_tensors()
+                self.batch_size = batch_size
+            except Exception as exc:
+                print(f"Batch size {batch_size} not supported by {self.model_path.name}, using 1: {exc}")
+                self.interpreter.resize_tensor_input(self.input_index, shape)
+                self.interpreter.allocate_tensors()
+        self.num_classes = int(output["shape"][-1])
+
+    def prepare(self, pixels: np.ndarray) -> np.ndarray:
+        """``resize_for_model`` pixels, (N, H, W, 3) uint8, as this model takes them."""
+        return pixels if self.takes_pixels else normalize_batch(pixels)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """Scores for a (N, H, W, 3) batch of any N, already ``prepare``d."""
+        outputs = []
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            count = len(chunk)
+            if count < self.batch_size:
+                # The last partial batch is padded; its padding rows are dropped.
+                padded = np.zeros((self.batch_size,) + chunk.shape[1:], dtype=chunk.dtype)
+                padded[:count] = chunk
+                chunk = padded
+            self.interpreter.set_tensor(self.input_index, chunk)
+            self.interpreter.invoke()
+            outputs.append(self.interpreter.get_tensor(self.output_index)[:count].copy())
+        if not outputs:
+            return np.zeros((0, self.num_classes), dtype=np.float32)
+        return np.concatenate(outputs)
+
+
+class ReloadError(Exception):
+    """A candidate model was rejected; the current model keeps serving."""
+
+
+class ModelSlot:
+    """Holds the model that new requests get, and swaps it without downtime.
+
+    Requests enter through ``acquire()``, which pins the current model until
+    the request finishes. ``reload()`` builds and warms the replacement
+    off to the side, checks it against the current one, swaps the reference
+    under a short lock and then waits for the old model's in-flight requests
+    to drain before letting it go.
+    """
+
+    def __init__(
+        self,
+        resolve_paths: Callable[[], Tuple[Path, Path]],
+        warmup_runs: int = 0,
+        drain_timeout: float = 60.0,
+        backend: str = "auto",
+        input_scale: Optional[str] = None,
+    ):
+        self._resolve_paths = resolve_paths
+        self.backend = backend
+        self.input_scale = input_scale
+        self.warmup_runs = warmup_runs
+        self.drain_timeout = drain_timeout
+        self._swap_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._current: Optional[LoadedModel] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.last_reload: dict = {"state": "never"}
+
+    def load(self) -> LoadedModel:
+        """Initial load; warm-up is left to the caller."""
+        model_path, label_path = self._resolve_paths()
+        model = LoadedModel(model_path, label_path, backend=self.backend, input_scale=self.input_scale)
+        with self._swap_lock:
+            self._current = model
+        return model
+
+    @property
+    def current(self) -> LoadedModel:
+        if self._current is None:
+            raise RuntimeError("No model loaded")
+        return self._current
+
+    def _pin(self) -> LoadedModel:
+        with self._swap_lock:
+            model = self.current
+            model._enter()
+        return model
+
+    @contextmanager
+    def acquire(self):
+        model = self._pin()
+        try:
+            yield model
+        finally:
+            model._exit()
+
+    def reload(self, allow_shape_change: bool = False) -> dict:
+        """Load, warm and validate a new model, then swap it in."""
+        with self._reload_lock:
+            started = time.perf_counter()
+            old = self.current
+            try:
+                model_path, label_path = self._resolve_paths()
+                candidate = LoadedModel(
+                    model_path, label_path, version=old.version + 1, backend=self.backend, input_scale=self.input_scale
+                )
+                if not allow_shape_change and candidate.signature() != old.signature():
+                    raise ReloadError(
+                        f"Model signature changed from {old.signature()} to {candidate.signature()}"
+                    )
+                candidate.warm_up(max(self.warmup_runs, 1))
+            except Exception as exc:
+                self.last_reload = {"state": "rejected", "error": str(exc), "at": time.time()}
+                print(f"Reload rejected, keeping version {old.version}: {exc}")
+                if isinstance(exc, ReloadError):
+                    raise
+                raise ReloadError(str(exc)) from exc
+
+            with self._swap_lock:
+                self._current = candidate
+            swapped_ms = (time.perf_counter() - started) * 1000
+
+            drained = old.wait_idle(timeout=self.drain_timeout)
+            self.last_reload = {
+                "state": "swapped",
+                "from_version": old.version,
+                "to_version": candidate.version,
+                "load_and_warm_ms": round(swapped_ms, 2),
+                "drained": drained,
+                "at": time.time(),
+            }
+            print(f"Model reloaded: {self.last_reload}")
+            return self.last_reload
+
+    def _watch(self, interval: float) -> None:
+        pending = rejected = None
+        while not self._stop.wait(interval):
+            try:
+                model_path, label_path = self._resolve_paths()
+            except FileNotFoundError:
+                continue
+            fingerprint = _file_fingerprint(model_path, label_path)
+            if fingerprint in (self.current.fingerprint, rejected):
+                pending = None
+                continue
+            # Only reload once the files have stopped changing between polls,
+            # so a half-copied model is never picked up.
+            if fingerprint != pending:
+                pending = fingerprint
+                continue
+            pending = None
+            try:
+                self.reload()
+            except ReloadError:
+                # Don't retry the same rejected files on every poll.
+                rejected = fingerprint
+
+    def start_watcher(self, interval: float) -> None:
+        if interval <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+
+class UnknownModelError(KeyError):
+    """The requested model name is not in the registry."""
+
+
+class ModelBudgetError(RuntimeError):
+    """A model can't be loaded without exceeding the memory budget."""
+
+
+PathCandidates = Union[str, Path, Sequence[Union[str, Path]]]
+
+
+class ModelSpec:
+    """Where a registered model's model and label files live, which
+    inference backend runs it and, for Keras models, their input scaling
+    (see ``backends.py``)."""
+
+    def __init__(
+        self,
+        name: str,
+        model: PathCandidates,
+        labels: PathCandidates,
+        base_dir: Path = Path("."),
+        backend: str = "auto",
+        input_scale: Optional[str] = None,
+    ):
+        self.name = name
+        self.model_candidates = self._as_paths(model, base_dir)
+        self.label_candidates = self._as_paths(labels, base_dir)
+        self.backend = backend
+        self.input_scale = input_scale
+
+    @staticmethod
+    def _as_paths(value: PathCandidates, base_dir: Path) -> List[Path]:
+        values = [value] if isinstance(value, (str, Path)) else list(value)
+        return [Path(v) if Path(v).is_absolute() else Path(base_dir) / v for v in values]
+
+    def resolve(self) -> Tuple[Path, Path]:
+        return _resolve_first_existing(self.model_candidates), _resolve_first_existing(self.label_candidates)
+
+    def available(self) -> bool:
+        return any(p.exists() for p in self.model_candidates) and any(p.exists() for p in self.label_candidates)
+
+
+def load_registry_specs(
+    path: Path, backend: str = "auto", input_scale: Optional[str] = None
+) -> Tuple[List[ModelSpec], Optional[str]]:
+    """Read a registry file::
+
+        {"default": "mobilenetv2",
+         "models": {"mobilenetv2": {"model": "batik_model.tflite", "labels": "batik_labels_v2.json"}}}
+
+    ``model``/``labels`` may be a path or a list of candidate paths, relative
+    to the registry file. An entry's optional ``backend`` and ``input_scale``
+    override the arguments of the same name.
+    """
+    with Path(path).open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    base_dir = Path(path).parent
+    specs = [
+        ModelSpec(
+            name,
+            entry["model"],
+            entry["labels"],
+            base_dir,
+            entry.get("backend", backend),
+            entry.get("input_scale", input_scale),
+        )
+        for name, entry in data["models"].items()
+    ]
+    return specs, data.get("default")
+
+
+class ModelStats:
+    """Per-model request counters; survive the model being unloaded."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.loads = 0
+        self.unloads = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_load_ms: Optional[float] = None
+        self.last_used: Optional[float] = None
+
+    def record(self, elapsed_ms: float, ok: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.errors += 0 if ok else 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self.last_used = time.time()
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "mean_ms": round(self.total_ms / self.requests, 3) if self.requests else None,
+                "max_ms": round(self.max_ms, 3),
+                "loads": self.loads,
+                "unloads": self.unloads,
+                "last_load_ms": self.last_load_ms,
+                "last_used": self.last_used,
+            }
+
+
+class _Entry:
+    def __init__(self, spec: ModelSpec):
+        self.spec = spec
+        self.slot: Optional[ModelSlot] = None
+        self.stats = ModelStats()
+        self.load_lock = threading.Lock()
+
+
+class ModelRegistry:
+    """Serves several models from one process.
+
+    Models load on first use, are warmed before they take traffic, and are
+    unloaded least-recently-used first whenever the loaded set would exceed
+    ``memory_budget_bytes`` (0 means unlimited). Models with requests in
+    flight and the pinned default model are never unloaded.
+    """
+
+    def __init__(
+        self,
+        specs: Sequence[ModelSpec],
+        default: Optional[str] = None,
+        memory_budget_bytes: int = 0,
+        warmup_runs: int = 0,
+        reload_poll_seconds: float = 0.0,
+    ):
+        if not specs:
+            raise ValueError("Model registry needs at least one model")
+        self._entries: Dict[str, _Entry] = {spec.name: _Entry(spec) for spec in specs}
+        self.default = default or specs[0].name
+        if self.default not in self._entries:
+            raise UnknownModelError(self.default)
+        self.memory_budget_bytes = memory_budget_bytes
+        self.warmup_runs = warmup_runs
+        self.reload_poll_seconds = reload_poll_seconds
+        self._lock = threading.Lock()
+        # Loaded model names, least recently used first.
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def _entry(self, name: Optional[str]) -> _Entry:
+        try:
+            return self._entries[name or self.default]
+        except KeyError:
+            raise UnknownModelError(name) from None
+
+    def loaded_bytes(self) -> int:
+        with self._lock:
+            return sum(self._entries[n].slot.current.memory_bytes for n in self._lru)
+
+    def _evict_for(self, needed: int, keep: str) -> List[ModelSlot]:
+        """Unload idle models, LRU first, until ``needed`` more bytes fit.
+
+        Caller holds ``self._lock``. Returns the unloaded slots, whose
+        watchers the caller stops once the lock is released: stopping one
+        waits for a reload in progress, which must not hold up requests.
+        """
+        evicted: List[ModelSlot] = []
+        if not self.memory_budget_bytes:
+            return evicted
+        used = sum(self._entries[n].slot.current.memory_bytes for n in self._lru)
+        for name in list(self._lru):
+            if used + needed <= self.memory_budget_bytes:
+                break
+            if name in (keep, self.default):
+                continue
+            entry = self._entries[name]
+            model = entry.slot.current
+            if model.inflight:
+                continue
+            evicted.append(entry.slot)
+            entry.slot = None
+            entry.stats.unloads += 1
+            del self._lru[name]
+            used -= model.memory_bytes
+            print(f"Unloaded model '{name}' to stay within the memory budget")
+        return evicted
+
+    def slot(self, name: Optional[str] = None, load: bool = True, warm: bool = True) -> Optional[ModelSlot]:
+        """The model's slot, loading (and, unless ``warm`` is False, warming)
+        it first if needed."""
+        entry = self._entry(name)
+        if entry.slot is not None or not load:
+            return entry.slot
+        with entry.load_lock:
+            if entry.slot is not None:
+                return entry.slot
+            spec = entry.spec
+            model_path, _ = spec.resolve()
+            with self._lock:
+                evicted = self._evict_for(model_path.stat().st_size, keep=spec.name)
+            for old in evicted:
+                old.stop_watcher()
+
+            started = time.perf_counter()
+            slot = ModelSlot(spec.resolve, warmup_runs=self.warmup_runs, backend=spec.backend, input_scale=spec.input_scale)
+            model = slot.load()
+            if warm and self.warmup_runs:
+                model.warm_up(self.warmup_runs)
+
+            evicted = []
+            try:
+                with self._lock:
+                    evicted = self._evict_for(model.memory_bytes, keep=spec.name)
+                    used = sum(self._entries[n].slot.current.memory_bytes for n in self._lru)
+                    if self.memory_budget_bytes and used + model.memory_bytes > self.memory_budget_bytes and self._lru:
+                        raise ModelBudgetError(
+                            f"Loading '{spec.name}' ({model.memory_bytes} bytes) would exceed the "
+                            f"{self.memory_budget_bytes}-byte budget; {used} bytes are held by busy or pinned models"
+                        )
+                    entry.slot = slot
+                    self._lru[spec.name] = None
+                    entry.stats.loads += 1
+                    entry.stats.last_load_ms = round((time.perf_counter() - started) * 1000, 2)
+            finally:
+                for old in evicted:
+                    old.stop_watcher()
+            slot.start_watcher(self.reload_poll_seconds)
+            return slot
+
+    @contextmanager
+    def acquire(self, name: Optional[str] = None):
+        """Pin the named (or default) model for one request and time it."""
+        entry = self._entry(name)
+        while True:
+            slot = self.slot(name)
+            with self._lock:
+                # Re-check under the lock: eviction may have raced us.
+                if entry.slot is slot:
+                    model = slot._pin()
+                    self._lru.move_to_end(entry.spec.name)
+                    break
+
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield model
+            ok = True
+        finally:
+            model._exit()
+            entry.stats.record((time.perf_counter() - started) * 1000, ok)
+
+    def loaded(self) -> List[Tuple[str, ModelSlot]]:
+        with self._lock:
+            return [(n, self._entries[n].slot) for n in self._lru]
+
+    def stop(self) -> None:
+        for _, slot in self.loaded():
+            slot.stop_watcher()
+
+    def describe(self) -> List[dict]:
+        with self._lock:
+            loaded = set(self._lru)
+        result = []
+        for name, entry in self._entries.items():
+            slot = entry.slot if name in loaded else None
+            result.append({
+                "name": name,
+                "default": name == self.default,
+                "available": entry.spec.available(),
+                "loaded": slot is not None,
+                "model": slot.current.info() if slot is not None else None,
+                "inflight": slot.current.inflight if slot is not None else 0,
+                "stats": entry.stats.as_dict(),
+            })
+        return result
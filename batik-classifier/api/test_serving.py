@@ -0,0 +1,274 @@
+"""
+Tests for serving.py: top-k post-processing, preprocessing and the model
+registry and hot reload (on a fake backend, so no model file is needed).
+Run from this directory: ``python -m pytest test_serving.py``.
+"""
+import json
+import threading
+import time
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import serving
+from backends import InferenceBackend
+from serving import (
+    ModelBudgetError,
+    ModelRegistry,
+    ModelSlot,
+    ModelSpec,
+    ReloadError,
+    normalize_batch,
+    preprocess_image,
+    resize_for_model,
+    top_k_indices,
+)
+
+
+def _previous_top_k(row: np.ndarray, k: int) -> np.ndarray:
+    # What run_inference used before top_k_indices existed.
+    return np.argsort(row)[-k:][::-1]
+
+
+def test_top_k_matches_previous_order_with_ties():
+    rng = np.random.default_rng(0)
+    for _ in range(5000):
+        row = (rng.integers(0, 4, 38) * rng.choice([1.0, 0.25])).astype(np.float32)
+        k = int(rng.integers(1, 39))
+        np.testing.assert_array_equal(top_k_indices(row, k), _previous_top_k(row, k))
+
+
+def test_top_k_matches_previous_order_without_ties():
+    rng = np.random.default_rng(1)
+    for _ in range(1000):
+        row = rng.random(38).astype(np.float32)
+        k = int(rng.integers(1, 39))
+        np.testing.assert_array_equal(top_k_indices(row, k), _previous_top_k(row, k))
+
+
+def test_top_k_batch_matches_rows():
+    rng = np.random.default_rng(2)
+    batch = rng.integers(0, 5, (64, 38)).astype(np.float32)
+    expected = np.stack([_previous_top_k(row, 5) for row in batch])
+    np.testing.assert_array_equal(top_k_indices(batch, 5), expected)
+
+
+@pytest.mark.parametrize("k", [0, 39])
+def test_top_k_rejects_out_of_range_k(k):
+    with pytest.raises(ValueError):
+        top_k_indices(np.zeros(38, np.float32), k)
+
+
+def _photo(size, mode="RGB", orientation=None) -> Image.Image:
+    pixels = np.random.default_rng(sum(size)).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    image = Image.fromarray(pixels).convert(mode)
+    if orientation is None:
+        return image
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", exif=exif)
+    return Image.open(BytesIO(buffer.getvalue()))
+
+
+@pytest.mark.parametrize(
+    "image",
+    [_photo((640, 480)), _photo((300, 500), "RGBA"), _photo((257, 256), "L"), _photo((640, 480), orientation=6)],
+)
+def test_resize_then_normalize_is_identical_to_preprocess_image(image):
+    pixels = resize_for_model(image, (224, 224))
+    assert pixels.dtype == np.uint8 and pixels.shape == (224, 224, 3)
+    np.testing.assert_array_equal(normalize_batch(pixels), preprocess_image(image, (224, 224)))
+    np.testing.assert_array_equal(normalize_batch(pixels[np.newaxis]), preprocess_image(image, (224, 224)))
+
+
+class _FakeBackend(InferenceBackend):
+    """Stands in for an interpreter; its memory is the model file's size."""
+
+    name = "fake"
+
+    def __init__(self, model_path, outputs=3):
+        self.input_shape = [1, 8, 8, 3]
+        self.input_dtype = np.dtype(np.float32)
+        self.output_shape = [1, outputs]
+        self.takes_pixels = False
+        self.memory_bytes = model_path.stat().st_size
+
+    def predict(self, batch):
+        return np.zeros((len(batch), self.output_shape[-1]), np.float32)
+
+
+@pytest.fixture
+def make_registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(serving, "load_backend", lambda name, path, input_scale=None: _FakeBackend(path))
+    labels = tmp_path / "labels.json"
+    labels.write_text(json.dumps(["a", "b", "c"]))
+
+    def make(budget: int, **sizes):
+        specs = []
+        for name, size in sizes.items():
+            model = tmp_path / f"{name}.tflite"
+            model.write_bytes(b"\0" * size)
+            specs.append(ModelSpec(name, model, labels))
+        return ModelRegistry(specs, default=specs[0].name, memory_budget_bytes=budget)
+
+    return make
+
+
+def _loaded(registry):
+    return [name for name, _ in registry.loaded()]
+
+
+def test_registry_unloads_least_recently_used_first(make_registry):
+    registry = make_registry(300, main=100, b=100, c=100, d=100)
+    for name in ("main", "b", "c"):
+        registry.slot(name)
+    with registry.acquire("b"):
+        pass
+    registry.slot("d")
+    assert _loaded(registry) == ["main", "b", "d"]
+    assert registry.loaded_bytes() == 300
+    assert {entry["name"]: entry["stats"]["unloads"] for entry in registry.describe()}["c"] == 1
+
+
+def test_registry_never_unloads_the_default_model(make_registry):
+    registry = make_registry(200, main=100, b=100, c=100)
+    registry.slot("main")
+    registry.slot("b")
+    with registry.acquire("c"):
+        pass
+    assert _loaded(registry) == ["main", "c"]
+
+
+def test_registry_keeps_busy_models_and_refuses_past_budget(make_registry):
+    registry = make_registry(200, main=100, b=100, c=100)
+    registry.slot("main")
+    with registry.acquire("b"):
+        with pytest.raises(ModelBudgetError):
+            registry.slot("c")
+    assert _loaded(registry) == ["main", "b"]
+
+
+def test_registry_without_budget_keeps_everything(make_registry):
+    registry = make_registry(0, main=100, b=100, c=100)
+    for name in ("main", "b", "c"):
+        registry.slot(name)
+    assert _loaded(registry) == ["main", "b", "c"]
+
+
+def test_registry_stops_evicted_watchers_outside_its_lock(make_registry, monkeypatch):
+    registry = make_registry(200, main=100, b=100, c=100)
+    registry.slot("main")
+    registry.slot("b")
+    stopped = []
+    monkeypatch.setattr(serving.ModelSlot, "stop_watcher", lambda slot: stopped.append(registry._lock.locked()))
+    registry.slot("c")
+    assert stopped == [False]
+    assert _loaded(registry) == ["main", "c"]
+
+
+@pytest.fixture
+def slot_files(tmp_path, monkeypatch):
+    """(model, labels, outputs) for a ModelSlot on the fake backend; setting
+    ``outputs["width"]`` changes what the next load reports."""
+    outputs = {"width": 3}
+    monkeypatch.setattr(
+        serving, "load_backend", lambda name, path, input_scale=None: _FakeBackend(path, outputs["width"])
+    )
+    model = tmp_path / "model.tflite"
+    model.write_bytes(b"\0" * 100)
+    labels = tmp_path / "labels.json"
+    labels.write_text(json.dumps(["a", "b", "c"]))
+    return model, labels, outputs
+
+
+def _slot(model, labels, **kwargs) -> ModelSlot:
+    slot = ModelSlot(lambda: (model, labels), **kwargs)
+    slot.load()
+    return slot
+
+
+def test_reload_lets_pinned_requests_finish_on_the_old_model(slot_files):
+    slot = _slot(*slot_files[:2], drain_timeout=10)
+    with slot.acquire() as old:
+        reloading = threading.Thread(target=slot.reload)
+        reloading.start()
+        deadline = time.monotonic() + 10
+        while slot.current is old and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with slot.acquire() as new:
+            assert (old.version, new.version) == (1, 2)
+        # The reload is waiting for this request to drain.
+        time.sleep(0.05)
+        assert reloading.is_alive()
+        assert old.predict(np.zeros((1, 8, 8, 3), np.float32)).shape == (1, 3)
+    reloading.join(timeout=10)
+    assert not reloading.is_alive()
+    assert slot.last_reload["state"] == "swapped" and slot.last_reload["drained"]
+    assert old.inflight == 0 and slot.current.version == 2
+
+
+@pytest.mark.parametrize("labels, width", [(["a", "b", "c", "d"], 3), (["a", "b", "c"], 4), (["a", "b", "c", "d"], 4)])
+def test_reload_rejects_mismatched_models_and_keeps_serving(slot_files, labels, width):
+    model, label_path, outputs = slot_files
+    slot = _slot(model, label_path)
+    old = slot.current
+    label_path.write_text(json.dumps(labels))
+    outputs["width"] = width
+    with pytest.raises(ReloadError):
+        slot.reload()
+    assert slot.current is old and slot.last_reload["state"] == "rejected"
+    with slot.acquire() as serving_model:
+        assert serving_model is old and serving_model.predict(np.zeros((1, 8, 8, 3), np.float32)).shape == (1, 3)
+
+
+class _Polls:
+    """Stands in for the watcher's stop event: each ``wait`` is one poll,
+    running the next scripted step first; stops after the last one."""
+
+    def __init__(self, *steps):
+        self.steps = list(steps)
+
+    def wait(self, interval):
+        if not self.steps:
+            return True
+        self.steps.pop(0)()
+        return False
+
+
+def test_watcher_waits_until_files_stop_changing(slot_files, monkeypatch):
+    model, labels, _ = slot_files
+    slot = _slot(model, labels)
+    reloads = []
+    original_reload = slot.reload
+    monkeypatch.setattr(slot, "reload", lambda: reloads.append(slot.current.version) or original_reload())
+
+    def grow():
+        # A copy in progress: the file changes before every poll.
+        assert not reloads
+        with model.open("ab") as f:
+            f.write(b"\0")
+
+    def reloaded(count):
+        def check():
+            assert len(reloads) == count
+        return check
+
+    # The first poll that sees the same files as the one before reloads.
+    slot._stop = _Polls(grow, grow, grow, reloaded(0), reloaded(1), reloaded(1))
+    slot._watch(0)
+    assert reloads == [1] and slot.current.version == 2
+
+
+def test_watcher_does_not_retry_rejected_files(slot_files, monkeypatch):
+    model, labels, outputs = slot_files
+    slot = _slot(model, labels)
+    outputs["width"] = 4
+    attempts = []
+    original_reload = slot.reload
+    monkeypatch.setattr(slot, "reload", lambda: attempts.append(1) or original_reload())
+    slot._stop = _Polls(lambda: model.write_bytes(b"\0" * 200), *([lambda: None] * 5))
+    slot._watch(0)
+    assert len(attempts) == 1 and slot.current.version == 1
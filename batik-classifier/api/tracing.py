@@ -0,0 +1,212 @@
+"""
+Per-request tracing for /predict.
+
+Every response carries a ``Server-Timing`` header with the stage durations
+and an ``X-Request-ID`` (the client's own, if it sent one). A sample of
+requests is also exported as spans in the OTLP/JSON encoding, one
+``ExportTraceServiceRequest`` per line, to a size-rotated local file; the
+OpenTelemetry Collector's ``otlpjsonfile`` receiver reads that format as is.
+
+A W3C ``traceparent`` header from the client is honoured: its trace ID is
+reused, and its sampled flag forces the request into the export. Failed
+requests (status >= 500) are always exported.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class RequestTrace:
+    """Identity and start time of one traced request."""
+
+    __slots__ = ("request_id", "trace_id", "parent_span_id", "span_id", "forced", "start_ns", "start_perf")
+
+    def __init__(self, request_id: str, trace_id: str, parent_span_id: str = "", forced: bool = False):
+        self.request_id = request_id
+        self.trace_id = trace_id
+        self.parent_span_id = parent_span_id
+        self.span_id = os.urandom(8).hex()
+        self.forced = forced
+        self.start_ns = time.time_ns()
+        self.start_perf = time.perf_counter()
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str]) -> "RequestTrace":
+        request_id = headers.get("x-request-id", "")
+        if not _REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        match = _TRACEPARENT.match(headers.get("traceparent", "").strip().lower())
+        if match and match.group(1) != "0" * 32:
+            trace_id, parent, flags = match.groups()
+            return cls(request_id, trace_id, parent, forced=bool(int(flags, 16) & 1))
+        return cls(request_id, os.urandom(16).hex())
+
+    def traceparent(self, sampled: bool) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if sampled else '00'}"
+
+
+def server_timing(timings: Mapping[str, float], groups: Sequence[Tuple[str, Iterable[str]]], total: float) -> str:
+    """``Server-Timing`` value; each entry sums the stages grouped under it (ms).
+
+    Groups with no recorded stage (the request failed before them) are left out.
+    """
+    entries = []
+    for name, stages in groups:
+        present = [timings[stage] for stage in stages if stage in timings]
+        if not present:
+            continue
+        seconds = sum(present)
+        entries.append(f"{name};dur={seconds * 1000:.2f}")
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class SpanExporter:
+    """Samples finished requests and appends them to a rotating OTLP/JSON file."""
+
+    def __init__(
+        self,
+        path: Optional[Path],
+        sample_rate: float,
+        max_bytes: int,
+        backups: int,
+        service_name: str,
+        service_version: str = "",
+    ):
+        self.path = Path(path) if path else None
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.resource = {
+            "attributes": [_attribute("service.name", service_name)]
+            + ([_attribute("service.version", service_version)] if service_version else [])
+        }
+        self.exported = 0
+        self._logger: Optional[logging.Logger] = None
+        self._listener: Optional[logging.handlers.QueueListener] = None
+
+    def start(self) -> None:
+        """Open the file; writes then happen on a listener thread, off the request path."""
+        if self.path is None or self._listener is not None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8"
+            )
+        except OSError as exc:
+            print(f"Span export disabled, cannot open {self.path}: {exc}")
+            self.path = None
+            return
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        records: queue.Queue = queue.Queue(-1)
+        self._logger = logging.getLogger("batik.spans")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._logger.addHandler(logging.handlers.QueueHandler(records))
+        self._listener = logging.handlers.QueueListener(records, handler)
+        self._listener.start()
+
+    def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in list(self._logger.handlers):
+                self._logger.removeHandler(handler)
+            self._listener = None
+
+    def should_sample(self, trace: RequestTrace, status: int) -> bool:
+        if self._listener is None:
+            return False
+        return trace.forced or status >= 500 or random.random() < self.sample_rate
+
+    def export(
+        self,
+        trace: RequestTrace,
+        name: str,
+        timings: Dict[str, float],
+        stage_order: Sequence[str],
+        total: float,
+        status: int,
+        attributes: Mapping[str, object],
+    ) -> None:
+        """Write one request as a server span with a child span per stage.
+
+        The stages run one after another, so children are laid end to end
+        from the request start using their measured durations.
+        """
+        end_ns = trace.start_ns + int(total * 1e9)
+        root = {
+            "traceId": trace.trace_id,
+            "spanId": trace.span_id,
+            "name": name,
+            "kind": SPAN_KIND_SERVER,
+            "startTimeUnixNano": str(trace.start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": [_attribute(k, v) for k, v in attributes.items()]
+            + [_attribute("http.response.status_code", status), _attribute("batik.request_id", trace.request_id)],
+            "status": {"code": STATUS_ERROR if status >= 500 else STATUS_OK},
+        }
+        if trace.parent_span_id:
+            root["parentSpanId"] = trace.parent_span_id
+
+        spans = [root]
+        cursor = trace.start_ns
+        for stage in stage_order:
+            if stage not in timings:
+                continue
+            duration = int(timings[stage] * 1e9)
+            spans.append({
+                "traceId": trace.trace_id,
+                "spanId": os.urandom(8).hex(),
+                "parentSpanId": trace.span_id,
+                "name": stage,
+                "kind": SPAN_KIND_INTERNAL,
+                "startTimeUnixNano": str(cursor),
+                "endTimeUnixNano": str(cursor + duration),
+            })
+            cursor += duration
+
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": self.resource,
+                    "scopeSpans": [{"scope": {"name": "batik-classifier"}, "spans": spans}],
+                }
+            ]
+        }
+        self._logger.info(json.dumps(payload, separators=(",", ":")))
+        self.exported += 1
+
+    def info(self) -> dict:
+        return {
+            "enabled": self._listener is not None,
+            "path": str(self.path) if self.path else None,
+            "sample_rate": self.sample_rate,
+            "exported": self.exported,
+        }
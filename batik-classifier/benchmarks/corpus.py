@@ -0,0 +1,113 @@
+"""
+Synthetic image corpus for the benchmarks: batik-like textures at the sizes
+and formats phones actually upload, optionally tagged with an EXIF rotation.
+"""
+import io
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+SIZES = {
+    "vga": (640, 480),
+    "hd": (1280, 720),
+    "fhd": (1920, 1080),
+    "5mp": (2592, 1944),
+    "12mp": (4032, 3024),
+}
+FORMATS = ("JPEG", "PNG", "WEBP")
+_MIME = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+_EXT = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+_EXIF_ORIENTATION = 0x0112
+
+
+class CorpusImage(NamedTuple):
+    name: str
+    data: bytes
+    mime: str
+    size: tuple
+    fmt: str
+    exif_rotated: bool
+
+
+def _texture(width: int, height: int, rng: np.random.Generator) -> Image.Image:
+    # Periodic motif plus noise: compresses like a photo, not like a flat fill.
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    period = rng.uniform(24, 96)
+    base = np.stack(
+        [
+            np.sin(x / period + rng.uniform(0, 6)) * np.cos(y / period),
+            np.sin((x + y) / (period * 0.7)),
+            np.cos(x / (period * 1.3)) * np.sin(y / (period * 0.9)),
+        ],
+        axis=-1,
+    )
+    noise = rng.normal(0, 0.25, size=base.shape).astype(np.float32)
+    pixels = np.clip((base + noise + 1.5) * 85, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels, "RGB")
+
+
+def encode(image: Image.Image, fmt: str, exif_rotated: bool = False, quality: int = 90) -> bytes:
+    buf = io.BytesIO()
+    kwargs = {"quality": quality} if fmt in ("JPEG", "WEBP") else {}
+    if exif_rotated:
+        exif = Image.Exif()
+        exif[_EXIF_ORIENTATION] = 6  # rotate 90 CW on display, like a portrait phone shot
+        kwargs["exif"] = exif.tobytes()
+    image.save(buf, format=fmt, **kwargs)
+    return buf.getvalue()
+
+
+def build_corpus(
+    sizes: Sequence[str] = ("vga", "hd", "fhd"),
+    formats: Sequence[str] = FORMATS,
+    exif: Iterable[bool] = (False, True),
+    seed: int = 0,
+) -> List[CorpusImage]:
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for size_name in sizes:
+        width, height = SIZES[size_name]
+        image = _texture(width, height, rng)
+        for fmt in formats:
+            for rotated in exif:
+                name = f"{size_name}{'-exif' if rotated else ''}.{_EXT[fmt]}"
+                corpus.append(CorpusImage(name, encode(image, fmt, rotated), _MIME[fmt], (width, height), fmt, rotated))
+    return corpus
+
+
+def load_corpus_dir(path: Path, limit: Optional[int] = None) -> List[CorpusImage]:
+    """Real images from a directory tree instead of synthetic ones."""
+    corpus = []
+    for file in sorted(Path(path).rglob("*")):
+        suffix = file.suffix.lower()
+        fmt = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG", ".webp": "WEBP"}.get(suffix)
+        if fmt is None:
+            continue
+        data = file.read_bytes()
+        with Image.open(io.BytesIO(data)) as img:
+            size = img.size
+        corpus.append(CorpusImage(file.name, data, _MIME[fmt], size, fmt, False))
+        if limit and len(corpus) >= limit:
+            break
+    return corpus
+
+
+def write_class_folders(
+    root: Path,
+    classes: int = 8,
+    per_class: int = 64,
+    sizes: Sequence[str] = ("vga", "hd"),
+    seed: int = 0,
+) -> Path:
+    """A flow_from_directory-style dataset of JPEG textures, for the training benchmarks."""
+    rng = np.random.default_rng(seed)
+    root = Path(root)
+    for c in range(classes):
+        folder = root / f"batik-synthetic_{c:02d}"
+        folder.mkdir(parents=True, exist_ok=True)
+        for i in range(per_class):
+            width, height = SIZES[sizes[i % len(sizes)]]
+            (folder / f"{i:04d}.jpg").write_bytes(encode(_texture(width, height, rng), "JPEG"))
+    return root
@@ -0,0 +1,236 @@
+"""
+Training input-pipeline throughput on CPU, without a model.
+
+Times whole epochs of augmented 224x224 batches from:
+
+- ``generator``: the notebooks' ``ImageDataGenerator.flow_from_directory``
+  (only when a Keras 2 style ``ImageDataGenerator`` can be imported)
+- ``sequential``: the same work done the generator's way in tf.data (one
+  image decoded and augmented at a time, nothing overlapped), always available
+- ``tf.data``: ``training/pipeline.py`` (parallel decode, uint8 cache,
+  batched augmentation, prefetch); epoch 2 is served from the cache
+- ``shards``: ``pipeline.from_shards`` over memory-mapped shards
+
+It also times augmentation alone on decoded 224x224 images:
+``ImageDataGenerator.apply_transform`` one image at a time (what the
+generator does) against ``pipeline.augment_batch`` on whole batches.
+
+    python input_pipeline.py                          # synthetic JPEG dataset
+    python input_pipeline.py /data/batik_dataset --limit 2048 --epochs 2
+    python input_pipeline.py --augmentation kaggle-ready --only shards
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from corpus import write_class_folders
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "training"))
+
+import tensorflow as tf  # noqa: E402
+
+import pipeline  # noqa: E402
+from dataset import ClassFolderDataset, list_class_folders  # noqa: E402
+from shards import ShardDataset, build_shards  # noqa: E402
+
+
+def _image_data_generator():
+    for module in ("tf_keras.preprocessing.image", "tensorflow.keras.preprocessing.image", "keras.preprocessing.image"):
+        try:
+            return getattr(__import__(module, fromlist=["ImageDataGenerator"]), "ImageDataGenerator")
+        except (ImportError, AttributeError):
+            continue
+    return None
+
+
+AUGMENTATIONS = {"simple": pipeline.NOTEBOOK_AUGMENTATION, "kaggle-ready": pipeline.KAGGLE_READY_AUGMENTATION}
+
+
+def sequential_pipeline(
+    samples: ClassFolderDataset, batch_size: int, image_size: int, seed: int, params: dict
+) -> tf.data.Dataset:
+    """flow_from_directory's shape of work: decode, resize and augment one
+    image at a time, batch afterwards, nothing in parallel or ahead."""
+    paths = [str(samples.root / path) for path in samples.paths]
+    ds = tf.data.Dataset.from_tensor_slices((paths, samples.labels))
+    ds = ds.shuffle(len(paths), seed=seed)
+    ds = ds.map(lambda path, label: (pipeline.decode_and_resize(path, image_size), label))
+    ds = tf.data.Dataset.zip(ds, tf.data.Dataset.random(seed=seed)).map(
+        lambda sample, r: (
+            pipeline.augment_batch(tf.cast(sample[0], tf.float32)[None], tf.stack([r, r]), params)[0],
+            sample[1],
+        )
+    )
+    return ds.batch(batch_size).map(lambda images, labels: (images, tf.one_hot(labels, len(samples.class_names))))
+
+
+def augmentation_throughput(images: np.ndarray, params: dict, batch_size: int, generator_class) -> Dict[str, dict]:
+    """Augmented images/sec on already decoded float images, per implementation."""
+    results: Dict[str, dict] = {}
+    if generator_class is not None:
+        datagen = generator_class(**params)
+        try:
+            started = time.perf_counter()
+            for image in images:
+                datagen.apply_transform(image, datagen.get_random_transform(image.shape))
+            elapsed = time.perf_counter() - started
+            results["generator"] = {"images_per_sec": len(images) / elapsed}
+        except ImportError as exc:
+            results["generator"] = {"skipped": str(exc)}
+    augment = tf.function(lambda batch, seed: pipeline.augment_batch(batch, seed, params))
+    augment(tf.constant(images[:batch_size]), tf.constant([0, 0], tf.int64))  # trace once
+    started = time.perf_counter()
+    for i, start in enumerate(range(0, len(images), batch_size)):
+        augment(tf.constant(images[start:start + batch_size]), tf.constant([i, 0], tf.int64)).numpy()
+    results["augment_batch"] = {"images_per_sec": len(images) / (time.perf_counter() - started)}
+    return results
+
+
+def time_epochs(make_epoch: Callable[[], object], epochs: int) -> List[dict]:
+    results = []
+    for _ in range(epochs):
+        images = 0
+        started = time.perf_counter()
+        for batch, _labels in make_epoch():
+            images += int(batch.shape[0])
+        elapsed = time.perf_counter() - started
+        results.append({"images": images, "seconds": elapsed, "images_per_sec": images / elapsed if elapsed else 0.0})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", nargs="?", type=Path, help="Class-folder dataset (default: synthetic JPEGs)")
+    parser.add_argument("--synthetic-classes", type=int, default=8)
+    parser.add_argument("--synthetic-per-class", type=int, default=64)
+    parser.add_argument("--limit", type=int, help="Use an evenly spaced sample of this many images")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--image-size", type=int, default=224)
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="+", choices=("generator", "sequential", "tf.data", "shards"))
+    parser.add_argument("--augmentation", choices=sorted(AUGMENTATIONS), default="simple",
+                        help="simple: Batik_Training_FIXED_Simple; kaggle-ready: Batik_Training_Kaggle_Ready")
+    parser.add_argument("--augment-images", type=int, default=256,
+                        help="Images for the augmentation-only timing (0 skips it)")
+    parser.add_argument("--output", type=Path, help="Write results JSON here")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="batik-input-"))
+    try:
+        root = args.dataset
+        if root is None:
+            print(f"Writing {args.synthetic_classes}x{args.synthetic_per_class} synthetic JPEGs to {workdir}")
+            root = write_class_folders(workdir / "dataset", args.synthetic_classes, args.synthetic_per_class)
+        samples = list_class_folders(root)
+        if args.limit and args.limit < len(samples.paths):
+            samples = samples.select(np.linspace(0, len(samples.paths) - 1, args.limit).astype(np.int64))
+        print(f"{len(samples.paths)} images, {len(samples.class_names)} classes, batch {args.batch_size}, "
+              f"{os.cpu_count()} CPUs")
+
+        params = AUGMENTATIONS[args.augmentation]
+        variants: Dict[str, Optional[Callable[[], object]]] = {}
+        notes: Dict[str, str] = {}
+        generator_class = _image_data_generator()
+        if generator_class is None:
+            variants["generator"] = None
+            notes["generator"] = "ImageDataGenerator not importable; install tf_keras to include it"
+        else:
+            datagen = generator_class(rescale=1.0 / 255, **params)
+            if args.limit:
+                notes["generator"] = "reads the whole folder; --limit does not apply"
+
+            def generator_epoch():
+                flow = datagen.flow_from_directory(
+                    str(root), target_size=(args.image_size,) * 2, batch_size=args.batch_size,
+                    class_mode="categorical", shuffle=True, seed=args.seed,
+                )
+                return (flow[i] for i in range(len(flow)))
+            variants["generator"] = generator_epoch
+
+        variants["sequential"] = lambda: sequential_pipeline(samples, args.batch_size, args.image_size, args.seed, params)
+        tf_data = pipeline.from_files(
+            samples, args.batch_size, args.image_size, training=True, seed=args.seed, augmentation=params
+        )
+        variants["tf.data"] = lambda: tf_data
+
+        if not args.only or "shards" in args.only:
+            started = time.perf_counter()
+            build_shards(samples, workdir / "shards", args.image_size, workers=os.cpu_count() or 1)
+            notes["shards"] = f"one-off build {time.perf_counter() - started:.1f}s"
+            shard_ds = pipeline.from_shards(
+                ShardDataset(workdir / "shards"), None, args.batch_size, seed=args.seed, augmentation=params
+            )
+            variants["shards"] = lambda: shard_ds
+
+        results = {}
+        for name, make_epoch in variants.items():
+            if args.only and name not in args.only:
+                continue
+            if make_epoch is None:
+                results[name] = {"skipped": notes[name]}
+                print(f"  {name:<11} skipped: {notes[name]}")
+                continue
+            try:
+                epochs = time_epochs(make_epoch, args.epochs)
+            except ImportError as exc:
+                # Keras 3's legacy ImageDataGenerator imports scipy lazily.
+                results[name] = {"skipped": str(exc)}
+                print(f"  {name:<11} skipped: {exc}")
+                continue
+            results[name] = {"epochs": epochs, "note": notes.get(name)}
+            rates = ", ".join(f"epoch {i + 1}: {e['images_per_sec']:.1f}" for i, e in enumerate(epochs))
+            print(f"  {name:<11} {rates} images/s" + (f"  ({notes[name]})" if name in notes else ""))
+
+        if args.augment_images:
+            count = min(args.augment_images, len(samples.paths))
+            images = np.stack([
+                pipeline.decode_and_resize(samples.location(i), args.image_size).numpy().astype(np.float32)
+                for i in range(count)
+            ])
+            results["augmentation"] = augmentation_throughput(images, params, args.batch_size, generator_class)
+            print(f"\nAugmentation only ({args.augmentation}, {count} images):")
+            for name, result in results["augmentation"].items():
+                if "images_per_sec" in result:
+                    print(f"  {name:<13} {result['images_per_sec']:.1f} images/s")
+                else:
+                    print(f"  {name:<13} skipped: {result['skipped']}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline_name = "generator" if "epochs" in results.get("generator", {}) else "sequential"
+    if "epochs" in results.get(baseline_name, {}):
+        base = results[baseline_name]["epochs"][-1]["images_per_sec"]
+        print(f"\nSpeed-up over {baseline_name} (last epoch):")
+        for name, result in results.items():
+            if "epochs" in result and name != baseline_name:
+                print(f"  {name:<11} {result['epochs'][-1]['images_per_sec'] / base:.1f}x")
+
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "tensorflow": tf.__version__,
+                "cpus": os.cpu_count(),
+                "images": len(samples.paths),
+                "batch_size": args.batch_size,
+            },
+            "results": results,
+        }
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
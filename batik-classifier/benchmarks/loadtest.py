@@ -0,0 +1,582 @@
+"""
+HTTP load test for the serving entry points, entirely on localhost.
+
+Starts one of the servers (FastAPI ``main``, Flask ``app`` / ``app_mobilenet``
+or Gradio ``app_gradio``) against a real or synthetic TFLite model, drives it
+from an asyncio client at a fixed concurrency with a corpus of varied image
+sizes and formats, and writes throughput, latency percentiles, error counts
+and server CPU/RSS to a JSON file that later runs can be compared against.
+
+    python synthetic_model.py --out /tmp/batik_synthetic.tflite
+    python loadtest.py --server main --model /tmp/batik_synthetic.tflite \\
+        --concurrency 8 --requests 500
+    python loadtest.py --server app_mobilenet --model /tmp/batik_synthetic.tflite \\
+        --compare results/loadtest-main-<timestamp>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from corpus import SIZES, CorpusImage, build_corpus, load_corpus_dir
+
+BENCH_DIR = Path(__file__).resolve().parent
+API_DIR = BENCH_DIR.parent / "api"
+RESULTS_DIR = BENCH_DIR / "results"
+
+SERVERS = {
+    # name: (ready path, request protocol, upload field)
+    "main": ("/ready", "multipart", "file"),
+    "app": ("/", "multipart", "file"),
+    "app_mobilenet": ("/", "multipart", "file"),
+    "app_gradio": ("/", "gradio", None),
+}
+
+
+# --- minimal HTTP/1.1 client (stdlib only, keep-alive) ---
+
+class HttpConnection:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+
+    async def request(
+        self, method: str, path: str, body: bytes = b"", headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        for attempt in (0, 1):
+            if self._writer is None:
+                await self._connect()
+            try:
+                return await self._roundtrip(method, path, body, headers or {})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # Server closed an idle keep-alive connection; retry once fresh.
+                await self.close()
+                if attempt:
+                    raise
+        raise ConnectionError("unreachable")
+
+    async def _roundtrip(self, method, path, body, headers) -> Tuple[int, Dict[str, str], bytes]:
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        self._writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        response_headers: Dict[str, str] = {}
+        while True:
+            line = await self._reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            response_headers[key.strip().lower()] = value.strip()
+
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self._reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    await self._reader.readuntil(b"\r\n")
+                    break
+                chunks.append(await self._reader.readexactly(size))
+                await self._reader.readexactly(2)
+            payload = b"".join(chunks)
+        elif "content-length" in response_headers:
+            payload = await self._reader.readexactly(int(response_headers["content-length"]))
+        else:
+            payload = await self._reader.read()
+            await self.close()
+            return status, response_headers, payload
+
+        if response_headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, response_headers, payload
+
+
+def multipart_body(field: str, image: CorpusImage) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{image.name}"\r\n'
+        f"Content-Type: {image.mime}\r\n\r\n"
+    ).encode("utf-8")
+    return head + image.data + f"\r\n--{boundary}--\r\n".encode("utf-8"), f"multipart/form-data; boundary={boundary}"
+
+
+class MultipartDriver:
+    """POST /predict with the image as a multipart upload (FastAPI and Flask)."""
+
+    def __init__(self, field: str, query: str = ""):
+        self.field = field
+        self.path = "/predict" + (f"?{query}" if query else "")
+
+    async def send(self, conn: HttpConnection, image: CorpusImage) -> Tuple[int, int]:
+        body, content_type = multipart_body(self.field, image)
+        status, _, payload = await conn.request("POST", self.path, body, {"Content-Type": content_type})
+        return status, len(payload)
+
+
+class GradioDriver:
+    """Gradio 4 REST flow: upload the file, queue a call, read the SSE result."""
+
+    def __init__(self, api_name: str = "predict_batik"):
+        self.api_name = api_name
+
+    async def send(self, conn: HttpConnection, image: CorpusImage) -> Tuple[int, int]:
+        body, content_type = multipart_body("files", image)
+        status, _, payload = await conn.request("POST", "/upload", body, {"Content-Type": content_type})
+        if status != 200:
+            return status, len(payload)
+        server_path = json.loads(payload)[0]
+        call = json.dumps({"data": [{"path": server_path, "meta": {"_type": "gradio.FileData"}}]}).encode()
+        status, _, payload = await conn.request(
+            "POST", f"/call/{self.api_name}", call, {"Content-Type": "application/json"}
+        )
+        if status != 200:
+            return status, len(payload)
+        event_id = json.loads(payload)["event_id"]
+        status, _, payload = await conn.request("GET", f"/call/{self.api_name}/{event_id}")
+        if b"event: error" in payload:
+            return 599, len(payload)
+        return status, len(payload)
+
+
+# --- server process management and resource sampling ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_command(server: str, port: int, launcher: str) -> List[str]:
+    if server == "main":
+        return [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)]
+    if server == "app_gradio":
+        code = (
+            "import app_gradio as m; "
+            f"m.create_interface().launch(server_name='127.0.0.1', server_port={port}, share=False)"
+        )
+        return [sys.executable, "-c", code]
+    if launcher == "gunicorn":
+        # Same shape as the Procfile / render.yaml deployment.
+        return [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", "1",
+                "--timeout", "120", f"{server}:app"]
+    return [sys.executable, "-m", "flask", "--app", server, "run", "--host", "127.0.0.1", "--port", str(port)]
+
+
+def _children(pid: int) -> List[int]:
+    pids = []
+    for task in Path(f"/proc/{pid}/task").glob("*/children"):
+        try:
+            pids += [int(p) for p in task.read_text().split()]
+        except OSError:
+            pass
+    return pids
+
+
+def _process_tree(pid: int) -> List[int]:
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(_children(current))
+    return tree
+
+
+def _cpu_seconds_and_rss(pids: List[int]) -> Tuple[float, int]:
+    ticks = os.sysconf("SC_CLK_TCK")
+    page = os.sysconf("SC_PAGE_SIZE")
+    cpu, rss = 0.0, 0
+    for pid in pids:
+        try:
+            fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / ticks
+            rss += int(Path(f"/proc/{pid}/statm").read_text().split()[1]) * page
+        except (OSError, IndexError, ValueError):
+            pass
+    return cpu, rss
+
+
+class ResourceSampler:
+    """Samples CPU time and RSS of the server process tree in a thread.
+
+    Each sample is (time, cpu seconds, rss bytes, requests completed so far).
+    """
+
+    def __init__(self, pid: Optional[int], interval: float = 0.25, progress: Callable[[], int] = lambda: 0):
+        self.pid = pid
+        self.interval = interval
+        self.progress = progress
+        self.samples: List[Tuple[float, float, int, int]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> None:
+        cpu, rss = _cpu_seconds_and_rss(_process_tree(self.pid))
+        self.samples.append((time.perf_counter(), cpu, rss, self.progress()))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        if self.pid is not None and Path(f"/proc/{self.pid}").exists():
+            self._sample()
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+            self._sample()
+
+    def summary(self) -> dict:
+        if len(self.samples) < 2:
+            return {"available": False}
+        (t0, cpu0, rss0, _), (t1, cpu1, rss1, _) = self.samples[0], self.samples[-1]
+        return {
+            "available": True,
+            "cpu_percent_mean": round(100 * (cpu1 - cpu0) / (t1 - t0), 1),
+            "cpu_seconds": round(cpu1 - cpu0, 3),
+            "rss_mb_start": round(rss0 / 2**20, 1),
+            "rss_mb_peak": round(max(s[2] for s in self.samples) / 2**20, 1),
+            "rss_mb_end": round(rss1 / 2**20, 1),
+        }
+
+
+class ServerProcess:
+    def __init__(self, server: str, model: Optional[Path], labels: Optional[Path], launcher: str, log_path: Path):
+        self.server = server
+        self.port = _free_port()
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        if model:
+            env["BATIK_MODEL_PATH"] = str(Path(model).resolve())
+        if labels:
+            env["BATIK_LABELS_PATH"] = str(Path(labels).resolve())
+        self._log = open(log_path, "wb")
+        self.proc = subprocess.Popen(
+            server_command(server, self.port, launcher), cwd=API_DIR, env=env,
+            stdout=self._log, stderr=subprocess.STDOUT,
+        )
+
+    async def wait_ready(self, path: str, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"{self.server} exited with code {self.proc.returncode}; see {self._log.name}")
+            conn = HttpConnection("127.0.0.1", self.port)
+            try:
+                status, _, _ = await conn.request("GET", path)
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            finally:
+                await conn.close()
+            await asyncio.sleep(0.2)
+        raise TimeoutError(f"{self.server} not ready after {timeout}s; see {self._log.name}")
+
+    def stop(self) -> None:
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self._log.close()
+
+
+# --- load generation ---
+
+async def run_load(
+    host: str,
+    port: int,
+    driver,
+    corpus: List[CorpusImage],
+    total: int,
+    concurrency: int,
+    records: Optional[List[dict]] = None,
+) -> Tuple[List[dict], float]:
+    counter = iter(range(total))
+    records = [] if records is None else records
+
+    async def worker():
+        conn = HttpConnection(host, port)
+        try:
+            for i in counter:
+                image = corpus[i % len(corpus)]
+                started = time.perf_counter()
+                try:
+                    status, nbytes = await driver.send(conn, image)
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    # Status 0: connection-level failure, counted as an error.
+                    status, nbytes = 0, 0
+                    await conn.close()
+                records.append({
+                    "image": image.name,
+                    "status": status,
+                    "latency_ms": (time.perf_counter() - started) * 1000,
+                    "bytes": nbytes,
+                })
+        finally:
+            await conn.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return records, time.perf_counter() - started
+
+
+def _latency_summary(latencies: List[float]) -> dict:
+    if not latencies:
+        return {}
+    arr = np.asarray(latencies)
+    return {
+        "mean": round(float(arr.mean()), 2),
+        "p50": round(float(np.percentile(arr, 50)), 2),
+        "p95": round(float(np.percentile(arr, 95)), 2),
+        "p99": round(float(np.percentile(arr, 99)), 2),
+        "max": round(float(arr.max()), 2),
+    }
+
+
+def summarize(records: List[dict], elapsed: float) -> dict:
+    ok = [r for r in records if r["status"] == 200]
+    errors: Dict[str, int] = {}
+    for r in records:
+        if r["status"] != 200:
+            errors[str(r["status"])] = errors.get(str(r["status"]), 0) + 1
+    per_image: Dict[str, List[float]] = {}
+    for r in ok:
+        per_image.setdefault(r["image"], []).append(r["latency_ms"])
+    return {
+        "requests": len(records),
+        "ok": len(ok),
+        "errors": errors,
+        "error_rate": round(1 - len(ok) / len(records), 4) if records else None,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+        "latency_ms": _latency_summary([r["latency_ms"] for r in ok]),
+        "per_image_latency_ms": {name: _latency_summary(v) for name, v in sorted(per_image.items())},
+    }
+
+
+def soak_verdict(samples: List[Tuple[float, float, int, int]], total: int, settle: float, max_growth_mb: float) -> dict:
+    """RSS growth once the server has settled, with a per-request trend.
+
+    The first ``settle`` fraction of requests is excluded: allocator arenas,
+    interpreter buffers and caches legitimately grow while traffic ramps up.
+    """
+    settled = [s for s in samples if s[3] >= settle * total]
+    if len(settled) < 2:
+        return {"available": False, "passed": True}
+    requests = np.array([s[3] for s in settled], dtype=np.float64)
+    rss_mb = np.array([s[2] for s in settled], dtype=np.float64) / 2**20
+    growth = float(rss_mb[-1] - rss_mb[0])
+    slope = float(np.polyfit(requests, rss_mb, 1)[0]) if np.ptp(requests) > 0 else 0.0
+    step = max(1, len(samples) // 200)
+    return {
+        "available": True,
+        "settle_requests": int(requests[0]),
+        "rss_mb_settled": round(float(rss_mb[0]), 1),
+        "rss_mb_end": round(float(rss_mb[-1]), 1),
+        "rss_mb_max": round(float(rss_mb.max()), 1),
+        "growth_mb": round(growth, 2),
+        "trend_mb_per_10k_requests": round(slope * 10_000, 3),
+        "max_growth_mb": max_growth_mb,
+        "passed": growth <= max_growth_mb,
+        # (requests completed, RSS MB), thinned to ~200 points for plotting.
+        "timeline": [[s[3], round(s[2] / 2**20, 1)] for s in samples[::step]],
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+COMPARE_KEYS = (
+    ("throughput_rps", ("summary", "throughput_rps")),
+    ("p50 ms", ("summary", "latency_ms", "p50")),
+    ("p95 ms", ("summary", "latency_ms", "p95")),
+    ("p99 ms", ("summary", "latency_ms", "p99")),
+    ("error_rate", ("summary", "error_rate")),
+    ("cpu %", ("resources", "cpu_percent_mean")),
+    ("rss peak MB", ("resources", "rss_mb_peak")),
+)
+
+
+def _dig(data: dict, path) -> Optional[float]:
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def format_comparison(baseline: dict, current: dict) -> str:
+    lines = [f"{'metric':<16}{'baseline':>12}{'current':>12}{'change':>10}"]
+    for label, path in COMPARE_KEYS:
+        before, after = _dig(baseline, path), _dig(current, path)
+        change = ""
+        if isinstance(before, (int, float)) and isinstance(after, (int, float)) and before:
+            change = f"{(after - before) / before:+.1%}"
+        lines.append(f"{label:<16}{str(before):>12}{str(after):>12}{change:>10}")
+    return "\n".join(lines)
+
+
+def print_report(report: dict) -> None:
+    s = report["summary"]
+    print(f"\n{report['config']['server']} @ concurrency {report['config']['concurrency']}")
+    print(f"  requests {s['requests']}  ok {s['ok']}  errors {s['errors'] or 0}")
+    print(f"  throughput {s['throughput_rps']} req/s")
+    print(f"  latency ms {s['latency_ms']}")
+    print(f"  server {report['resources']}")
+    soak = report.get("soak")
+    if soak and soak["available"]:
+        print(
+            f"  soak: RSS {soak['rss_mb_settled']} -> {soak['rss_mb_end']} MB after settling "
+            f"({soak['growth_mb']:+} MB, trend {soak['trend_mb_per_10k_requests']:+} MB / 10k requests, "
+            f"limit {soak['max_growth_mb']} MB) -> {'PASS' if soak['passed'] else 'FAIL'}"
+        )
+
+
+async def _main(args) -> dict:
+    if args.corpus_dir:
+        corpus = load_corpus_dir(args.corpus_dir, args.corpus_limit)
+    else:
+        corpus = build_corpus(sizes=args.sizes, seed=args.seed)
+    if not corpus:
+        raise SystemExit("Empty corpus")
+
+    protocol, field = SERVERS[args.server][1:]
+    driver = GradioDriver(args.gradio_api) if protocol == "gradio" else MultipartDriver(field, args.query)
+
+    server = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port, pid = parts.hostname, parts.port or 80, args.server_pid
+    else:
+        if args.model is None:
+            raise SystemExit("--model is required unless --url points at a running server")
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        log_path = Path(tempfile.gettempdir()) / f"loadtest-{args.server}-{os.getpid()}.log"
+        server = ServerProcess(args.server, args.model, args.labels, args.launcher, log_path)
+        host, port, pid = "127.0.0.1", server.port, server.proc.pid
+
+    try:
+        if server is not None:
+            await server.wait_ready(SERVERS[args.server][0], args.startup_timeout)
+        if args.warmup:
+            await run_load(host, port, driver, corpus, args.warmup, min(args.concurrency, args.warmup))
+        records: List[dict] = []
+        interval = 1.0 if args.soak else 0.25
+        with ResourceSampler(pid, interval, progress=lambda: len(records)) as sampler:
+            records, elapsed = await run_load(
+                host, port, driver, corpus, args.requests, args.concurrency, records
+            )
+    finally:
+        if server is not None:
+            server.stop()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "server": args.server,
+            "model": str(args.model) if args.model else None,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "corpus": [{"name": c.name, "bytes": len(c.data), "size": list(c.size)} for c in corpus],
+        },
+        "summary": summarize(records, elapsed),
+        "resources": sampler.summary(),
+    }
+    if args.soak:
+        report["soak"] = soak_verdict(sampler.samples, args.requests, args.settle, args.max_rss_growth_mb)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=sorted(SERVERS), default="main")
+    parser.add_argument("--model", type=Path,
+                        help="TFLite model to serve (real or from synthetic_model.py); main also serves .keras/.h5")
+    parser.add_argument("--labels", type=Path, help="Label JSON (defaults to the server's own)")
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="PID to sample CPU/RSS from when using --url")
+    parser.add_argument("--launcher", choices=("gunicorn", "flask"), default="gunicorn",
+                        help="How to start the Flask apps (gunicorn mirrors the Procfile)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--sizes", nargs="+", choices=sorted(SIZES), default=["vga", "hd", "fhd"])
+    parser.add_argument("--corpus-dir", type=Path, help="Use real images from this directory")
+    parser.add_argument("--corpus-limit", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--query", default="", help="Extra query string for /predict, e.g. 'k=3'")
+    parser.add_argument("--gradio-api", default="predict_batik")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--soak", action="store_true",
+                        help="Leak check: track server RSS over the run and fail if it keeps growing")
+    parser.add_argument("--settle", type=float, default=0.1,
+                        help="Fraction of soak requests treated as warm-up before measuring growth")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=32.0,
+                        help="Soak fails if RSS grows more than this after settling")
+    parser.add_argument("--output", type=Path, help="Where to write the JSON result")
+    parser.add_argument("--compare", type=Path, help="Earlier result JSON to compare against")
+    args = parser.parse_args()
+
+    report = asyncio.run(_main(args))
+    print_report(report)
+
+    output = args.output or RESULTS_DIR / f"loadtest-{args.server}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        print("\n" + format_comparison(json.loads(args.compare.read_text()), report))
+    if args.soak and not report["soak"]["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Microbenchmarks for the serving hot path, with baselines stored in the repo.
+
+Covers ``preprocess_image`` (decode included, VGA to 12 MP, JPEG/PNG/WebP,
+with and without EXIF rotation), ``run_inference``, ``_load_class_names``,
+``_load_interpreter``, top-k post-processing and one invoke per inference
+backend (``--keras-model`` adds the Keras backend, with and without XLA). Each benchmark reports the
+median and minimum wall time plus tracemalloc's peak and retained memory for
+one call, and is compared against ``baselines/microbench.json``.
+
+    python microbench.py --model /tmp/batik_synthetic.tflite
+    python microbench.py --model /tmp/batik_synthetic.tflite --filter preprocess --tolerance 0.15
+    python microbench.py --model /tmp/batik_synthetic.tflite --update-baseline
+    python microbench.py --model /tmp/batik_synthetic.tflite --keras-model best_model_batik.keras --filter invoke
+
+Exits with status 1 when any benchmark is slower than the baseline by more
+than ``--tolerance`` or allocates more than ``--alloc-tolerance``.
+"""
+import argparse
+import gc
+import hashlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+from PIL import Image
+
+from corpus import FORMATS, SIZES, build_corpus
+
+BENCH_DIR = Path(__file__).resolve().parent
+API_DIR = BENCH_DIR.parent / "api"
+DEFAULT_BASELINE = BENCH_DIR / "baselines" / "microbench.json"
+DEFAULT_LABELS = API_DIR / "batik_labels_v2.json"
+
+# Differences below this are timer noise, whatever the relative change.
+NOISE_FLOOR_MS = 0.005
+ALLOC_SLACK_KIB = 4.0
+
+
+class Benchmark(NamedTuple):
+    name: str
+    fn: Callable[[], object]
+
+
+def measure(fn: Callable[[], object], min_time: float, min_repeats: int, max_repeats: int) -> dict:
+    fn()  # warm caches, lazy imports and interpreter delegates
+    times: List[float] = []
+    started = time.perf_counter()
+    while len(times) < max_repeats and (len(times) < min_repeats or time.perf_counter() - started < min_time):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+
+    # Memory in a separate call: tracemalloc slows allocation-heavy code a lot.
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline_bytes = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 4),
+        "min_ms": round(min(times) * 1000, 4),
+        "repeats": len(times),
+        "peak_kib": round((peak - baseline_bytes) / 1024, 1),
+        "retained_kib": round((current - baseline_bytes) / 1024, 1),
+    }
+
+
+def _file_digest(path: Path) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()[:12]
+
+
+def build_benchmarks(model: Path, labels: Path, sizes, formats, keras_model: Optional[Path] = None) -> List[Benchmark]:
+    # main reads the overrides at import time; importing it builds the registry.
+    os.environ["BATIK_MODEL_PATH"] = str(Path(model).resolve())
+    os.environ["BATIK_LABELS_PATH"] = str(Path(labels).resolve())
+    sys.path.insert(0, str(API_DIR))
+    import main
+    import serving
+
+    benchmarks = [
+        Benchmark("load_class_names", lambda: serving._load_class_names(Path(labels))),
+        Benchmark("load_interpreter", lambda: serving._load_interpreter(Path(model))),
+    ]
+
+    for item in build_corpus(sizes=sizes, formats=formats):
+        data = item.data
+        benchmarks.append(Benchmark(
+            f"preprocess_image[{item.name}]",
+            lambda data=data: serving.preprocess_image(Image.open(io.BytesIO(data))),
+        ))
+
+    num_classes = len(main.registry.slot().current.class_names)
+    class_names = main.registry.slot().current.class_names
+    rng = np.random.default_rng(0)
+    scores = rng.random(num_classes, dtype=np.float32)
+    batch = rng.random((64, num_classes), dtype=np.float32)
+    benchmarks += [
+        Benchmark("top_k[k=5]", lambda: serving.top_k_indices(scores, 5)),
+        Benchmark("top_k[batch=64,k=5]", lambda: serving.top_k_indices(batch, 5)),
+        Benchmark(
+            "top_k+format[k=5]",
+            lambda: main.format_top_k(scores, serving.top_k_indices(scores, 5), class_names),
+        ),
+    ]
+
+    image = Image.open(io.BytesIO(build_corpus(sizes=["vga"], formats=["JPEG"], exif=[False])[0].data))
+    image.load()
+    benchmarks.append(Benchmark("run_inference[vga.jpg]", lambda: main.run_inference(image, k=5)))
+
+    # The model call alone, per backend, on the same synthetic batch of one.
+    served = main.registry.slot().current
+    backends_to_time = [(served.backend.name, served.backend)]
+    if keras_model:
+        from backends import KerasBackend
+
+        backends_to_time += [
+            ("keras", KerasBackend(keras_model, jit=False)),
+            ("keras+xla", KerasBackend(keras_model, jit=True)),
+        ]
+    for name, backend in backends_to_time:
+        data = backend.synthetic_input()
+        benchmarks.append(Benchmark(f"invoke[{name}]", lambda backend=backend, data=data: backend.predict(data)))
+    return benchmarks
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float, alloc_tolerance: float):
+    """Return per-benchmark (time change, alloc change, regressed) against the baseline."""
+    verdicts = {}
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            verdicts[name] = (None, None, False)
+            continue
+        time_change = (current["median_ms"] - base["median_ms"]) / base["median_ms"] if base["median_ms"] else 0.0
+        slower = (
+            time_change > tolerance
+            and current["median_ms"] - base["median_ms"] > NOISE_FLOOR_MS
+        )
+        alloc_change = None
+        heavier = False
+        if base.get("peak_kib"):
+            alloc_change = (current["peak_kib"] - base["peak_kib"]) / base["peak_kib"]
+            heavier = current["peak_kib"] > base["peak_kib"] * (1 + alloc_tolerance) + ALLOC_SLACK_KIB
+        verdicts[name] = (time_change, alloc_change, slower or heavier)
+    return verdicts
+
+
+def _pct(value: Optional[float]) -> str:
+    return "new" if value is None else f"{value:+.1%}"
+
+
+def format_table(results: Dict[str, dict], verdicts: Dict[str, tuple]) -> str:
+    lines = [f"{'benchmark':<34}{'median ms':>11}{'min ms':>10}{'peak KiB':>11}{'time':>9}{'alloc':>9}"]
+    for name, r in results.items():
+        time_change, alloc_change, regressed = verdicts.get(name, (None, None, False))
+        flag = "  REGRESSION" if regressed else ""
+        lines.append(
+            f"{name:<34}{r['median_ms']:>11.3f}{r['min_ms']:>10.3f}{r['peak_kib']:>11.1f}"
+            f"{_pct(time_change):>9}{_pct(alloc_change):>9}{flag}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", type=Path, default=os.environ.get("BATIK_MODEL_PATH"),
+                        help="TFLite model (real or from synthetic_model.py)")
+    parser.add_argument("--keras-model", type=Path,
+                        help="Keras model of the same network, to time the keras backend next to TFLite")
+    parser.add_argument("--labels", type=Path, default=DEFAULT_LABELS)
+    parser.add_argument("--sizes", nargs="+", choices=sorted(SIZES), default=list(SIZES))
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds of timing per benchmark")
+    parser.add_argument("--min-repeats", type=int, default=5)
+    parser.add_argument("--max-repeats", type=int, default=2000)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed median slowdown (0.25 = 25%%)")
+    parser.add_argument("--alloc-tolerance", type=float, default=0.10, help="Allowed peak memory growth")
+    parser.add_argument("--update-baseline", action="store_true", help="Write results as the new baseline")
+    parser.add_argument("--output", type=Path, help="Also write results JSON here")
+    args = parser.parse_args()
+
+    if args.model is None:
+        raise SystemExit("--model is required (build one with synthetic_model.py)")
+
+    benchmarks = build_benchmarks(args.model, args.labels, args.sizes, args.formats, args.keras_model)
+    if args.filter:
+        benchmarks = [b for b in benchmarks if args.filter in b.name]
+
+    results: Dict[str, dict] = {}
+    for bench in benchmarks:
+        results[bench.name] = measure(bench.fn, args.min_time, args.min_repeats, args.max_repeats)
+        print(f"  {bench.name:<34} {results[bench.name]['median_ms']:.3f} ms", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pillow": Image.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor() or None,
+            "cpus": os.cpu_count(),
+            "model_sha256": _file_digest(args.model),
+        },
+        "results": results,
+    }
+
+    baseline: Dict[str, dict] = {}
+    if args.baseline.exists() and not args.update_baseline:
+        stored = json.loads(args.baseline.read_text())
+        baseline = stored.get("results", {})
+        if stored.get("meta", {}).get("model_sha256") != report["meta"]["model_sha256"]:
+            print("Warning: baseline was recorded with a different model; inference numbers are not comparable")
+        if stored.get("meta", {}).get("cpus") != report["meta"]["cpus"]:
+            print("Warning: baseline was recorded on a different machine; re-record it before trusting verdicts")
+
+    verdicts = compare(results, baseline, args.tolerance, args.alloc_tolerance)
+    print(format_table(results, verdicts))
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.update_baseline:
+        if args.baseline.exists() and args.filter:
+            merged = json.loads(args.baseline.read_text())
+            merged["results"].update(results)
+            merged["meta"] = report["meta"]
+            report = merged
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    regressions = [name for name, (_, _, regressed) in verdicts.items() if regressed]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) past tolerance: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Build a stand-in for ``batik_model.tflite`` so benchmarks run without the
+Git LFS model: same input (1x224x224x3 float32) and a softmax over the real
+label count. ``mobilenetv2`` uses the real architecture with random weights,
+so invoke cost matches production; ``tiny`` is a few layers, for exercising
+the HTTP and preprocessing paths only.
+
+    python synthetic_model.py --out /tmp/batik_synthetic.tflite
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+API_DIR = Path(__file__).resolve().parent.parent / "api"
+DEFAULT_LABELS = API_DIR / "batik_labels_v2.json"
+
+
+def num_classes_from_labels(path: Path) -> int:
+    with Path(path).open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and "classes" in data:
+        return len(data["classes"])
+    return len(data)
+
+
+def build_keras_model(arch: str, num_classes: int, size: int = 224):
+    import tensorflow as tf
+
+    if arch == "mobilenetv2":
+        return tf.keras.applications.MobileNetV2(
+            input_shape=(size, size, 3), weights=None, classes=num_classes, classifier_activation="softmax"
+        )
+    inputs = tf.keras.Input((size, size, 3))
+    x = tf.keras.layers.Conv2D(16, 3, strides=2, activation="relu")(inputs)
+    x = tf.keras.layers.DepthwiseConv2D(3, strides=2, activation="relu")(x)
+    x = tf.keras.layers.Conv2D(32, 1, activation="relu")(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(num_classes, activation="softmax")(x)
+    return tf.keras.Model(inputs, outputs)
+
+
+def build_synthetic_model(
+    out: Path, arch: str = "mobilenetv2", labels: Path = DEFAULT_LABELS, size: int = 224, seed: int = 0
+) -> Path:
+    import tensorflow as tf
+
+    # Fixed seed: the same arguments give a byte-identical model, so stored
+    # benchmark baselines can be matched to the model they were recorded on.
+    tf.keras.utils.set_random_seed(seed)
+    model = build_keras_model(arch, num_classes_from_labels(labels), size)
+    tflite = tf.lite.TFLiteConverter.from_keras_model(model).convert()
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_bytes(tflite)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--arch", choices=("mobilenetv2", "tiny"), default="mobilenetv2")
+    parser.add_argument("--labels", type=Path, default=DEFAULT_LABELS)
+    parser.add_argument("--size", type=int, default=224)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    path = build_synthetic_model(args.out, args.arch, args.labels, args.size, args.seed)
+    print(f"Wrote {path} ({path.stat().st_size / 1e6:.1f} MB, arch={args.arch})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Per-operator latency and memory report for a ``.tflite`` model.
+
+The Python TFLite runtimes expose no op-level profiler, so each operator is
+measured in isolation: the model is cut into one single-op model per node
+(same kernel, weights and quantization), and every op is invoked on the real
+activations it receives when the full model runs on the sample images. The
+sum of the per-op times is printed next to the full-model time so the
+attribution can be sanity-checked.
+
+    python tflite_profile.py ../api/batik_model.tflite --threads 1
+    python tflite_profile.py model_a.tflite --compare model_b.tflite --threads 4
+    python tflite_profile.py model_a.tflite --compare results/tflite-profile-model_b-t4.json --threads 4
+
+Needs TensorFlow for reading and rewriting the model flatbuffer; inference
+uses the same runtime as the server (see api/runtime.py).
+"""
+import argparse
+import copy
+import json
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+BENCH_DIR = Path(__file__).resolve().parent
+API_DIR = BENCH_DIR.parent / "api"
+RESULTS_DIR = BENCH_DIR / "results"
+sys.path.insert(0, str(API_DIR))
+
+import runtime  # noqa: E402
+from corpus import build_corpus, load_corpus_dir  # noqa: E402
+from serving import _signature_io, preprocess_image, resize_for_model, takes_pixels  # noqa: E402
+
+
+def _to_model_input(arr: np.ndarray, detail: dict) -> np.ndarray:
+    """Quantize the float preprocessing output when the model takes int8/uint8."""
+    dtype = detail["dtype"]
+    if np.issubdtype(dtype, np.integer):
+        scale, zero_point = detail["quantization"]
+        info = np.iinfo(dtype)
+        arr = np.clip(np.round(arr / scale + zero_point), info.min, info.max)
+    return arr.astype(dtype)
+
+
+def load_samples(model_path: Path, images: Optional[Path], count: int) -> List[np.ndarray]:
+    Interpreter = runtime.get_interpreter_class()
+    probe = Interpreter(model_path=str(model_path))
+    detail = _signature_io(probe)[0]
+    height, width = int(detail["shape"][1]), int(detail["shape"][2])
+    corpus = load_corpus_dir(images, count) if images else build_corpus(sizes=["vga", "hd"], formats=["JPEG"])
+    samples = []
+    for item in corpus[:count]:
+        image = Image.open(BytesIO(item.data))
+        if takes_pixels(detail):
+            samples.append(resize_for_model(image, (width, height))[np.newaxis])
+        else:
+            samples.append(_to_model_input(preprocess_image(image, (width, height)), detail))
+    return samples
+
+
+def _tensor_bytes(tensor) -> int:
+    from tensorflow.lite.tools import flatbuffer_utils
+
+    type_name = flatbuffer_utils.type_to_name(tensor.type).lower()
+    itemsize = 1 if type_name == "string" else np.dtype(type_name).itemsize
+    shape = tensor.shape if tensor.shape is not None else []
+    return int(np.prod(shape)) * itemsize if len(shape) else itemsize
+
+
+class ModelOps:
+    """The main subgraph of a model, and single-op models cut out of it."""
+
+    def __init__(self, model_path: Path):
+        from tensorflow.lite.tools import flatbuffer_utils
+
+        self.path = Path(model_path)
+        self.model = flatbuffer_utils.read_model(str(model_path))
+        self.subgraph = self.model.subgraphs[0]
+        self._to_bytes = flatbuffer_utils.convert_object_to_bytearray
+        self.op_names = [
+            flatbuffer_utils.opcode_to_name(self.model, op.opcodeIndex) for op in self.subgraph.operators
+        ]
+
+    def _is_constant(self, tensor_index: int) -> bool:
+        buffer = self.model.buffers[self.subgraph.tensors[tensor_index].buffer]
+        return buffer.data is not None and len(buffer.data) > 0
+
+    def variable_inputs(self, op_index: int) -> List[int]:
+        op = self.subgraph.operators[op_index]
+        return [t for t in op.inputs if t >= 0 and not self._is_constant(t)]
+
+    def describe(self, op_index: int) -> dict:
+        op = self.subgraph.operators[op_index]
+        tensors = self.subgraph.tensors
+        constants = [t for t in op.inputs if t >= 0 and self._is_constant(t)]
+        weight_bytes = sum(len(self.model.buffers[tensors[t].buffer].data) for t in constants)
+        activation_bytes = sum(_tensor_bytes(tensors[t]) for t in self.variable_inputs(op_index) + list(op.outputs))
+        output = tensors[op.outputs[0]]
+        return {
+            "index": op_index,
+            "op": self.op_names[op_index],
+            "output": output.name.decode("utf-8", "replace") if isinstance(output.name, bytes) else output.name,
+            "output_shape": [int(d) for d in output.shape] if output.shape is not None else [],
+            "weight_bytes": weight_bytes,
+            "activation_bytes": activation_bytes,
+        }
+
+    def single_op_model(self, op_index: int) -> bytes:
+        """Serialized model containing only ``op_index``, fed by its variable inputs."""
+        op = self.subgraph.operators[op_index]
+        used = {self.subgraph.tensors[t].buffer for t in list(op.inputs) + list(op.outputs) if t >= 0}
+
+        model = copy.copy(self.model)
+        # Drop every weight buffer the op doesn't read so each cut stays small.
+        empty = type(self.model.buffers[0])()
+        model.buffers = [b if i in used or i == 0 else empty for i, b in enumerate(self.model.buffers)]
+        subgraph = copy.copy(self.subgraph)
+        subgraph.operators = [op]
+        subgraph.inputs = self.variable_inputs(op_index)
+        subgraph.outputs = list(op.outputs)
+        model.subgraphs = [subgraph]
+        model.signatureDefs = []
+        return bytes(self._to_bytes(model))
+
+
+def capture_activations(model_path: Path, ops: ModelOps, samples: List[np.ndarray]) -> List[Dict[int, np.ndarray]]:
+    """Every tensor each op reads, for every sample, from a full-model run."""
+    Interpreter = runtime.get_interpreter_class()
+    interp = Interpreter(model_path=str(model_path), experimental_preserve_all_tensors=True)
+    interp.allocate_tensors()
+    input_index = _signature_io(interp)[0]["index"]
+    needed = {t for i in range(len(ops.op_names)) for t in ops.variable_inputs(i)}
+    captured = []
+    for sample in samples:
+        interp.set_tensor(input_index, sample)
+        interp.invoke()
+        captured.append({t: interp.get_tensor(t).copy() for t in needed})
+    return captured
+
+
+def _time_invokes(interp, runs: int) -> List[float]:
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        interp.invoke()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def profile_model(model_path: Path, samples: List[np.ndarray], threads: int, runs: int, warmup: int) -> dict:
+    Interpreter = runtime.get_interpreter_class()
+    ops = ModelOps(model_path)
+
+    full = Interpreter(model_path=str(model_path), num_threads=threads)
+    full.allocate_tensors()
+    input_index = _signature_io(full)[0]["index"]
+    full_times = []
+    for sample in samples:
+        full.set_tensor(input_index, sample)
+        _time_invokes(full, warmup)
+        full_times += _time_invokes(full, runs)
+
+    activations = capture_activations(model_path, ops, samples)
+    report_ops = []
+    for index in range(len(ops.op_names)):
+        entry = ops.describe(index)
+        interp = Interpreter(model_content=ops.single_op_model(index), num_threads=threads)
+        interp.allocate_tensors()
+        by_index = {d["index"]: d for d in interp.get_input_details()}
+        times = []
+        for captured in activations:
+            for tensor_index in ops.variable_inputs(index):
+                interp.set_tensor(by_index[tensor_index]["index"], captured[tensor_index])
+            _time_invokes(interp, warmup)
+            times += _time_invokes(interp, runs)
+        entry["mean_ms"] = round(statistics.fmean(times) * 1000, 4)
+        entry["min_ms"] = round(min(times) * 1000, 4)
+        report_ops.append(entry)
+
+    op_total = sum(op["mean_ms"] for op in report_ops)
+    for op in report_ops:
+        op["share"] = round(op["mean_ms"] / op_total, 4) if op_total else 0.0
+
+    by_type: Dict[str, dict] = defaultdict(lambda: {"count": 0, "mean_ms": 0.0, "weight_bytes": 0})
+    for op in report_ops:
+        group = by_type[op["op"]]
+        group["count"] += 1
+        group["mean_ms"] = round(group["mean_ms"] + op["mean_ms"], 4)
+        group["weight_bytes"] += op["weight_bytes"]
+
+    return {
+        "model": str(model_path),
+        "model_bytes": Path(model_path).stat().st_size,
+        "runtime": runtime.runtime_name(),
+        "threads": threads,
+        "samples": len(samples),
+        "runs_per_sample": runs,
+        "full_model_ms": {
+            "mean": round(statistics.fmean(full_times) * 1000, 3),
+            "p50": round(statistics.median(full_times) * 1000, 3),
+            "min": round(min(full_times) * 1000, 3),
+        },
+        "sum_of_ops_ms": round(op_total, 3),
+        "peak_activation_bytes": max((op["activation_bytes"] for op in report_ops), default=0),
+        "weight_bytes": sum(op["weight_bytes"] for op in report_ops),
+        "ops": report_ops,
+        "by_type": dict(sorted(by_type.items(), key=lambda kv: -kv[1]["mean_ms"])),
+    }
+
+
+def format_report(report: dict, top: int) -> str:
+    lines = [
+        f"{report['model']}  ({report['model_bytes'] / 1e6:.1f} MB, {len(report['ops'])} ops, "
+        f"runtime {report['runtime']}, {report['threads']} thread(s))",
+        f"  full model {report['full_model_ms']['mean']:.3f} ms mean, "
+        f"sum of isolated ops {report['sum_of_ops_ms']:.3f} ms",
+        f"  weights {report['weight_bytes'] / 2**20:.2f} MiB, "
+        f"largest op working set {report['peak_activation_bytes'] / 2**20:.2f} MiB",
+        "",
+        f"  {'#':>4} {'op':<22}{'output shape':<20}{'mean ms':>10}{'share':>8}{'weights KiB':>13}{'act KiB':>10}",
+    ]
+    ranked = sorted(report["ops"], key=lambda op: -op["mean_ms"])
+    for op in ranked[:top]:
+        lines.append(
+            f"  {op['index']:>4} {op['op']:<22}{str(op['output_shape']):<20}{op['mean_ms']:>10.3f}"
+            f"{op['share']:>8.1%}{op['weight_bytes'] / 1024:>13.1f}{op['activation_bytes'] / 1024:>10.1f}"
+        )
+    lines += ["", f"  {'op type':<22}{'count':>7}{'mean ms':>10}{'share':>8}"]
+    total = report["sum_of_ops_ms"] or 1
+    for name, group in report["by_type"].items():
+        lines.append(f"  {name:<22}{group['count']:>7}{group['mean_ms']:>10.3f}{group['mean_ms'] / total:>8.1%}")
+    return "\n".join(lines)
+
+
+def format_diff(a: dict, b: dict, top: int) -> str:
+    def change(before, after):
+        return f"{(after - before) / before:+.1%}" if before else "n/a"
+
+    lines = [
+        f"A: {a['model']}",
+        f"B: {b['model']}",
+        "",
+        f"  {'':<22}{'A':>12}{'B':>12}{'change':>10}",
+        f"  {'full model ms':<22}{a['full_model_ms']['mean']:>12.3f}{b['full_model_ms']['mean']:>12.3f}"
+        f"{change(a['full_model_ms']['mean'], b['full_model_ms']['mean']):>10}",
+        f"  {'model MB':<22}{a['model_bytes'] / 1e6:>12.2f}{b['model_bytes'] / 1e6:>12.2f}"
+        f"{change(a['model_bytes'], b['model_bytes']):>10}",
+        f"  {'ops':<22}{len(a['ops']):>12}{len(b['ops']):>12}",
+        "",
+        f"  {'op type':<22}{'A ms':>12}{'B ms':>12}{'change':>10}",
+    ]
+    for name in sorted(set(a["by_type"]) | set(b["by_type"])):
+        before = a["by_type"].get(name, {}).get("mean_ms", 0.0)
+        after = b["by_type"].get(name, {}).get("mean_ms", 0.0)
+        lines.append(f"  {name:<22}{before:>12.3f}{after:>12.3f}{change(before, after):>10}")
+
+    if [op["op"] for op in a["ops"]] == [op["op"] for op in b["ops"]]:
+        # Same graph structure (e.g. a requantized or re-trained variant): pair ops up.
+        pairs = sorted(zip(a["ops"], b["ops"]), key=lambda p: -abs(p[1]["mean_ms"] - p[0]["mean_ms"]))
+        lines += ["", "  largest per-op changes (same op sequence)",
+                  f"  {'#':>4} {'op':<22}{'A ms':>10}{'B ms':>10}{'change':>10}"]
+        for op_a, op_b in pairs[:top]:
+            lines.append(
+                f"  {op_a['index']:>4} {op_a['op']:<22}{op_a['mean_ms']:>10.3f}{op_b['mean_ms']:>10.3f}"
+                f"{change(op_a['mean_ms'], op_b['mean_ms']):>10}"
+            )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", type=Path)
+    parser.add_argument("--compare", type=Path, help="Second .tflite to profile, or a saved report .json")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--images", type=Path, help="Sample images (default: synthetic batik textures)")
+    parser.add_argument("--samples", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=10, help="Timed invokes per op per sample")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--output", type=Path, help="Report JSON (default: results/tflite-profile-<model>-t<threads>.json)")
+    args = parser.parse_args()
+
+    def run(model_path: Path) -> dict:
+        samples = load_samples(model_path, args.images, args.samples)
+        report = profile_model(model_path, samples, args.threads, args.runs, args.warmup)
+        print(format_report(report, args.top))
+        return report
+
+    report = run(args.model)
+    output = args.output or RESULTS_DIR / f"tflite-profile-{args.model.stem}-t{args.threads}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        if args.compare.suffix == ".json":
+            other = json.loads(args.compare.read_text())
+        else:
+            print()
+            other = run(args.compare)
+        print("\n" + format_diff(report, other, args.top))
+
+
+if __name__ == "__main__":
+    main()
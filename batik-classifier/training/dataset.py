@@ -0,0 +1,239 @@
+"""
+Class-folder datasets, listed exactly the way Keras' ``flow_from_directory``
+lists them, so offline tools see the same files, labels and validation
+subset the notebooks trained and validated on.
+
+    dataset/                  or    batik_ultimate.zip
+        batik-aceh/   001.jpg ...         batik_ultimate/batik-aceh/001.jpg ...
+        batik-bali/   ...                 batik_ultimate/batik-bali/...
+
+A zip archive is read in place: its central directory is indexed once and
+members are streamed to the decoders, so nothing is extracted to disk.
+"""
+import io
+import json
+import os
+import posixpath
+import sys
+import threading
+import zipfile
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# keras.preprocessing.image.DirectoryIterator.white_list_formats
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".tif", ".tiff"}
+SUBSETS = ("all", "training", "validation")
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+API_DIR = REPO_DIR / "api"
+REFERENCE_CONFIG = REPO_DIR.parent / "data" / "batik_config_mobilenet_ultimate.json"
+QUARANTINE_SUFFIX = ".quarantine.json"
+
+
+class ClassFolderDataset(NamedTuple):
+    root: Path  # a directory, or a .zip archive
+    class_names: List[str]
+    paths: List[str]  # relative to root with "/" separators; member names in an archive
+    labels: np.ndarray  # int32 class index per path
+
+    @property
+    def archive(self) -> Optional[str]:
+        return str(self.root) if is_archive(self.root) else None
+
+    def location(self, i: int) -> str:
+        """What ``decode_chunk``/``read_member`` need for sample ``i``."""
+        return self.paths[i] if self.archive else str(self.root / self.paths[i])
+
+    def select(self, indices: Sequence[int]) -> "ClassFolderDataset":
+        indices = np.asarray(indices, dtype=np.int64)
+        return self._replace(paths=[self.paths[i] for i in indices], labels=self.labels[indices])
+
+    def class_counts(self) -> np.ndarray:
+        return np.bincount(self.labels, minlength=len(self.class_names))
+
+
+def is_archive(path: Path) -> bool:
+    return Path(path).suffix.lower() == ".zip" and Path(path).is_file()
+
+
+def _class_files(directory: Path) -> List[str]:
+    # Same order as keras' _iter_valid_files: walk sorted by directory, files sorted.
+    found = []
+    for dirpath, _, files in sorted(os.walk(directory, followlinks=True), key=lambda entry: entry[0]):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                found.append(os.path.join(dirpath, name))
+    return found
+
+
+def _folder_classes(root: Path) -> Dict[str, List[str]]:
+    classes = {}
+    for entry in sorted(os.scandir(root), key=lambda e: e.name):
+        if entry.is_dir():
+            classes[entry.name] = [
+                os.path.relpath(path, root).replace(os.sep, "/") for path in _class_files(Path(entry.path))
+            ]
+    return classes
+
+
+def _archive_classes(archive: Path, prefix: Optional[str] = None) -> Dict[str, List[str]]:
+    """Class folder -> member names, from the zip's central directory alone.
+
+    ``prefix`` is the folder holding the class folders; by default the
+    deepest folder all images share (``batik_ultimate/`` in the Kaggle zip).
+    """
+    with zipfile.ZipFile(archive) as zf:
+        names = [
+            info.filename for info in zf.infolist()
+            if not info.is_dir()
+            and posixpath.splitext(info.filename)[1].lower() in IMAGE_EXTENSIONS
+            and not info.filename.startswith("__MACOSX/")
+        ]
+    if prefix is None:
+        dirs = {posixpath.dirname(name) for name in names}
+        prefix = posixpath.commonpath(list(dirs)) if dirs else ""
+        if len(dirs) == 1:
+            # Everything in one folder: that folder is the (only) class.
+            prefix = posixpath.dirname(prefix)
+    prefix = prefix.strip("/")
+    start = len(prefix) + 1 if prefix else 0
+
+    classes: Dict[str, List[Tuple[str, str]]] = {}
+    for name in names:
+        if prefix and not name.startswith(prefix + "/"):
+            continue
+        relative = name[start:]
+        if "/" not in relative:
+            continue  # files next to the class folders are ignored, as by Keras
+        classes.setdefault(relative.split("/", 1)[0], []).append((posixpath.dirname(name), name))
+    # Keras' order: directories sorted by path, files sorted within each.
+    return {cls: [name for _, name in sorted(members)] for cls, members in sorted(classes.items())}
+
+
+def list_class_folders(
+    root: Path,
+    class_names: Optional[Sequence[str]] = None,
+    subset: str = "all",
+    validation_split: float = 0.0,
+) -> ClassFolderDataset:
+    """Every image under ``root/<class>/``, labelled by its folder.
+
+    ``class_names`` fixes the label order (e.g. the served labels file); a
+    folder it doesn't name is an error, a named class without a folder just
+    has no samples. Without it the sorted folder names are used, like Keras.
+    ``validation_split`` reproduces ImageDataGenerator's split: the first
+    ``int(split * n)`` files of each class are validation, the rest training.
+    ``root`` may also be a zip archive of the same layout.
+    """
+    root = Path(root)
+    if subset not in SUBSETS:
+        raise ValueError(f"subset must be one of {SUBSETS}, got {subset!r}")
+    if subset != "all" and not 0.0 < validation_split < 1.0:
+        raise ValueError("a training/validation subset needs 0 < validation_split < 1")
+
+    by_class = _archive_classes(root) if is_archive(root) else _folder_classes(root)
+    folders = list(by_class)
+    if class_names is None:
+        class_names = folders
+    else:
+        class_names = list(class_names)
+        unknown = sorted(set(folders) - set(class_names))
+        if unknown:
+            raise ValueError(f"{len(unknown)} folders are not in the label list: {', '.join(unknown[:5])}")
+
+    paths: List[str] = []
+    labels: List[int] = []
+    for label, name in enumerate(class_names):
+        files = by_class.get(name, [])
+        if subset != "all":
+            cut = int(validation_split * len(files))
+            files = files[:cut] if subset == "validation" else files[cut:]
+        paths.extend(files)
+        labels.extend([label] * len(files))
+    return ClassFolderDataset(root, class_names, paths, np.asarray(labels, dtype=np.int32))
+
+
+def quarantine_path(source: Path) -> Path:
+    """Where ``scan.py`` puts the quarantine list of ``source`` by default."""
+    return Path(str(Path(source)) + QUARANTINE_SUFFIX)
+
+
+def load_quarantine(source: Path) -> Dict[str, str]:
+    """path -> reason for the files ``scan.py`` quarantined in ``source``
+    (empty if it was never scanned)."""
+    path = quarantine_path(source)
+    if not path.is_file():
+        return {}
+    with path.open("r", encoding="utf-8") as f:
+        return {entry["path"]: entry["error"] for entry in json.load(f)["quarantined"]}
+
+
+def drop_quarantined(dataset: ClassFolderDataset) -> ClassFolderDataset:
+    quarantined = load_quarantine(dataset.root)
+    if not quarantined:
+        return dataset
+    keep = [i for i, path in enumerate(dataset.paths) if path not in quarantined]
+    if len(keep) < len(dataset.paths):
+        print(f"Skipping {len(dataset.paths) - len(keep)} quarantined images ({quarantine_path(dataset.root)})")
+    return dataset.select(keep)
+
+
+_handles = threading.local()
+
+
+def read_member(archive: str, name: str) -> bytes:
+    """One archive member's bytes. Each thread and process keeps its own
+    open handle, so parallel readers never share a file position."""
+    cache = getattr(_handles, "archives", None)
+    if cache is None or _handles.pid != os.getpid():
+        cache = _handles.archives = {}
+        _handles.pid = os.getpid()
+    zf = cache.get(archive)
+    if zf is None:
+        zf = cache[archive] = zipfile.ZipFile(archive)
+    return zf.read(name)
+
+
+def decode_chunk(items: List[Tuple[str, str]], target_size: Tuple[int, int], fast_jpeg: bool, archive: Optional[str] = None):
+    """Process-pool worker: ``batch_classify``'s decoder, but ``items`` may
+    name members of ``archive``; those are read here, in the worker."""
+    if str(API_DIR) not in sys.path:
+        sys.path.insert(0, str(API_DIR))
+    from batch_classify import _decode_chunk
+
+    if not archive:
+        return _decode_chunk(items, target_size, fast_jpeg)
+    sources, unreadable = [], []
+    for key, name in items:
+        try:
+            sources.append((key, io.BytesIO(read_member(archive, name))))
+        except Exception as exc:
+            unreadable.append((key, f"{type(exc).__name__}: {exc}"))
+    keys, pixels, errors = _decode_chunk(sources, target_size, fast_jpeg)
+    return keys, pixels, unreadable + errors
+
+
+def split_indices(labels: np.ndarray, validation_split: float):
+    """(training, validation) indices with ImageDataGenerator's split rule:
+    the first ``int(split * n)`` samples of each class, in listing order,
+    are validation."""
+    labels = np.asarray(labels)
+    validation = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        validation.extend(members[: int(validation_split * len(members))])
+    is_validation = np.zeros(len(labels), dtype=bool)
+    is_validation[np.asarray(validation, dtype=np.int64)] = True
+    return np.flatnonzero(~is_validation), np.flatnonzero(is_validation)
+
+
+def load_reference_metrics(path: Path = REFERENCE_CONFIG) -> Optional[dict]:
+    """The accuracy/top3/top5 the training notebook reported, if the config exists."""
+    try:
+        with Path(path).open("r", encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return {key: config[key] for key in ("model", "accuracy", "top3", "top5", "class_counts") if key in config}
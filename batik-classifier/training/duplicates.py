@@ -0,0 +1,391 @@
+"""
+Near-duplicate and train/validation leakage detector.
+
+The Kaggle dataset is ~17k *augmented* images: flipped, rotated or re-cropped
+copies of the same photo can land on both sides of ``validation_split=0.2``
+and inflate validation accuracy. This tool hashes every image of a dataset
+manifest (see ``manifest.py``) with a 64-bit perceptual hash (DCT pHash, plus
+the hash of the mirrored image so horizontal flips match too), finds every
+pair within ``--distance`` bits, and groups them into clusters:
+
+    python duplicates.py /data/batik_dataset --report leakage.json
+    python duplicates.py /data/batik_dataset.manifest.json --distance 8 \\
+        --split-output /data/batik_dedup.manifest.json
+    python train.py /data/batik_dedup.manifest.json
+
+The search is a multi-index hash: the 64 bits are cut into ``--blocks``
+16-bit blocks and two hashes within ``d`` bits must agree on some block to
+within ``d // blocks`` bits, so only items sharing a nearby block value are
+ever compared. Cost grows with the number of near pairs, not N^2.
+
+The report lists each cluster with its classes and split sides, the
+validation images that have a near-duplicate in training, and clusters
+spanning several classes. ``--split-output`` writes a manifest whose split
+keeps every cluster on one side (``--drop-duplicates`` also keeps only one
+image per cluster). Hashes are cached by SHA-1 next to the manifest, so
+re-runs only hash new files. ``--embeddings`` adds pairs from an (N, D)
+array of image embeddings in manifest order (e.g. backbone features), found
+with random-hyperplane hashes through the same search and kept when their
+cosine similarity reaches ``--cosine``.
+"""
+import argparse
+import io
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from dataset import read_member
+from manifest import Manifest, build_manifest, default_manifest_path, write_manifest
+
+HASH_SIZE = 8  # 8x8 low-frequency DCT coefficients -> 64 bits
+HASH_CACHE_SUFFIX = ".phash.npz"
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)
+    return np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+
+
+_DCT = _dct_matrix(HASH_SIZE * 4)
+
+
+def _pack(bits: np.ndarray) -> np.uint64:
+    return np.packbits(bits.ravel()).view(">u8")[0].astype(np.uint64)
+
+
+def phash_pair(image) -> Tuple[np.uint64, np.uint64]:
+    """(pHash, pHash of the horizontally mirrored image) of a PIL image.
+
+    Mirroring an image flips the sign of its odd horizontal DCT
+    frequencies, so both hashes come from one transform.
+    """
+    from PIL import Image
+
+    pixels = np.asarray(image.convert("L").resize((HASH_SIZE * 4,) * 2, Image.LANCZOS), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    mirrored = low * np.where(np.arange(HASH_SIZE) % 2, -1.0, 1.0)[None, :]
+    return _pack(low > np.median(low)), _pack(mirrored > np.median(mirrored))
+
+
+def _hash_chunk(items: List[Tuple[int, str]], archive: Optional[str] = None):
+    """Process-pool worker: (index, hash, mirrored hash, ok) per item."""
+    from PIL import Image
+
+    rows = []
+    for index, location in items:
+        try:
+            source = io.BytesIO(read_member(archive, location)) if archive else location
+            with Image.open(source) as image:
+                image.draft("RGB", (HASH_SIZE * 16,) * 2)
+                plain, mirrored = phash_pair(image)
+            rows.append((index, int(plain), int(mirrored), True))
+        except Exception:
+            rows.append((index, 0, 0, False))
+    return rows
+
+
+def compute_hashes(manifest: Manifest, workers: int = 1, cache: Optional[Path] = None, chunk_size: int = 64):
+    """(hashes, mirrored hashes, ok) for every manifest row, as uint64 arrays
+    and a bool mask; rows whose SHA-1 is in ``cache`` are not decoded."""
+    count = len(manifest)
+    hashes = np.zeros(count, dtype=np.uint64)
+    mirrored = np.zeros(count, dtype=np.uint64)
+    ok = np.zeros(count, dtype=bool)
+    cached: Dict[str, int] = {}
+    if cache is not None and Path(cache).exists():
+        stored = np.load(cache)
+        cached = {sha1: i for i, sha1 in enumerate(stored["sha1"].tolist())}
+        old = (stored["hash"], stored["mirrored"], stored["ok"])
+    todo = []
+    for i, sha1 in enumerate(manifest.sha1s):
+        j = cached.get(sha1)
+        if j is None:
+            todo.append(i)
+        else:
+            hashes[i], mirrored[i], ok[i] = old[0][j], old[1][j], old[2][j]
+
+    dataset = manifest.dataset()
+    if todo:
+        print(f"Hashing {len(todo)} images ({count - len(todo)} cached) on {workers} processes")
+    started = last_report = time.perf_counter()
+    chunks = (
+        [(i, dataset.location(i)) for i in todo[start:start + chunk_size]]
+        for start in range(0, len(todo), chunk_size)
+    )
+    in_flight: deque = deque()
+    done = 0
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        while True:
+            while len(in_flight) < 2 * max(1, workers):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                in_flight.append(pool.submit(_hash_chunk, chunk, dataset.archive))
+            if not in_flight:
+                break
+            for i, plain, flipped, success in in_flight.popleft().result():
+                hashes[i], mirrored[i], ok[i] = plain, flipped, success
+                done += 1
+            if time.perf_counter() - last_report > 10:
+                last_report = time.perf_counter()
+                print(f"{done}/{len(todo)} images, {done / (last_report - started):.1f} images/s")
+
+    if cache is not None and todo:
+        np.savez(cache, sha1=np.asarray(manifest.sha1s), hash=hashes, mirrored=mirrored, ok=ok)
+    return hashes, mirrored, ok
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return _POPCOUNT[values.view(np.uint8)].reshape(len(values), 8).sum(axis=1)
+
+
+def _block_masks(bits: int, radius: int) -> np.ndarray:
+    """Every ``bits``-bit value with at most ``radius`` bits set."""
+    masks = [0]
+    frontier = [0]
+    for _ in range(radius):
+        frontier = sorted({m | (1 << b) for m in frontier for b in range(bits) if not m >> b & 1})
+        masks.extend(frontier)
+    return np.asarray(masks, dtype=np.uint64)
+
+
+def near_pairs(
+    codes: np.ndarray,
+    distance: int,
+    queries: Optional[np.ndarray] = None,
+    blocks: int = 4,
+) -> np.ndarray:
+    """(i, j) pairs, i < j, with ``popcount(queries[i] ^ codes[j]) <= distance``.
+
+    ``queries`` defaults to ``codes``; passing the mirrored hashes finds
+    flipped copies. Multi-index search: a pair within ``distance`` bits has
+    some 64/``blocks``-bit block within ``distance // blocks`` bits.
+    """
+    codes = np.asarray(codes, dtype=np.uint64)
+    queries = codes if queries is None else np.asarray(queries, dtype=np.uint64)
+    width = 64 // blocks
+    block_mask = np.uint64((1 << width) - 1)
+    masks = _block_masks(width, distance // blocks)
+    found = []
+    for b in range(blocks):
+        shift = np.uint64(b * width)
+        keys = (codes >> shift) & block_mask
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        query_keys = (queries >> shift) & block_mask
+        for mask in masks:
+            probe = query_keys ^ mask
+            lo = np.searchsorted(sorted_keys, probe, side="left")
+            hi = np.searchsorted(sorted_keys, probe, side="right")
+            counts = hi - lo
+            if not counts.any():
+                continue
+            left = np.repeat(np.arange(len(queries)), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            right = order[np.repeat(lo, counts) + offsets]
+            keep = left != right
+            left, right = left[keep], right[keep]
+            close = popcount(queries[left] ^ codes[right]) <= distance
+            found.append(np.stack([np.minimum(left, right), np.maximum(left, right)], axis=1)[close])
+    if not found:
+        return np.zeros((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(found), axis=0)
+
+
+def embedding_pairs(embeddings: np.ndarray, cosine: float, seed: int = 0, blocks: int = 4) -> np.ndarray:
+    """Pairs with cosine similarity >= ``cosine``, via 64 random-hyperplane
+    bits searched like the image hashes (approximate: the Hamming radius is
+    twice the expected one for that angle)."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    planes = np.random.default_rng(seed).standard_normal((embeddings.shape[1], 64)).astype(np.float32)
+    codes = np.packbits(embeddings @ planes > 0, axis=1).view(">u8")[:, 0].astype(np.uint64)
+    radius = min(int(np.ceil(2 * 64 * np.arccos(np.clip(cosine, -1.0, 1.0)) / np.pi)), 4 * blocks - 1)
+    pairs = near_pairs(codes, radius, blocks=blocks)
+    similarity = np.einsum("ij,ij->i", embeddings[pairs[:, 0]], embeddings[pairs[:, 1]])
+    return pairs[similarity >= cosine]
+
+
+def clusters_from_pairs(count: int, pairs: np.ndarray) -> np.ndarray:
+    """Connected components: a cluster id per item (the smallest member index)."""
+    parent = np.arange(count)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    return np.asarray([find(i) for i in range(count)])
+
+
+def dedup_split(labels: np.ndarray, cluster: np.ndarray, validation_split: float) -> np.ndarray:
+    """Validation flags that keep each cluster on one side.
+
+    Like ImageDataGenerator, each class's validation set is taken from the
+    start of its listing, but whole clusters at a time; a cluster counts
+    toward the class of its first image.
+    """
+    validation = np.zeros(len(labels), dtype=bool)
+    members: Dict[int, List[int]] = {}
+    for i, c in enumerate(cluster):
+        members.setdefault(int(c), []).append(i)
+    by_class: Dict[int, List[int]] = {}
+    for c in sorted(members):
+        by_class.setdefault(int(labels[c]), []).append(c)
+    for label, roots in by_class.items():
+        target = int(validation_split * sum(len(members[c]) for c in roots))
+        taken = 0
+        for c in roots:
+            if taken >= target:
+                break
+            validation[members[c]] = True
+            taken += len(members[c])
+    return validation
+
+
+def leakage_report(manifest: Manifest, cluster: np.ndarray, ok: np.ndarray, settings: dict) -> dict:
+    names = manifest.class_names
+    members: Dict[int, List[int]] = {}
+    for i, c in enumerate(cluster):
+        members.setdefault(int(c), []).append(i)
+    groups = [rows for rows in members.values() if len(rows) > 1]
+    groups.sort(key=len, reverse=True)
+
+    leaked = np.zeros(len(manifest), dtype=bool)
+    clusters = []
+    for rows in groups:
+        sides = manifest.validation[rows]
+        cross_split = bool(sides.any() and not sides.all())
+        if cross_split:
+            leaked[np.asarray(rows)[sides]] = True
+        clusters.append({
+            "size": len(rows),
+            "cross_split": cross_split,
+            "classes": sorted({names[manifest.labels[i]] for i in rows}),
+            "members": [
+                {"path": manifest.paths[i], "class": names[manifest.labels[i]],
+                 "subset": "validation" if manifest.validation[i] else "training"}
+                for i in rows
+            ],
+        })
+    val_counts = np.bincount(manifest.labels[manifest.validation], minlength=len(names))
+    leak_counts = np.bincount(manifest.labels[leaked], minlength=len(names))
+    return {
+        "source": str(manifest.source),
+        "images": len(manifest),
+        "settings": settings,
+        "summary": {
+            "unhashable": int(np.count_nonzero(~ok)),
+            "clusters": len(groups),
+            "images_in_clusters": int(sum(len(rows) for rows in groups)),
+            "redundant_images": int(sum(len(rows) - 1 for rows in groups)),
+            "cross_split_clusters": sum(c["cross_split"] for c in clusters),
+            "cross_class_clusters": sum(len(c["classes"]) > 1 for c in clusters),
+            "validation_images": int(manifest.validation.sum()),
+            "leaked_validation_images": int(leaked.sum()),
+        },
+        "per_class": {
+            names[label]: {"validation": int(val_counts[label]), "leaked": int(leak_counts[label])}
+            for label in range(len(names))
+        },
+        "clusters": clusters,
+    }
+
+
+def _print_summary(report: dict) -> None:
+    summary = report["summary"]
+    print(f"\n{report['images']} images: {summary['clusters']} near-duplicate clusters holding "
+          f"{summary['images_in_clusters']} images ({summary['redundant_images']} redundant)")
+    if summary["validation_images"]:
+        share = summary["leaked_validation_images"] / summary["validation_images"]
+        print(f"Leakage: {summary['leaked_validation_images']}/{summary['validation_images']} validation images "
+              f"({share:.1%}) have a near-duplicate in training ({summary['cross_split_clusters']} clusters)")
+    if summary["cross_class_clusters"]:
+        print(f"{summary['cross_class_clusters']} clusters span several classes (possible label noise)")
+    worst = sorted(report["per_class"].items(), key=lambda item: -item[1]["leaked"])[:10]
+    worst = [(name, stats) for name, stats in worst if stats["leaked"]]
+    if worst:
+        print("\nMost leaked classes:")
+        for name, stats in worst:
+            print(f"  {name:<30} {stats['leaked']:>4}/{stats['validation']} validation images")
+    if summary["unhashable"]:
+        print(f"\n{summary['unhashable']} images could not be decoded and were skipped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", type=Path, help="Dataset manifest, or a dataset folder/zip (its manifest is built)")
+    parser.add_argument("--distance", type=int, default=10, help="Max Hamming distance between 64-bit pHashes")
+    parser.add_argument("--blocks", type=int, choices=(4, 8), default=4, help="Multi-index blocks")
+    parser.add_argument("--no-mirror", action="store_true", help="Don't match horizontally flipped copies")
+    parser.add_argument("--embeddings", type=Path, help=".npy of (N, D) embeddings in manifest order")
+    parser.add_argument("--cosine", type=float, default=0.95, help="Min cosine similarity for --embeddings pairs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Hashing processes")
+    parser.add_argument("--report", type=Path, help="Write the leakage report as JSON")
+    parser.add_argument("--split-output", type=Path, help="Write a manifest with a cluster-aware split")
+    parser.add_argument("--drop-duplicates", action="store_true",
+                        help="With --split-output, keep only the first image of each cluster")
+    args = parser.parse_args()
+
+    if Manifest.is_manifest(args.dataset):
+        manifest_path = args.dataset
+    else:
+        manifest_path = default_manifest_path(args.dataset)
+        previous = Manifest(manifest_path).validation_split if manifest_path.exists() else 0.2
+        build_manifest(args.dataset, manifest_path, validation_split=previous, workers=args.workers)
+    manifest = Manifest(manifest_path)
+    cache = Path(str(manifest_path)[: -len(".json")] + HASH_CACHE_SUFFIX)
+
+    started = time.perf_counter()
+    hashes, mirrored, ok = compute_hashes(manifest, args.workers, cache)
+    hashed = time.perf_counter()
+    valid = np.flatnonzero(ok)
+    pairs = [near_pairs(hashes[valid], args.distance, blocks=args.blocks)]
+    if not args.no_mirror:
+        pairs.append(near_pairs(hashes[valid], args.distance, queries=mirrored[valid], blocks=args.blocks))
+    pairs = [valid[p] for p in pairs]
+    if args.embeddings:
+        embeddings = np.load(args.embeddings)
+        if len(embeddings) != len(manifest):
+            raise SystemExit(f"{args.embeddings} has {len(embeddings)} rows, the manifest {len(manifest)}")
+        pairs.append(embedding_pairs(embeddings, args.cosine, blocks=args.blocks))
+    pairs = np.concatenate(pairs)
+    cluster = clusters_from_pairs(len(manifest), pairs)
+    print(f"Hashing {hashed - started:.1f}s, search {time.perf_counter() - hashed:.2f}s, {len(np.unique(pairs, axis=0))} pairs")
+
+    settings = {
+        "distance": args.distance, "mirror": not args.no_mirror,
+        "embeddings": str(args.embeddings) if args.embeddings else None,
+        "cosine": args.cosine if args.embeddings else None, "manifest": str(manifest_path),
+    }
+    report = leakage_report(manifest, cluster, ok, settings)
+    _print_summary(report)
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Report -> {args.report}")
+
+    if args.split_output:
+        validation = dedup_split(manifest.labels, cluster, manifest.validation_split)
+        keep = np.flatnonzero(cluster == np.arange(len(manifest))) if args.drop_duplicates else None
+        rule = f"dedup(phash<={args.distance})" + (", one per cluster" if args.drop_duplicates else "")
+        write_manifest(args.split_output, manifest.with_split(validation, rule, keep))
+        kept = len(manifest) if keep is None else len(keep)
+        kept_val = int(validation.sum() if keep is None else validation[keep].sum())
+        print(f"Split -> {args.split_output} ({kept} images, {kept_val} validation)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+Offline evaluation of the served model on a class-folder dataset.
+
+Decodes images with the server's preprocessing on a process pool, runs
+batched inference on one or more interpreters in threads, and reports
+top-1/3/5, per-class accuracy, the confusion matrix and images/sec next to
+the numbers the training notebook recorded in
+``data/batik_config_mobilenet_ultimate.json``.
+
+    python evaluate.py /data/batik_dataset
+    python evaluate.py /data/batik_dataset --subset validation --validation-split 0.2 \\
+        --output eval.json --confusion-csv confusion.csv
+    python evaluate.py /data/batik_dataset --workers 8 --interpreters 2 --threads 2
+    python evaluate.py /data/batik_shards      # built by shards.py: no decoding at all
+    python evaluate.py /data/batik_ultimate.zip  # a zip of the class folders, read in place
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from dataset import (
+    API_DIR,
+    SUBSETS,
+    ClassFolderDataset,
+    decode_chunk,
+    load_reference_metrics,
+)
+from manifest import open_dataset
+from shards import ShardDataset
+
+sys.path.insert(0, str(API_DIR))
+
+from batch_classify import LABEL_CANDIDATES, MODEL_CANDIDATES  # noqa: E402
+from serving import (  # noqa: E402
+    BatchPredictor,
+    _load_class_names,
+    _resolve_first_existing,
+    normalize_batch,
+    top_k_indices,
+)
+
+TOP_K = (1, 3, 5)
+
+
+def normalize(pixels: np.ndarray, input_scale: str) -> np.ndarray:
+    """``serving`` is what the API feeds the model ([-1, 1]); ``unit`` is the
+    notebooks' ``rescale=1./255`` ([0, 1])."""
+    if input_scale == "unit":
+        return pixels.astype(np.float32) / 255.0
+    return normalize_batch(pixels)
+
+
+class Evaluation:
+    """Accumulates predictions per sample index and turns them into metrics."""
+
+    def __init__(self, dataset: ClassFolderDataset, max_k: int):
+        self.dataset = dataset
+        self.top = np.full((len(dataset.paths), max_k), -1, dtype=np.int32)
+        self.confidence = np.zeros(len(dataset.paths), dtype=np.float32)
+        self.done = np.zeros(len(dataset.paths), dtype=bool)
+        self.errors: List[dict] = []
+
+    def add(self, indices: np.ndarray, scores: np.ndarray) -> None:
+        top = top_k_indices(scores, self.top.shape[1])
+        self.top[indices] = top
+        self.confidence[indices] = scores[np.arange(len(scores)), top[:, 0]]
+        self.done[indices] = True
+
+    def add_error(self, index: int, error: str) -> None:
+        self.errors.append({"path": self.dataset.paths[index], "error": error})
+
+    def report(self) -> dict:
+        class_names = self.dataset.class_names
+        num_classes = len(class_names)
+        labels = self.dataset.labels[self.done]
+        top = self.top[self.done]
+        hits = top == labels[:, None]
+
+        confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        np.add.at(confusion, (labels, top[:, 0]), 1)
+        support = confusion.sum(axis=1)
+        correct = np.diag(confusion)
+
+        per_class = []
+        for i, name in enumerate(class_names):
+            row = confusion[i].copy()
+            row[i] = 0
+            confused = int(row.argmax()) if row.any() else None
+            per_class.append({
+                "class": name,
+                "support": int(support[i]),
+                "correct": int(correct[i]),
+                "accuracy": float(correct[i] / support[i]) if support[i] else None,
+                "most_confused_with": class_names[confused] if confused is not None else None,
+                "most_confused_count": int(row[confused]) if confused is not None else 0,
+            })
+
+        evaluated = int(self.done.sum())
+        metrics = {}
+        for k in TOP_K:
+            if k <= top.shape[1]:
+                metrics["accuracy" if k == 1 else f"top{k}"] = float(hits[:, :k].any(axis=1).mean()) if evaluated else None
+        accuracies = [c["accuracy"] for c in per_class if c["accuracy"] is not None]
+        metrics["mean_per_class_accuracy"] = float(np.mean(accuracies)) if accuracies else None
+        return {
+            "samples": len(self.dataset.paths),
+            "evaluated": evaluated,
+            "failed": len(self.errors),
+            "metrics": metrics,
+            "per_class": per_class,
+            "confusion_matrix": confusion.tolist(),
+            "errors": self.errors,
+        }
+
+
+def _index_chunks(dataset: ClassFolderDataset, size: int):
+    for start in range(0, len(dataset.paths), size):
+        stop = min(start + size, len(dataset.paths))
+        yield [(str(i), dataset.location(i)) for i in range(start, stop)]
+
+
+def _decoded_batches(pool, dataset, batch_size, target_size, workers, fast_jpeg, timings) -> Iterator[tuple]:
+    """(sample indices, uint8 pixels, errors) per batch, decoded on ``pool``."""
+    chunks = _index_chunks(dataset, batch_size)
+    in_flight: deque = deque()
+    try:
+        while True:
+            while len(in_flight) < 2 * max(1, workers):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                in_flight.append(pool.submit(decode_chunk, chunk, target_size, fast_jpeg, dataset.archive))
+            if not in_flight:
+                return
+            wait_started = time.perf_counter()
+            keys, pixels, errors = in_flight.popleft().result()
+            timings["decode_wait_s"] += time.perf_counter() - wait_started
+            yield np.array(keys, dtype=np.int64), pixels, [(int(key), error) for key, error in errors]
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def evaluate(
+    dataset: ClassFolderDataset,
+    model_path: Path,
+    batch_size: int = 32,
+    workers: int = 1,
+    interpreters: int = 1,
+    threads: Optional[int] = None,
+    fast_jpeg: bool = False,
+    input_scale: str = "serving",
+    shards: Optional[ShardDataset] = None,
+) -> dict:
+    """Evaluate ``dataset``, decoding it on ``workers`` processes, or read the
+    already-preprocessed pixels from ``shards`` (built from that dataset)."""
+    # Workers start from a fresh forkserver (spawn where there is none), never
+    # by forking this process: the pool only starts them at the first
+    # submit(), when the interpreters below and their threads already exist.
+    decode_pool = None
+    if shards is None:
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        decode_pool = ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context(start_method))
+    replicas = [BatchPredictor(model_path, batch_size, threads) for _ in range(max(1, interpreters))]
+    predictors: "queue.Queue[BatchPredictor]" = queue.Queue()
+    for predictor in replicas:
+        predictors.put(predictor)
+    probe = replicas[0]
+    problem = None
+    if probe.num_classes != len(dataset.class_names):
+        problem = f"Model has {probe.num_classes} outputs but the labels list {len(dataset.class_names)} classes"
+    elif shards is not None and shards.image_shape[:2] != probe.target_size[::-1]:
+        problem = f"Shards hold {shards.image_shape[:2]} images but the model takes {probe.target_size[::-1]}"
+    if problem:
+        if decode_pool is not None:
+            decode_pool.shutdown()
+        raise SystemExit(problem)
+
+    result = Evaluation(dataset, min(max(TOP_K), probe.num_classes))
+    if shards is not None:
+        result.errors.extend(shards.index["errors"])
+    timings = {"decode_wait_s": 0.0, "inference_s": 0.0}
+
+    def infer(indices: np.ndarray, pixels: np.ndarray):
+        predictor = predictors.get()
+        try:
+            started = time.perf_counter()
+            scores = predictor.predict(pixels if predictor.takes_pixels else normalize(pixels, input_scale))
+            return indices, scores, time.perf_counter() - started
+        finally:
+            predictors.put(predictor)
+
+    def collect(future) -> None:
+        indices, scores, seconds = future.result()
+        result.add(indices, scores)
+        timings["inference_s"] += seconds
+
+    if shards is not None:
+        source = ((indices, pixels, []) for indices, pixels, _ in shards.batches(probe.batch_size))
+    else:
+        source = _decoded_batches(decode_pool, dataset, probe.batch_size, probe.target_size, workers, fast_jpeg, timings)
+    infer_pool = ThreadPoolExecutor(max_workers=max(1, interpreters))
+    inferring: deque = deque()
+    started = last_report = time.perf_counter()
+    try:
+        for indices, pixels, errors in source:
+            for index, error in errors:
+                result.add_error(index, error)
+            if len(indices):
+                inferring.append(infer_pool.submit(infer, indices, pixels))
+            while len(inferring) > max(1, interpreters):
+                collect(inferring.popleft())
+
+            if time.perf_counter() - last_report > 10:
+                last_report = time.perf_counter()
+                done = int(result.done.sum()) + len(result.errors)
+                print(f"{done}/{len(dataset.paths)} images, {done / (last_report - started):.1f} images/s")
+        while inferring:
+            collect(inferring.popleft())
+    finally:
+        source.close()
+        if decode_pool is not None:
+            decode_pool.shutdown(cancel_futures=True)
+        infer_pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    report = result.report()
+    report["throughput"] = {
+        "seconds": elapsed,
+        "images_per_sec": report["evaluated"] / elapsed if elapsed else 0.0,
+        "batch_size": probe.batch_size,
+        "decode_workers": workers if shards is None else 0,
+        "interpreters": interpreters,
+        "interpreter_threads": threads,
+        **timings,
+    }
+    return report
+
+
+def _print_summary(report: dict, reference: Optional[dict]) -> None:
+    metrics = report["metrics"]
+    print(f"\nEvaluated {report['evaluated']}/{report['samples']} images ({report['failed']} failed to decode)")
+    print(f"{'metric':<26}{'this run':>10}{'notebook':>10}{'delta':>9}")
+    for key in ("accuracy", "top3", "top5", "mean_per_class_accuracy"):
+        value = metrics.get(key)
+        if value is None:
+            continue
+        ref = reference.get(key) if reference else None
+        ref_text = f"{ref * 100:9.2f}%" if ref is not None else f"{'-':>10}"
+        delta_text = f"{(value - ref) * 100:+8.2f}" if ref is not None else f"{'':>9}"
+        print(f"{key:<26}{value * 100:9.2f}%{ref_text}{delta_text}")
+
+    graded = [c for c in report["per_class"] if c["accuracy"] is not None]
+    print("\nWeakest classes:")
+    for entry in sorted(graded, key=lambda c: c["accuracy"])[:10]:
+        confused = f" (-> {entry['most_confused_with']} x{entry['most_confused_count']})" if entry["most_confused_with"] else ""
+        print(f"  {entry['class']:<28}{entry['accuracy'] * 100:6.1f}%  n={entry['support']}{confused}")
+
+    throughput = report["throughput"]
+    print(
+        f"\n{throughput['images_per_sec']:.1f} images/s over {throughput['seconds']:.1f}s "
+        f"(inference {throughput['inference_s']:.1f}s, waiting on decode {throughput['decode_wait_s']:.1f}s)"
+    )
+
+
+def _write_confusion_csv(path: Path, report: dict, class_names: List[str]) -> None:
+    with path.open("w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["true \\ predicted"] + class_names)
+        for name, row in zip(class_names, report["confusion_matrix"]):
+            writer.writerow([name] + row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", type=Path,
+                        help="Class-folder dataset (one sub-folder per class), a zip of one, its manifest, or a shard directory")
+    parser.add_argument("--model", type=Path, default=os.environ.get("BATIK_MODEL_PATH"))
+    parser.add_argument("--labels", type=Path, default=os.environ.get("BATIK_LABELS_PATH"),
+                        help="Fixes the class order; defaults to the served labels file")
+    parser.add_argument("--subset", choices=SUBSETS, default="all")
+    parser.add_argument("--validation-split", type=float, default=0.2,
+                        help="ImageDataGenerator validation_split used with --subset (a manifest has its own split)")
+    parser.add_argument("--limit", type=int, help="Evaluate an evenly spaced sample of this many images")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Decode processes")
+    parser.add_argument("--interpreters", type=int, default=1, help="Interpreters running batches concurrently")
+    parser.add_argument("--threads", type=int, default=None, help="Threads per interpreter")
+    parser.add_argument("--fast-jpeg", action="store_true",
+                        help="Decode large JPEGs at reduced scale (faster; pixels differ slightly from the server)")
+    parser.add_argument("--input-scale", choices=("serving", "unit"), default="serving",
+                        help="serving: x/127.5-1 like the API; unit: x/255 like the notebooks' rescale "
+                             "(ignored for export.py models, which normalize their own uint8 input)")
+    parser.add_argument("--reference", type=Path, default=None, help="Config JSON with the notebook's metrics")
+    parser.add_argument("--output", type=Path, help="Write the full report as JSON")
+    parser.add_argument("--confusion-csv", type=Path, help="Write the confusion matrix as CSV")
+    args = parser.parse_args()
+
+    model_path = args.model or _resolve_first_existing(MODEL_CANDIDATES)
+    class_names = _load_class_names(args.labels or _resolve_first_existing(LABEL_CANDIDATES))
+    shards = None
+    if ShardDataset.is_shard_dir(args.dataset):
+        if args.subset != "all" or args.limit:
+            parser.error("--subset/--limit apply to image folders; build shards of the subset instead")
+        shards = ShardDataset(args.dataset)
+        if shards.class_names != class_names:
+            raise SystemExit(f"{args.dataset} was built with a different class order than the labels file")
+        dataset = shards.as_class_folders()
+    else:
+        dataset = open_dataset(args.dataset, class_names, args.subset, args.validation_split)
+    if args.limit and args.limit < len(dataset.paths):
+        dataset = dataset.select(np.linspace(0, len(dataset.paths) - 1, args.limit).astype(np.int64))
+    if not len(dataset.paths):
+        raise SystemExit(f"No images found under {args.dataset}")
+    print(f"{len(dataset.paths)} images in {np.count_nonzero(dataset.class_counts())} classes ({args.subset}), model {model_path}")
+
+    report = evaluate(
+        dataset, Path(model_path), args.batch_size, args.workers, args.interpreters,
+        args.threads, args.fast_jpeg, args.input_scale, shards,
+    )
+    report["config"] = {
+        "dataset": str(args.dataset),
+        "model": str(model_path),
+        "shards": shards is not None,
+        "subset": args.subset,
+        "validation_split": args.validation_split if args.subset != "all" else None,
+        "input_scale": args.input_scale,
+        "fast_jpeg": shards.index["preprocessing"].endswith("(fast_jpeg)") if shards else args.fast_jpeg,
+    }
+    reference = load_reference_metrics(args.reference) if args.reference else load_reference_metrics()
+    report["reference"] = reference
+    _print_summary(report, reference)
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Report -> {args.output}")
+    if args.confusion_csv:
+        _write_confusion_csv(args.confusion_csv, report, dataset.class_names)
+        print(f"Confusion matrix -> {args.confusion_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Export a trained Keras model to a serving TFLite model with the
+preprocessing inside the graph.
+
+The exported model takes the decoded upload as uint8 pixels and does the
+resize, the normalization and (optionally) softmax and top-k itself, so the
+server only decodes, crops and hands over the bytes; the per-pixel float
+math runs in TFLite's kernels instead of NumPy. Its named signature is::
+
+    serving_default: image (N, S, S, 3) uint8
+                  -> probabilities (N, classes) float32
+                     [top_k_scores (N, k) float32, top_k_indices (N, k) int32]
+                     [embeddings (N, D) float32]
+
+    python export.py runs/mobilenet/best_model_batik.keras --output ../api/batik_model.tflite
+    python export.py final_model_batik.h5 --output batik_unit.tflite
+    python export.py other_model.keras --input-scale serving --output batik_serving.tflite
+    python export.py best_model_batik.keras --upload-size 256 --top-k 5 --output batik_256.tflite
+    python export.py best_model_batik.keras --embeddings --output ../api/batik_model.tflite
+
+``--input-scale`` must match how the model was trained: ``serving`` is the
+API's ``x/127.5 - 1``, ``unit`` the notebooks' ``rescale=1./255`` (the default
+for any model not from ``train.py``), ``none`` a model that scales its own
+input (``train.py``'s models, and the default for them). ``--upload-size`` is the square the server resizes uploads to
+before handing them over (default: the model's input size, i.e. no resize in
+the graph); a larger one is resized in the graph with TFLite's bilinear
+kernel, which does not antialias like Pillow's. ``--embeddings`` adds the
+globally average-pooled backbone features (``train.py``'s ``features`` layer,
+or the model's last ``GlobalAveragePooling2D``) as a second output, computed in
+the same invoke as the scores; the API's ``/embed`` serves them.
+
+The server (``serving.py``) and the offline tools recognise such a model by
+its unnormalized uint8 input and skip their own normalization.
+"""
+import argparse
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+import keras  # noqa: E402
+import tensorflow as tf  # noqa: E402
+
+INPUT_SCALES = {
+    "serving": lambda x: x / 127.5 - 1.0,
+    "unit": lambda x: x / 255.0,
+    "none": lambda x: x,
+}
+SIGNATURE = "serving_default"
+
+
+def default_input_scale(model: keras.Model) -> str:
+    # train.py names its models batik_<backbone> and puts the scaling inside;
+    # the notebooks' models were trained on ImageDataGenerator(rescale=1./255).
+    return "none" if model.name.startswith("batik_") else "unit"
+
+
+def feature_layer(model: keras.Model) -> Optional[keras.layers.Layer]:
+    """The pooled-features layer: ``train.py``'s ``features``, else the last
+    top-level ``GlobalAveragePooling2D`` (the notebooks' models)."""
+    try:
+        return model.get_layer("features")
+    except ValueError:
+        pass
+    pools = [layer for layer in model.layers if isinstance(layer, keras.layers.GlobalAveragePooling2D)]
+    return pools[-1] if pools else None
+
+
+def serving_function(
+    model: keras.Model,
+    input_scale: str,
+    upload_size: Optional[int] = None,
+    softmax: bool = False,
+    top_k: int = 0,
+    embeddings: bool = False,
+) -> Tuple[Callable, tf.TensorSpec]:
+    """(uint8 uploads -> the named outputs, its input spec)."""
+    height, width = model.input_shape[1:3]
+    upload = (upload_size or height, upload_size or width)
+    scale = INPUT_SCALES[input_scale]
+    if embeddings:
+        layer = feature_layer(model)
+        if layer is None:
+            raise ValueError(f"{model.name} has no 'features' or GlobalAveragePooling2D layer to embed from")
+        # Same layers and weights, one forward pass, two outputs.
+        network = keras.Model(model.inputs, [model.outputs[0], layer.output], name=model.name)
+    else:
+        network = model
+
+    def serve(image):
+        x = tf.cast(image, tf.float32)
+        if upload != (height, width):
+            x = tf.image.resize(x, (height, width), method="bilinear")
+        if embeddings:
+            scores, features = network(scale(x), training=False)
+        else:
+            scores = network(scale(x), training=False)
+        if softmax:
+            scores = tf.nn.softmax(scores)
+        outputs = {"probabilities": scores}
+        if top_k:
+            outputs["top_k_scores"], outputs["top_k_indices"] = tf.math.top_k(scores, k=top_k)
+        if embeddings:
+            outputs["embeddings"] = features
+        return outputs
+
+    return serve, tf.TensorSpec((None,) + upload + (3,), tf.uint8, name="image")
+
+
+def convert(model: keras.Model, serve: Callable, spec: tf.TensorSpec) -> bytes:
+    """TFLite flatbuffer of ``serve``, with its input/output names kept as
+    the ``serving_default`` signature (via a temporary SavedModel, which is
+    what gets Keras 3 weights frozen into the graph as constants)."""
+    archive = keras.export.ExportArchive()
+    archive.track(model)
+    archive.add_endpoint(SIGNATURE, serve, input_signature=[spec])
+    with tempfile.TemporaryDirectory(prefix="batik-export-") as tmp:
+        archive.write_out(tmp, verbose=False)
+        return tf.lite.TFLiteConverter.from_saved_model(tmp, signature_keys=[SIGNATURE]).convert()
+
+
+def check(tflite: bytes, serve: Callable, spec: tf.TensorSpec, samples: int = 4, seed: int = 0) -> float:
+    """Largest probability (and embedding) difference between the TFLite
+    model and ``serve`` run by TensorFlow, on random uploads (inf if either
+    gives NaN)."""
+    interpreter = tf.lite.Interpreter(model_content=tflite)
+    runner = interpreter.get_signature_runner(SIGNATURE)
+    images = np.random.default_rng(seed).integers(0, 256, (samples, 1) + tuple(spec.shape[1:]), dtype=np.uint8)
+    worst = 0.0
+    for image in images:
+        got = runner(image=image)
+        expected = serve(tf.constant(image))
+        for name in ("probabilities", "embeddings"):
+            if name not in got:
+                continue
+            difference = np.abs(got[name] - np.asarray(expected[name])).max()
+            worst = max(worst, float(difference) if np.isfinite(difference) else float("inf"))
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", type=Path, help="Trained Keras model (.keras or .h5)")
+    parser.add_argument("--output", type=Path, required=True, help="TFLite model to write")
+    parser.add_argument("--input-scale", choices=sorted(INPUT_SCALES),
+                        help="Normalization the model was trained with (default: none for train.py models, else unit)")
+    parser.add_argument("--upload-size", type=int, help="Side of the square uint8 input (default: the model's input size)")
+    parser.add_argument("--softmax", action="store_true", help="Apply softmax (for models that output logits)")
+    parser.add_argument("--top-k", type=int, default=0, help="Also output the k best scores and class indices")
+    parser.add_argument("--embeddings", action="store_true",
+                        help="Also output the pooled backbone features (for the API's /embed)")
+    args = parser.parse_args()
+
+    model = keras.models.load_model(args.model, compile=False)
+    num_classes = int(model.output_shape[-1])
+    if not 0 <= args.top_k <= num_classes:
+        raise SystemExit(f"--top-k must be between 0 and {num_classes}")
+    input_scale = args.input_scale or default_input_scale(model)
+    upload_size = args.upload_size or int(model.input_shape[1])
+    print(f"{args.model.name}: input {model.input_shape[1:]}, {num_classes} classes; "
+          f"baking in {input_scale} scaling from {upload_size}x{upload_size} uint8")
+
+    try:
+        serve, spec = serving_function(model, input_scale, args.upload_size, args.softmax, args.top_k, args.embeddings)
+    except ValueError as exc:
+        raise SystemExit(str(exc)) from exc
+    tflite = convert(model, serve, spec)
+    worst = check(tflite, serve, spec)
+    if not worst < 1e-3:
+        raise SystemExit(f"TFLite output differs from TensorFlow's by {worst}; not writing {args.output}")
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_bytes(tflite)
+    print(f"Wrote {args.output} ({len(tflite) / 1e6:.1f} MB); max |TFLite - TF| = {worst:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Cached backbone features for phase 1 (frozen backbone) training.
+
+While the backbone is frozen its output for a given input never changes, so
+phase 1 only needs each image's pooled features once. ``build_cache`` runs
+the dataset through the backbone once unaugmented, plus ``passes`` times
+with fixed, seeded augmentations, and stores the features as float16:
+
+    cache/
+        index.json            backbone, image size, passes, seed, classes, sources
+        train-features.npy    (passes + 1, N, D) float16; [0] is unaugmented
+        train-labels.npy      (N,) int16
+        val-features.npy      (M, D) float16
+        val-labels.npy        (M,) int16
+
+MobileNetV2 gives D=1280: 17k images x 5 passes is about 220 MB. Each epoch
+of ``feature_datasets`` picks one stored pass per image at random, so the
+head still sees augmented views. A cache is reused when its ``index.json``
+matches the requested backbone, weights, image size, passes, seed and
+sources; anything else rebuilds it.
+"""
+import json
+import shutil
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import keras
+import numpy as np
+import tensorflow as tf
+
+FORMAT_VERSION = 1
+
+
+def _extract(extractor: keras.Model, dataset: tf.data.Dataset) -> Tuple[np.ndarray, np.ndarray]:
+    run = tf.function(lambda images: extractor(images, training=False), reduce_retracing=True)
+    features, labels = [], []
+    for images, onehot in dataset:
+        features.append(run(images).numpy().astype(np.float16))
+        labels.append(np.argmax(onehot.numpy(), axis=-1).astype(np.int16))
+    if not features:
+        return np.zeros((0, extractor.output.shape[-1]), np.float16), np.zeros(0, np.int16)
+    return np.concatenate(features), np.concatenate(labels)
+
+
+def build_cache(
+    cache_dir: Path,
+    extractor: keras.Model,
+    make_dataset,
+    signature: dict,
+    passes: int = 0,
+    seed: int = 42,
+) -> dict:
+    """Extract features into ``cache_dir`` unless a matching cache exists.
+
+    ``make_dataset(split, seed, augment, cache)`` returns an unshuffled
+    dataset of ``(images, one-hot labels)`` for ``split`` ("train" or
+    "val"); ``signature`` is what must match for the cache to be reused.
+    """
+    cache_dir = Path(cache_dir)
+    signature = dict(signature, passes=passes, seed=seed, format_version=FORMAT_VERSION)
+    index_path = cache_dir / "index.json"
+    if index_path.exists():
+        index = json.loads(index_path.read_text(encoding="utf-8"))
+        if index.get("signature") == signature:
+            print(f"Reusing cached features in {cache_dir}")
+            return index
+        print(f"{cache_dir} was built with different settings; rebuilding")
+        index_path.unlink()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # Pass 0 decodes into a file cache; the augmented passes replay it.
+    decoded = cache_dir / "decoded"
+    decoded.mkdir(exist_ok=True)
+    started = time.perf_counter()
+    try:
+        passes_out = []
+        labels = None
+        for p in range(passes + 1):
+            pass_started = time.perf_counter()
+            dataset = make_dataset("train", seed + p, p > 0, str(decoded / "train"))
+            features, pass_labels = _extract(extractor, dataset)
+            if labels is not None and not np.array_equal(labels, pass_labels):
+                raise RuntimeError("augmentation pass returned samples in a different order")
+            labels = pass_labels
+            passes_out.append(features)
+            print(f"  pass {p}/{passes}{' (unaugmented)' if p == 0 else ''}: {len(features)} images, "
+                  f"{len(features) / (time.perf_counter() - pass_started):.1f} images/s")
+        val_features, val_labels = _extract(extractor, make_dataset("val", seed, False, str(decoded / "val")))
+    finally:
+        shutil.rmtree(decoded, ignore_errors=True)
+
+    np.save(cache_dir / "train-features.npy", np.stack(passes_out))
+    np.save(cache_dir / "train-labels.npy", labels)
+    np.save(cache_dir / "val-features.npy", val_features)
+    np.save(cache_dir / "val-labels.npy", val_labels)
+    index = {
+        "signature": signature,
+        "train_count": int(len(labels)),
+        "val_count": int(len(val_labels)),
+        "feature_dim": int(val_features.shape[-1]) if len(val_features) else int(passes_out[0].shape[-1]),
+        "seconds": time.perf_counter() - started,
+        "created_at": time.time(),
+    }
+    index_path.write_text(json.dumps(index, indent=2, ensure_ascii=False), encoding="utf-8")
+    return index
+
+
+def feature_datasets(
+    cache_dir: Path,
+    num_classes: int,
+    batch_size: int = 32,
+    seed: int = 42,
+    passes: Optional[int] = None,
+) -> Tuple[tf.data.Dataset, tf.data.Dataset]:
+    """(train, validation) datasets of ``(float32 features, one-hot labels)``.
+
+    Training batches are reshuffled every epoch and draw each sample from a
+    random stored pass; ``passes`` limits that to the first ``passes + 1``.
+    """
+    cache_dir = Path(cache_dir)
+    features = np.load(cache_dir / "train-features.npy", mmap_mode="r")
+    labels = np.load(cache_dir / "train-labels.npy").astype(np.int32)
+    val_features = np.load(cache_dir / "val-features.npy")
+    val_labels = np.load(cache_dir / "val-labels.npy").astype(np.int32)
+    available = features.shape[0] if passes is None else min(passes + 1, features.shape[0])
+    dim = features.shape[-1]
+
+    def gather(indices, chosen):
+        return np.asarray(features[chosen, indices], dtype=np.float32)
+
+    def lookup(indices, chosen):
+        batch = tf.numpy_function(gather, [indices, chosen], tf.float32, stateful=False)
+        batch.set_shape((None, dim))
+        return batch, tf.one_hot(tf.gather(labels, indices), num_classes)
+
+    order = tf.data.Dataset.range(len(labels)).shuffle(len(labels), seed=seed, reshuffle_each_iteration=True)
+    chosen = tf.data.Dataset.random(seed=seed, rerandomize_each_iteration=True).map(lambda r: r % available)
+    train = (
+        tf.data.Dataset.zip(order, chosen)
+        .batch(batch_size)
+        .map(lookup, num_parallel_calls=tf.data.AUTOTUNE)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+    val = (
+        tf.data.Dataset.from_tensor_slices((val_features.astype(np.float32), tf.one_hot(val_labels, num_classes)))
+        .batch(batch_size)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+    return train, val
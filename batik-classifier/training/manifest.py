@@ -0,0 +1,361 @@
+"""
+Dataset manifest: one compact JSON file listing every image of a class-folder
+dataset (or zip of one) with its class, byte size, mtime, dimensions and
+SHA-1, plus a stored train/validation split.
+
+Tools that accept a dataset also accept its manifest and then never walk the
+folders. Rebuilding only stats the files and re-reads the ones whose size or
+mtime changed:
+
+    python manifest.py build /data/batik_dataset           # -> /data/batik_dataset.manifest.json
+    python manifest.py build /data/batik_dataset           # again: only new/changed files are read
+    python manifest.py info /data/batik_dataset.manifest.json
+    python evaluate.py /data/batik_dataset.manifest.json --subset validation
+
+The first build splits like ImageDataGenerator (the first 20% of each class
+folder is validation), so the stored split is the one the notebooks used.
+Files that keep their path keep their side on later builds; new files are
+placed by their content hash, so adding images never moves existing ones
+across the split. ``--resplit`` recomputes the Keras split from scratch.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from dataset import (
+    API_DIR,
+    SUBSETS,
+    ClassFolderDataset,
+    drop_quarantined,
+    list_class_folders,
+    load_quarantine,
+    read_member,
+    split_indices,
+)
+
+sys.path.insert(0, str(API_DIR))
+
+from serving import _load_class_names  # noqa: E402
+
+FORMAT_VERSION = 1
+MANIFEST_SUFFIX = ".manifest.json"
+COLUMNS = ("path", "label", "size", "mtime_ns", "width", "height", "sha1", "validation")
+
+
+def default_manifest_path(source: Path) -> Path:
+    return Path(str(Path(source)) + MANIFEST_SUFFIX)
+
+
+def _stat(dataset: ClassFolderDataset) -> Tuple[List[int], List[int]]:
+    """(sizes, mtimes in ns) without opening any image."""
+    if dataset.archive:
+        import zipfile
+
+        with zipfile.ZipFile(dataset.archive) as zf:
+            infos = {info.filename: info for info in zf.infolist()}
+        members = [infos[name] for name in dataset.paths]
+        return (
+            [info.file_size for info in members],
+            [int(time.mktime(info.date_time + (0, 0, -1))) * 1_000_000_000 for info in members],
+        )
+    stats = [os.stat(dataset.root / path) for path in dataset.paths]
+    return [st.st_size for st in stats], [st.st_mtime_ns for st in stats]
+
+
+def _describe_chunk(items: List[Tuple[int, str]], archive: Optional[str] = None):
+    """Process-pool worker: (index, width, height, sha1) per item. Only the
+    image header is parsed; a file PIL can't identify gets 0x0."""
+    from PIL import Image
+
+    rows = []
+    for index, location in items:
+        if archive:
+            data = read_member(archive, location)
+        else:
+            with open(location, "rb") as f:
+                data = f.read()
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                width, height = image.size
+        except Exception:
+            width = height = 0
+        rows.append((index, width, height, hashlib.sha1(data).hexdigest()))
+    return rows
+
+
+def _hash_side(sha1: str, validation_split: float) -> bool:
+    return int(sha1[:8], 16) / 0x100000000 < validation_split
+
+
+def build_manifest(
+    source: Path,
+    out_path: Optional[Path] = None,
+    class_names: Optional[Sequence[str]] = None,
+    validation_split: float = 0.2,
+    workers: int = 1,
+    resplit: bool = False,
+    chunk_size: int = 64,
+) -> dict:
+    """Create or update the manifest of ``source``; returns it.
+
+    Entries of an existing manifest are reused when path, size and mtime
+    match, so only new or modified files are read and hashed.
+    """
+    source = Path(source)
+    out_path = Path(out_path) if out_path else default_manifest_path(source)
+    previous = {}
+    old = None
+    if out_path.exists():
+        old = Manifest(out_path)
+        if str(Path(old.source).resolve()) != str(source.resolve()):
+            raise ValueError(f"{out_path} describes {old.source}, not {source}")
+        if old.validation_split != validation_split and not resplit:
+            raise ValueError(f"{out_path} was split with validation_split={old.validation_split}; "
+                             f"pass that value or --resplit")
+        previous = {path: i for i, path in enumerate(old.paths)}
+        if class_names is None:
+            # Keep the old class order; folders added since go at the end.
+            folders = list_class_folders(source).class_names
+            class_names = old.class_names + [name for name in folders if name not in old.class_names]
+
+    dataset = list_class_folders(source, class_names)
+    # Quarantined files are left out of the manifest, but the split is still
+    # computed over the full listing so it stays the notebooks' split.
+    quarantined = load_quarantine(source)
+    count = len(dataset.paths)
+    sizes, mtimes = _stat(dataset)
+    widths = np.zeros(count, dtype=np.int64)
+    heights = np.zeros(count, dtype=np.int64)
+    sha1s: List[str] = [""] * count
+    validation = np.zeros(count, dtype=bool)
+    known = np.zeros(count, dtype=bool)
+
+    stale = []
+    skipped = 0
+    for i, path in enumerate(dataset.paths):
+        if path in quarantined:
+            skipped += 1
+            continue
+        j = previous.get(path)
+        if j is not None and old.sizes[j] == sizes[i] and old.mtimes[j] == mtimes[i]:
+            widths[i], heights[i], sha1s[i] = old.widths[j], old.heights[j], old.sha1s[j]
+        else:
+            stale.append(i)
+        if j is not None:
+            validation[i] = old.validation[j]
+            known[i] = True
+
+    started = last_report = time.perf_counter()
+    if stale:
+        print(f"Reading {len(stale)} new or changed files ({count - len(stale) - skipped} unchanged)")
+    chunks = (
+        [(i, dataset.location(i)) for i in stale[start:start + chunk_size]]
+        for start in range(0, len(stale), chunk_size)
+    )
+    in_flight: deque = deque()
+    done = 0
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        while True:
+            while len(in_flight) < 2 * max(1, workers):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                in_flight.append(pool.submit(_describe_chunk, chunk, dataset.archive))
+            if not in_flight:
+                break
+            for i, width, height, sha1 in in_flight.popleft().result():
+                widths[i], heights[i], sha1s[i] = width, height, sha1
+                done += 1
+            if time.perf_counter() - last_report > 10:
+                last_report = time.perf_counter()
+                print(f"{done}/{len(stale)} files, {done / (last_report - started):.1f} files/s")
+
+    if old is None or resplit:
+        rule = "keras"
+        validation[:] = False
+        validation[split_indices(dataset.labels, validation_split)[1]] = True
+    else:
+        rule = old.split.get("rule", "keras")
+        added = [i for i in np.flatnonzero(~known) if dataset.paths[i] not in quarantined]
+        for i in added:
+            validation[i] = _hash_side(sha1s[i], validation_split)
+        if len(added) and not rule.endswith("+sha1"):
+            rule += "+sha1"
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "source": str(source.resolve()),
+        "class_names": dataset.class_names,
+        "split": {
+            "validation_split": validation_split,
+            "rule": rule,
+        },
+        "updated_at": time.time(),
+        "columns": list(COLUMNS),
+        "rows": [
+            [path, int(label), int(size), int(mtime), int(width), int(height), sha1, int(val)]
+            for path, label, size, mtime, width, height, sha1, val in zip(
+                dataset.paths, dataset.labels, sizes, mtimes, widths, heights, sha1s, validation
+            )
+            if path not in quarantined
+        ],
+    }
+    manifest["count"] = len(manifest["rows"])
+    if count > manifest["count"]:
+        manifest["quarantined"] = count - manifest["count"]
+    write_manifest(out_path, manifest)
+    manifest["reused"] = manifest["count"] - len(stale)
+    return manifest
+
+
+def write_manifest(out_path: Path, manifest: dict) -> None:
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        # One row per line: compact, yet diffs stay readable.
+        header = {key: value for key, value in manifest.items() if key != "rows"}
+        f.write(json.dumps(header, ensure_ascii=False)[:-1] + ', "rows": [\n')
+        f.write(",\n".join(json.dumps(row, ensure_ascii=False) for row in manifest["rows"]))
+        f.write("\n]}\n")
+    os.replace(tmp, out_path)
+
+
+class Manifest:
+    """A loaded manifest; ``dataset()`` lists its images without touching
+    the filesystem."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with self.path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"{self.path}: unsupported manifest format {data.get('format_version')}")
+        self.data = data
+        self.source = Path(data["source"])
+        self.class_names: List[str] = data["class_names"]
+        self.split: dict = data["split"]
+        self.validation_split: float = self.split["validation_split"]
+        columns = list(zip(*data["rows"])) if data["rows"] else [()] * len(COLUMNS)
+        by_name = dict(zip(data["columns"], columns))
+        self.paths: List[str] = list(by_name["path"])
+        self.labels = np.asarray(by_name["label"], dtype=np.int32)
+        self.sizes = np.asarray(by_name["size"], dtype=np.int64)
+        self.mtimes = np.asarray(by_name["mtime_ns"], dtype=np.int64)
+        self.widths = np.asarray(by_name["width"], dtype=np.int64)
+        self.heights = np.asarray(by_name["height"], dtype=np.int64)
+        self.sha1s: List[str] = list(by_name["sha1"])
+        self.validation = np.asarray(by_name["validation"], dtype=bool)
+
+    @staticmethod
+    def is_manifest(path: Path) -> bool:
+        return str(path).endswith(MANIFEST_SUFFIX) and Path(path).is_file()
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def with_split(self, validation: np.ndarray, rule: str, keep: Optional[np.ndarray] = None) -> dict:
+        """A copy of this manifest with a new split, optionally only the
+        ``keep`` rows; write it with ``write_manifest``."""
+        column = self.data["columns"].index("validation")
+        keep = np.arange(len(self)) if keep is None else np.asarray(keep, dtype=np.int64)
+        rows = []
+        for i in keep:
+            row = list(self.data["rows"][i])
+            row[column] = int(validation[i])
+            rows.append(row)
+        split = dict(self.split, rule=rule)
+        return dict(self.data, split=split, count=len(rows), updated_at=time.time(), rows=rows)
+
+    def dataset(self, subset: str = "all") -> ClassFolderDataset:
+        if subset not in SUBSETS:
+            raise ValueError(f"subset must be one of {SUBSETS}, got {subset!r}")
+        full = ClassFolderDataset(self.source, self.class_names, self.paths, self.labels)
+        if subset == "all":
+            return full
+        return full.select(np.flatnonzero(self.validation == (subset == "validation")))
+
+
+def open_dataset(
+    path: Path,
+    class_names: Optional[Sequence[str]] = None,
+    subset: str = "all",
+    validation_split: float = 0.0,
+) -> ClassFolderDataset:
+    """``list_class_folders``, except that a manifest is read instead of the
+    folders and supplies its stored split (``validation_split`` is ignored).
+    Files ``scan.py`` quarantined are left out."""
+    if not Manifest.is_manifest(path):
+        return drop_quarantined(list_class_folders(path, class_names, subset, validation_split))
+    dataset = drop_quarantined(Manifest(path).dataset(subset))
+    if class_names is not None and list(class_names) != dataset.class_names:
+        unknown = sorted(set(dataset.class_names) - set(class_names))
+        if unknown:
+            raise ValueError(f"{len(unknown)} folders are not in the label list: {', '.join(unknown[:5])}")
+        order = {name: label for label, name in enumerate(class_names)}
+        remap = np.asarray([order[name] for name in dataset.class_names], dtype=np.int32)
+        dataset = dataset._replace(class_names=list(class_names), labels=remap[dataset.labels])
+    return dataset
+
+
+def _build(args) -> None:
+    class_names = _load_class_names(args.labels) if args.labels else None
+    out_path = args.output or default_manifest_path(args.dataset)
+    started = time.perf_counter()
+    manifest = build_manifest(
+        args.dataset, out_path, class_names, args.validation_split, args.workers, args.resplit
+    )
+    elapsed = time.perf_counter() - started
+    validation = sum(row[-1] for row in manifest["rows"])
+    skipped = f", {manifest['quarantined']} quarantined left out" if manifest.get("quarantined") else ""
+    print(f"{out_path}: {manifest['count']} images ({manifest['reused']} unchanged{skipped}), "
+          f"{validation} validation, {elapsed:.1f}s")
+
+
+def _info(args) -> None:
+    manifest = Manifest(args.manifest)
+    counts = np.bincount(manifest.labels, minlength=len(manifest.class_names))
+    val_counts = np.bincount(manifest.labels[manifest.validation], minlength=len(manifest.class_names))
+    print(f"{manifest.path}: {len(manifest)} images of {manifest.source}, "
+          f"{manifest.sizes.sum() / 1e9:.2f} GB, split {manifest.split}")
+    unreadable = np.count_nonzero(manifest.widths == 0)
+    if len(manifest):
+        print(f"  {manifest.widths.min()}-{manifest.widths.max()} x {manifest.heights.min()}-{manifest.heights.max()} px, "
+              f"{unreadable} unidentifiable, {len(manifest) - len(set(manifest.sha1s))} exact duplicates")
+    for name, count, val in zip(manifest.class_names, counts, val_counts):
+        print(f"  {name:<40} {count:>6} ({val} validation)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Create or update a dataset's manifest")
+    build.add_argument("dataset", type=Path, help="Class-folder dataset or a zip of one")
+    build.add_argument("--output", type=Path, help=f"Default: <dataset>{MANIFEST_SUFFIX}")
+    build.add_argument("--labels", type=Path, help="Class order; defaults to the sorted folder names")
+    build.add_argument("--validation-split", type=float, default=0.2)
+    build.add_argument("--resplit", action="store_true", help="Recompute the split instead of keeping it")
+    build.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Hashing processes")
+    build.set_defaults(func=_build)
+
+    info = commands.add_parser("info", help="Summarize a manifest")
+    info.add_argument("manifest", type=Path)
+    info.set_defaults(func=_info)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
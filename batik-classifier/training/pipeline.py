@@ -0,0 +1,270 @@
+"""
+tf.data input pipelines for training, replacing
+``ImageDataGenerator.flow_from_directory``.
+
+Images are decoded and resized on parallel tf.data workers (centre square
+crop + bilinear resize, like the server), cached as uint8, shuffled and
+batched, then augmented a whole batch at a time and prefetched so the next
+batches are ready while the model trains. Augmentation draws the same random
+parameters as ``ImageDataGenerator`` and applies rotation, shift, shear,
+zoom and flips as a single projective resampling per batch (pixel-identical
+to ``apply_transform``), followed by channel shift and brightness. With ``ShardDataset`` input the
+decode step disappears entirely.
+
+Both pipelines yield ``(float32 images in [0, 255], one-hot labels)``; the
+model does its own input scaling (see ``train.build_model``). Everything is
+seeded: the same seed gives the same order and the same augmentations.
+"""
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import tensorflow as tf
+
+from dataset import ClassFolderDataset, read_member
+from shards import ShardDataset
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+# ImageDataGenerator arguments from Batik_Training_FIXED_Simple.ipynb.
+NOTEBOOK_AUGMENTATION = {
+    "rotation_range": 15,
+    "width_shift_range": 0.1,
+    "height_shift_range": 0.1,
+    "shear_range": 0.1,
+    "zoom_range": 0.1,
+    "horizontal_flip": True,
+    "vertical_flip": False,
+    "brightness_range": (0.8, 1.2),
+    "fill_mode": "nearest",
+}
+# ... and from Batik_Training_Kaggle_Ready.ipynb, far stronger.
+KAGGLE_READY_AUGMENTATION = {
+    "rotation_range": 180,
+    "width_shift_range": 0.5,
+    "height_shift_range": 0.5,
+    "shear_range": 0.5,
+    "zoom_range": (0.4, 2.0),
+    "horizontal_flip": True,
+    "vertical_flip": True,
+    "brightness_range": (0.2, 2.0),
+    "channel_shift_range": 80,
+    "fill_mode": "reflect",
+}
+
+
+def decode_and_resize(path: tf.Tensor, image_size: int, archive: Optional[str] = None) -> tf.Tensor:
+    """File -> (size, size, 3) uint8: decode, centre square crop, bilinear resize.
+
+    With ``archive``, ``path`` is a member of that zip and is read from it
+    directly. Unlike the server, EXIF orientation is not applied; shards
+    built by ``shards.py`` are exact.
+    """
+    if archive:
+        data = tf.numpy_function(lambda name: read_member(archive, name.decode()), [path], tf.string, stateful=False)
+    else:
+        data = tf.io.read_file(path)
+    image = tf.io.decode_image(data, channels=3, expand_animations=False)
+    shape = tf.shape(image)
+    side = tf.minimum(shape[0], shape[1])
+    image = tf.image.crop_to_bounding_box(image, (shape[0] - side) // 2, (shape[1] - side) // 2, side, side)
+    # antialias=True filters like PIL's BILINEAR when downscaling.
+    image = tf.image.resize(image, (image_size, image_size), method="bilinear", antialias=True)
+    return tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+
+
+def random_transforms(seed: tf.Tensor, batch_size, height: int, width: int, params: dict) -> Dict[str, tf.Tensor]:
+    """Per-image parameters drawn exactly like ``ImageDataGenerator.get_random_transform``
+    (same names, same ranges), from a stateless ``seed`` of shape (2,)."""
+    keys = tf.unstack(tf.random.experimental.stateless_split(tf.cast(seed, tf.int64), 10))
+
+    def uniform(key, low, high):
+        return tf.random.stateless_uniform((batch_size,), keys[key], low, high)
+
+    def shift(key, value, size):
+        if not value:
+            return tf.zeros((batch_size,))
+        return uniform(key, -value, value) * (size if value < 1 else 1)
+
+    zoom = params.get("zoom_range", 0.0)
+    zoom = (1 - zoom, 1 + zoom) if np.isscalar(zoom) else tuple(zoom)
+    rotation = params.get("rotation_range", 0)
+    shear = params.get("shear_range", 0)
+    channel_shift = params.get("channel_shift_range", 0)
+    brightness = params.get("brightness_range")
+    transforms = {
+        "theta": uniform(0, -rotation, rotation) if rotation else tf.zeros((batch_size,)),
+        "tx": shift(1, params.get("height_shift_range", 0), height),
+        "ty": shift(2, params.get("width_shift_range", 0), width),
+        "shear": uniform(3, -shear, shear) if shear else tf.zeros((batch_size,)),
+        "zx": uniform(4, *zoom) if zoom != (1, 1) else tf.ones((batch_size,)),
+        "zy": uniform(5, *zoom) if zoom != (1, 1) else tf.ones((batch_size,)),
+        "flip_horizontal": uniform(6, 0, 1) < 0.5 if params.get("horizontal_flip") else tf.zeros((batch_size,), tf.bool),
+        "flip_vertical": uniform(7, 0, 1) < 0.5 if params.get("vertical_flip") else tf.zeros((batch_size,), tf.bool),
+    }
+    if channel_shift:
+        transforms["channel_shift_intensity"] = uniform(8, -channel_shift, channel_shift)
+    if brightness:
+        transforms["brightness"] = uniform(9, *brightness)
+    return transforms
+
+
+def _matrices(transforms: Dict[str, tf.Tensor], height: int, width: int) -> tf.Tensor:
+    """One (B, 8) projective transform per image: rotation, shift, shear,
+    zoom and flips composed the way Keras' ``apply_affine_transform``
+    composes them (in (x, y) order), mapping output to input pixels."""
+    theta = transforms["theta"] * (np.pi / 180)
+    shear = transforms["shear"] * (np.pi / 180)
+    zeros, ones = tf.zeros_like(theta), tf.ones_like(theta)
+
+    def matrix(*rows):
+        return tf.reshape(tf.stack(rows, axis=-1), (-1, 3, 3))
+
+    rotate = matrix(tf.cos(theta), -tf.sin(theta), zeros, tf.sin(theta), tf.cos(theta), zeros, zeros, zeros, ones)
+    shift = matrix(ones, zeros, transforms["tx"], zeros, ones, transforms["ty"], zeros, zeros, ones)
+    shear_m = matrix(ones, -tf.sin(shear), zeros, zeros, tf.cos(shear), zeros, zeros, zeros, ones)
+    zoom = matrix(transforms["zx"], zeros, zeros, zeros, transforms["zy"], zeros, zeros, zeros, ones)
+    # transform_matrix_offset_center(m, h, w): Keras centres the first axis on h.
+    o_x, o_y = height / 2 - 0.5, width / 2 - 0.5
+    offset = matrix(ones, zeros, o_x * ones, zeros, ones, o_y * ones, zeros, zeros, ones)
+    reset = matrix(ones, zeros, -o_x * ones, zeros, ones, -o_y * ones, zeros, zeros, ones)
+    m = offset @ rotate @ shift @ shear_m @ zoom @ reset
+    # Flips happen after the affine warp, so they act on output coordinates.
+    sx = 1 - 2 * tf.cast(transforms["flip_horizontal"], tf.float32)
+    sy = 1 - 2 * tf.cast(transforms["flip_vertical"], tf.float32)
+    flip = matrix(sx, zeros, (1 - sx) / 2 * (width - 1), zeros, sy, (1 - sy) / 2 * (height - 1), zeros, zeros, ones)
+    m = m @ flip
+    return tf.reshape(m, (-1, 9))[:, :8]
+
+
+def apply_transforms(images: tf.Tensor, transforms: Dict[str, tf.Tensor], params: dict) -> tf.Tensor:
+    """``ImageDataGenerator.apply_transform`` for a whole float batch in [0, 255]:
+    one bilinear resampling for all geometry, then channel shift and brightness."""
+    shape = tf.shape(images)
+    height, width = images.shape[1], images.shape[2]
+    images = tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=_matrices(transforms, height, width),
+        output_shape=shape[1:3],
+        fill_value=float(params.get("cval", 0.0)),
+        interpolation="BILINEAR",
+        fill_mode=params.get("fill_mode", "nearest").upper(),
+    )
+    if "channel_shift_intensity" in transforms:
+        # Same intensity on every channel, clipped to the image's own range.
+        low = tf.reduce_min(images, axis=(1, 2, 3), keepdims=True)
+        high = tf.reduce_max(images, axis=(1, 2, 3), keepdims=True)
+        images = tf.clip_by_value(images + transforms["channel_shift_intensity"][:, None, None, None], low, high)
+    if "brightness" in transforms:
+        # Keras hands PIL's ImageEnhance.Brightness a uint8 image: truncate,
+        # multiply, truncate again.
+        images = tf.floor(tf.clip_by_value(tf.floor(images) * transforms["brightness"][:, None, None, None], 0.0, 255.0))
+    return images
+
+
+def augment_batch(images: tf.Tensor, seed: tf.Tensor, params: dict = NOTEBOOK_AUGMENTATION) -> tf.Tensor:
+    """ImageDataGenerator augmentation for a (B, H, W, C) float batch, fused
+    into one resampling pass; ``seed`` (shape (2,)) makes it reproducible."""
+    transforms = random_transforms(seed, tf.shape(images)[0], images.shape[1], images.shape[2], params)
+    return apply_transforms(images, transforms, params)
+
+
+def _options(deterministic: bool) -> tf.data.Options:
+    options = tf.data.Options()
+    options.deterministic = deterministic
+    options.experimental_optimization.map_parallelization = True
+    return options
+
+
+def _finish(
+    batches: tf.data.Dataset,
+    num_classes: int,
+    training: bool,
+    augment: bool,
+    seed: int,
+    deterministic: bool,
+    augmentation: Optional[dict],
+) -> tf.data.Dataset:
+    batches = batches.map(
+        lambda images, labels: (tf.cast(images, tf.float32), tf.one_hot(labels, num_classes)),
+        num_parallel_calls=AUTOTUNE,
+    )
+    if training and augment:
+        params = augmentation or NOTEBOOK_AUGMENTATION
+        # A fresh stateless seed per batch (and per epoch) keeps the
+        # augmentation reproducible while batches are augmented in parallel.
+        seeds = tf.data.Dataset.random(seed=seed, rerandomize_each_iteration=True)
+        batches = tf.data.Dataset.zip(batches, seeds).map(
+            lambda batch, r: (augment_batch(batch[0], tf.stack([r, tf.constant(seed, tf.int64)]), params), batch[1]),
+            num_parallel_calls=AUTOTUNE,
+            deterministic=deterministic,
+        )
+    return batches.prefetch(AUTOTUNE).with_options(_options(deterministic))
+
+
+def from_files(
+    dataset: ClassFolderDataset,
+    batch_size: int = 32,
+    image_size: int = 224,
+    training: bool = True,
+    seed: int = 42,
+    cache: Optional[str] = "",
+    augment: bool = True,
+    augmentation: Optional[dict] = None,
+    deterministic: bool = True,
+    skip_errors: bool = True,
+    shuffle: Optional[bool] = None,
+) -> tf.data.Dataset:
+    """Pipeline over image files.
+
+    ``cache``: ``""`` keeps decoded uint8 images in memory (~150 KB each),
+    a path caches them to disk, ``None`` decodes every epoch. Undecodable
+    files are dropped (``skip_errors``) instead of killing the run.
+    ``training`` means shuffled and augmented; ``shuffle=False`` keeps file
+    order while still augmenting (feature extraction passes). Zip datasets
+    are read member by member from the parallel decode workers.
+    """
+    archive = dataset.archive
+    paths = [dataset.location(i) for i in range(len(dataset.paths))]
+    samples = tf.data.Dataset.from_tensor_slices((paths, dataset.labels.astype(np.int32)))
+    images = samples.map(
+        lambda path, label: (decode_and_resize(path, image_size, archive), label),
+        num_parallel_calls=AUTOTUNE,
+        deterministic=deterministic,
+    )
+    if skip_errors:
+        images = images.ignore_errors(log_warning=True)
+    if cache is not None:
+        images = images.cache(cache)
+    if training if shuffle is None else shuffle:
+        images = images.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+    batches = images.batch(batch_size, num_parallel_calls=AUTOTUNE, deterministic=deterministic)
+    return _finish(batches, len(dataset.class_names), training, augment, seed, deterministic, augmentation)
+
+
+def from_shards(
+    shards: ShardDataset,
+    indices: Optional[Sequence[int]] = None,
+    batch_size: int = 32,
+    training: bool = True,
+    seed: int = 42,
+    augment: bool = True,
+    augmentation: Optional[dict] = None,
+    deterministic: bool = True,
+    shuffle: Optional[bool] = None,
+) -> tf.data.Dataset:
+    """Pipeline over preprocessed shards (optionally a subset of their
+    samples): batches are gathered straight from the memory map."""
+    indices = np.arange(len(shards)) if indices is None else np.asarray(indices, dtype=np.int64)
+    labels = np.asarray(shards.labels, dtype=np.int32)
+    shape = (None,) + tuple(shards.image_shape)
+
+    def gather(batch_indices: tf.Tensor):
+        images = tf.numpy_function(shards.gather, [batch_indices], tf.uint8, stateful=False)
+        images.set_shape(shape)
+        return images, tf.gather(labels, batch_indices)
+
+    samples = tf.data.Dataset.from_tensor_slices(indices)
+    if training if shuffle is None else shuffle:
+        samples = samples.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    batches = samples.batch(batch_size).map(gather, num_parallel_calls=AUTOTUNE, deterministic=deterministic)
+    return _finish(batches, len(shards.class_names), training, augment, seed, deterministic, augmentation)
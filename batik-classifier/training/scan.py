@@ -0,0 +1,209 @@
+"""
+Corrupt/unreadable image scanner for datasets and upload archives.
+
+Decodes every image on all cores before a long job touches it and writes a
+quarantine list, so a truncated JPEG is found in seconds instead of killing
+``flow_from_directory`` hours into training:
+
+    python scan.py /data/batik_dataset              # -> /data/batik_dataset.quarantine.json
+    python scan.py /data/uploads.zip --min-size 64
+    python scan.py /data/batik_dataset.manifest.json --strict   # exit 1 if anything is quarantined
+
+Each file is fully decoded (JPEGs at reduced scale, which still reads every
+byte of the stream) and checked for:
+
+- decode errors, truncation and decompression bombs
+- a pixel mode the serving code can't turn into RGB (16-bit, float, ...)
+- a shorter side below ``--min-size``
+- EXIF that fails to parse or to apply (``resize_for_model`` applies it)
+
+Those files are quarantined. Odd but usable files (an EXIF orientation
+outside 1-8, a format that doesn't match the extension) are only listed as
+warnings. ``manifest.py``, ``evaluate.py``, ``shards.py`` and ``train.py``
+leave quarantined files out, and ``api/batch_classify.py --quarantine``
+records them as failed without decoding them. Re-scan after fixing files.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from dataset import IMAGE_EXTENSIONS, is_archive, quarantine_path, read_member
+from manifest import MANIFEST_SUFFIX
+
+# Modes PIL converts to RGB without losing the image.
+RGB_MODES = {"1", "L", "LA", "P", "PA", "RGB", "RGBA", "RGBX", "CMYK", "YCbCr", "LAB", "HSV"}
+# Extensions each PIL format may legitimately carry.
+FORMAT_EXTENSIONS = {
+    "JPEG": {".jpg", ".jpeg"},
+    "PNG": {".png"},
+    "BMP": {".bmp"},
+    "PPM": {".ppm"},
+    "TIFF": {".tif", ".tiff"},
+    "WEBP": {".webp"},
+}
+SCAN_EXTENSIONS = IMAGE_EXTENSIONS | {".webp"}
+
+
+def list_images(source: Path) -> Tuple[Path, List[str]]:
+    """(root, paths) of every image under a folder, in a zip, or in a
+    manifest; paths are relative with "/" separators (member names for a
+    zip), as in ``ClassFolderDataset``."""
+    source = Path(source)
+    if str(source).endswith(MANIFEST_SUFFIX):
+        with source.open("r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        column = manifest["columns"].index("path")
+        return Path(manifest["source"]), [row[column] for row in manifest["rows"]]
+    if is_archive(source):
+        import zipfile
+
+        with zipfile.ZipFile(source) as zf:
+            names = [
+                info.filename for info in zf.infolist()
+                if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+                and os.path.splitext(info.filename)[1].lower() in SCAN_EXTENSIONS
+            ]
+        return source, sorted(names)
+    paths = []
+    for dirpath, dirnames, files in os.walk(source, followlinks=True):
+        dirnames.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in SCAN_EXTENSIONS:
+                paths.append(os.path.relpath(os.path.join(dirpath, name), source).replace(os.sep, "/"))
+    return source, paths
+
+
+def check_image(data: bytes, name: str, min_size: int) -> Tuple[Optional[str], List[str]]:
+    """(error or None, warnings) for one file's bytes."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    if not data:
+        return "empty file", []
+    found: List[str] = []
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(data)) as image:
+                width, height = image.size
+                expected = FORMAT_EXTENSIONS.get(image.format)
+                if expected and os.path.splitext(name)[1].lower() not in expected:
+                    found.append(f"{image.format} data with a {os.path.splitext(name)[1]} extension")
+                if min(width, height) < min_size:
+                    return f"too small: {width}x{height} (minimum {min_size}px)", found
+                if image.mode not in RGB_MODES:
+                    return f"unsupported mode {image.mode}", found
+                try:
+                    orientation = image.getexif().get(0x0112)
+                except Exception as exc:
+                    return f"unreadable EXIF: {type(exc).__name__}: {exc}", found
+                if orientation is not None and orientation not in range(1, 9):
+                    found.append(f"EXIF orientation {orientation!r} ignored")
+                if image.format == "JPEG":
+                    image.draft("RGB", (max(min_size, 64),) * 2)
+                image.load()
+                ImageOps.exif_transpose(image)
+    except UnidentifiedImageError:
+        return "not a recognised image format", found
+    except Exception as exc:
+        return f"{type(exc).__name__}: {exc}".replace("\n", " "), found
+    return None, found
+
+
+def _scan_chunk(items: List[Tuple[str, str]], min_size: int, archive: Optional[str] = None):
+    """Process-pool worker: (path, error, warnings) per item."""
+    rows = []
+    for path, location in items:
+        try:
+            if archive:
+                data = read_member(archive, location)
+            else:
+                with open(location, "rb") as f:
+                    data = f.read()
+        except Exception as exc:
+            rows.append((path, f"unreadable: {type(exc).__name__}: {exc}", []))
+            continue
+        error, found = check_image(data, path, min_size)
+        rows.append((path, error, found))
+    return rows
+
+
+def scan(root: Path, paths: List[str], workers: int = 1, min_size: int = 32, chunk_size: int = 64) -> dict:
+    """Check every path; returns the quarantine document."""
+    archive = str(root) if is_archive(root) else None
+    chunks = (
+        [(path, path if archive else str(Path(root) / path)) for path in paths[start:start + chunk_size]]
+        for start in range(0, len(paths), chunk_size)
+    )
+    quarantined, flagged = [], []
+    started = last_report = time.perf_counter()
+    in_flight: deque = deque()
+    done = 0
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        while True:
+            while len(in_flight) < 2 * max(1, workers):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                in_flight.append(pool.submit(_scan_chunk, chunk, min_size, archive))
+            if not in_flight:
+                break
+            for path, error, found in in_flight.popleft().result():
+                if error:
+                    quarantined.append({"path": path, "error": error})
+                flagged.extend({"path": path, "warning": warning} for warning in found)
+                done += 1
+            if time.perf_counter() - last_report > 10:
+                last_report = time.perf_counter()
+                print(f"{done}/{len(paths)} files, {len(quarantined)} quarantined, "
+                      f"{done / (last_report - started):.1f} files/s")
+    return {
+        "source": str(root),
+        "checked": len(paths),
+        "min_size": min_size,
+        "seconds": time.perf_counter() - started,
+        "created_at": time.time(),
+        "quarantined": quarantined,
+        "warnings": flagged,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", type=Path, help="Image folder, zip archive, or dataset manifest")
+    parser.add_argument("--output", type=Path, help="Quarantine list (default: <source>.quarantine.json)")
+    parser.add_argument("--min-size", type=int, default=32, help="Smallest acceptable shorter side, in pixels")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Decode processes")
+    parser.add_argument("--strict", action="store_true", help="Exit with status 1 if any file is quarantined")
+    args = parser.parse_args()
+
+    root, paths = list_images(args.source)
+    if not paths:
+        raise SystemExit(f"No images found under {args.source}")
+    print(f"Scanning {len(paths)} images in {root} on {args.workers} processes")
+    report = scan(root, paths, args.workers, args.min_size)
+    output = args.output or quarantine_path(root)
+    tmp = output.with_name(output.name + ".tmp")
+    tmp.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, output)
+
+    rate = report["checked"] / report["seconds"] if report["seconds"] else 0.0
+    print(f"{report['checked']} checked in {report['seconds']:.1f}s ({rate:.0f} images/s): "
+          f"{len(report['quarantined'])} quarantined, {len(report['warnings'])} warnings -> {output}")
+    for entry in report["quarantined"][:20]:
+        print(f"  {entry['path']}: {entry['error']}")
+    if len(report["quarantined"]) > 20:
+        print(f"  ... and {len(report['quarantined']) - 20} more")
+    if args.strict and report["quarantined"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
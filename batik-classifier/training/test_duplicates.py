@@ -0,0 +1,75 @@
+"""
+Tests for duplicates.py: the multi-index Hamming search against brute force,
+mirrored hashes, clustering and the cluster-preserving split.
+Run from this directory: ``python -m pytest test_duplicates.py``.
+"""
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+from duplicates import clusters_from_pairs, dedup_split, near_pairs, phash_pair, popcount
+
+
+def _brute_force_pairs(codes, distance, queries=None):
+    queries = codes if queries is None else queries
+    pairs = set()
+    for i, query in enumerate(queries):
+        close = np.flatnonzero(popcount(np.full(len(codes), query, dtype=np.uint64) ^ codes) <= distance)
+        pairs.update((min(i, j), max(i, j)) for j in close if j != i)
+    return sorted(pairs)
+
+
+def _clustered_codes(rng, count=400, centers=40, max_flips=12):
+    """Codes scattered around a few centres, so many pairs sit near any radius."""
+    base = rng.integers(0, 2**63, centers, dtype=np.uint64) * np.uint64(2) + rng.integers(0, 2, centers, dtype=np.uint64)
+    codes = base[rng.integers(0, centers, count)]
+    for i in range(count):
+        for bit in rng.choice(64, int(rng.integers(0, max_flips + 1)), replace=False):
+            codes[i] ^= np.uint64(1) << np.uint64(bit)
+    return codes
+
+
+@pytest.mark.parametrize("distance, blocks", [(0, 4), (3, 4), (4, 4), (8, 4), (11, 4), (15, 4), (3, 2), (5, 2)])
+def test_near_pairs_matches_brute_force(distance, blocks):
+    codes = _clustered_codes(np.random.default_rng(distance * 10 + blocks))
+    found = [tuple(pair) for pair in near_pairs(codes, distance, blocks=blocks).tolist()]
+    assert found == _brute_force_pairs(codes, distance)
+
+
+def test_near_pairs_with_queries_matches_brute_force():
+    rng = np.random.default_rng(7)
+    codes = _clustered_codes(rng)
+    queries = codes ^ (rng.integers(0, 2, len(codes), dtype=np.uint64) << np.uint64(63))
+    found = [tuple(pair) for pair in near_pairs(codes, 8, queries=queries).tolist()]
+    assert found == _brute_force_pairs(codes, 8, queries)
+
+
+def test_near_pairs_without_matches_is_empty():
+    codes = np.asarray([0, 2**64 - 1], dtype=np.uint64)
+    assert near_pairs(codes, 8).shape == (0, 2)
+
+
+def test_mirrored_hash_matches_hash_of_flipped_image():
+    rng = np.random.default_rng(3)
+    image = Image.fromarray(rng.integers(0, 256, (96, 128, 3), dtype=np.uint8)).resize((256, 192), Image.BILINEAR)
+    plain, mirrored = phash_pair(image)
+    flipped, _ = phash_pair(ImageOps.mirror(image))
+    assert mirrored == flipped
+    assert popcount(np.asarray([plain ^ flipped]))[0] > 8
+
+
+def test_clusters_from_pairs_takes_smallest_member():
+    pairs = np.asarray([[3, 5], [1, 5], [6, 7]])
+    np.testing.assert_array_equal(clusters_from_pairs(8, pairs), [0, 1, 2, 1, 4, 1, 6, 6])
+
+
+def test_dedup_split_keeps_clusters_on_one_side():
+    labels = np.asarray([0] * 10 + [1] * 10)
+    cluster = np.arange(20)
+    cluster[[1, 2, 15]] = 0  # a cluster spanning both classes counts toward class 0
+    cluster[[11, 12]] = 10
+    validation = dedup_split(labels, cluster, 0.2)
+    for root in np.unique(cluster):
+        assert len(set(validation[cluster == root])) == 1
+    assert validation[[0, 1, 2, 15]].all() and validation[[10, 11, 12]].all()
+    assert validation.sum() == 7
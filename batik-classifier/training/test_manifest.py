@@ -0,0 +1,81 @@
+"""
+Tests for manifest.py's incremental rebuilds and stored split.
+Run from this directory: ``python -m pytest test_manifest.py``.
+"""
+import os
+
+import numpy as np
+from PIL import Image
+
+from dataset import split_indices
+from manifest import Manifest, build_manifest, default_manifest_path
+
+
+def _write_image(path, seed, size=(32, 24)):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(path)
+
+
+def _dataset(root, classes=("kawung", "parang"), per_class=5):
+    for c, name in enumerate(classes):
+        for i in range(per_class):
+            _write_image(root / name / f"{i:03d}.png", seed=100 * c + i)
+    return root
+
+
+def test_first_build_reads_everything_and_stores_the_keras_split(tmp_path):
+    root = _dataset(tmp_path / "ds")
+    built = build_manifest(root)
+    manifest = Manifest(default_manifest_path(root))
+
+    assert built["reused"] == 0 and len(manifest) == 10
+    assert manifest.split["rule"] == "keras"
+    expected = np.zeros(len(manifest), dtype=bool)
+    expected[split_indices(manifest.labels, 0.2)[1]] = True
+    np.testing.assert_array_equal(manifest.validation, expected)
+    assert (manifest.widths == 32).all() and (manifest.heights == 24).all()
+
+
+def test_rebuild_reuses_unchanged_files(tmp_path):
+    root = _dataset(tmp_path / "ds")
+    build_manifest(root)
+    first = Manifest(default_manifest_path(root))
+
+    rebuilt = build_manifest(root)
+    second = Manifest(default_manifest_path(root))
+    assert rebuilt["reused"] == 10
+    assert second.paths == first.paths and second.sha1s == first.sha1s
+    np.testing.assert_array_equal(second.validation, first.validation)
+
+
+def test_rebuild_rereads_only_changed_and_new_files_and_keeps_their_sides(tmp_path):
+    root = _dataset(tmp_path / "ds")
+    build_manifest(root)
+    first = Manifest(default_manifest_path(root))
+
+    changed = root / "kawung" / "001.png"
+    _write_image(changed, seed=999, size=(40, 30))
+    os.utime(changed, ns=(first.mtimes[1] + 10**9, first.mtimes[1] + 10**9))
+    _write_image(root / "parang" / "100.png", seed=1000)
+
+    rebuilt = build_manifest(root)
+    second = Manifest(default_manifest_path(root))
+    assert rebuilt["reused"] == 9 and len(second) == 11
+    index = second.paths.index("kawung/001.png")
+    assert (second.widths[index], second.heights[index]) == (40, 30)
+    assert second.sha1s[index] != first.sha1s[first.paths.index("kawung/001.png")]
+    # Existing files keep their side of the split; the new one is placed by hash.
+    for i, path in enumerate(first.paths):
+        assert second.validation[second.paths.index(path)] == first.validation[i]
+    assert second.split["rule"] == "keras+sha1"
+
+
+def test_relative_source_is_stored_absolute(tmp_path, monkeypatch):
+    _dataset(tmp_path / "ds")
+    monkeypatch.chdir(tmp_path)
+    build_manifest("ds")
+    monkeypatch.chdir("/")
+    manifest = Manifest(tmp_path / "ds.manifest.json")
+    assert manifest.source == (tmp_path / "ds").resolve()
+    assert os.path.exists(manifest.dataset().location(0))
@@ -0,0 +1,71 @@
+"""
+Tests for pipeline.py's batch augmentation against Keras'
+``ImageDataGenerator.apply_transform``, image by image.
+Run from this directory: ``python -m pytest test_pipeline.py``.
+"""
+import numpy as np
+import pytest
+from PIL import Image
+
+tf = pytest.importorskip("tensorflow")
+pytest.importorskip("scipy")  # apply_transform resamples with scipy.ndimage
+
+import pipeline  # noqa: E402
+
+
+def _image_data_generator():
+    for module in (
+        "tf_keras.preprocessing.image",
+        "tensorflow.keras.preprocessing.image",
+        "keras.preprocessing.image",
+        "keras.src.legacy.preprocessing.image",
+    ):
+        try:
+            return getattr(__import__(module, fromlist=["ImageDataGenerator"]), "ImageDataGenerator")
+        except (ImportError, AttributeError):
+            continue
+    pytest.skip("ImageDataGenerator not importable")
+
+
+def _batch(count=16, height=56, width=80):
+    # Smooth, non-square images, so a swapped axis or a half-pixel offset shows.
+    rng = np.random.default_rng(0)
+    return np.stack([
+        np.asarray(Image.fromarray(rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)).resize((width, height), Image.BILINEAR))
+        for _ in range(count)
+    ]).astype(np.float32)
+
+
+def _reference(images, transforms, params):
+    generator = _image_data_generator()(**params)
+    transforms = {name: value.numpy() for name, value in transforms.items()}
+    return np.stack([
+        generator.apply_transform(image.copy(), {name: value[i].item() for name, value in transforms.items()})
+        for i, image in enumerate(images)
+    ])
+
+
+@pytest.mark.parametrize("params", [pipeline.NOTEBOOK_AUGMENTATION, pipeline.KAGGLE_READY_AUGMENTATION])
+def test_geometry_and_channel_shift_match_apply_transform(params):
+    params = {name: value for name, value in params.items() if name != "brightness_range"}
+    images = _batch()
+    transforms = pipeline.random_transforms(tf.constant([1, 2]), len(images), images.shape[1], images.shape[2], params)
+    ours = pipeline.apply_transforms(tf.constant(images), transforms, params).numpy()
+    np.testing.assert_allclose(ours, _reference(images, transforms, params), atol=2e-3)
+
+
+@pytest.mark.parametrize("params", [pipeline.NOTEBOOK_AUGMENTATION, pipeline.KAGGLE_READY_AUGMENTATION])
+def test_brightness_matches_apply_transform_within_two_levels(params):
+    images = _batch()
+    transforms = pipeline.random_transforms(tf.constant([3, 4]), len(images), images.shape[1], images.shape[2], params)
+    ours = pipeline.apply_transforms(tf.constant(images), transforms, params).numpy()
+    difference = np.abs(ours - _reference(images, transforms, params))
+    assert difference.max() <= 2
+    assert (difference > 1e-3).mean() < 1e-3
+
+
+def test_augment_batch_is_deterministic_per_seed():
+    images = tf.constant(_batch(count=4))
+    first = pipeline.augment_batch(images, tf.constant([5, 6])).numpy()
+    np.testing.assert_array_equal(first, pipeline.augment_batch(images, tf.constant([5, 6])).numpy())
+    assert not np.array_equal(first, pipeline.augment_batch(images, tf.constant([5, 7])).numpy())
@@ -0,0 +1,52 @@
+"""
+Tests for shards.py: building into an existing directory.
+Run from this directory: ``python -m pytest test_shards.py``.
+"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from dataset import list_class_folders
+from shards import INDEX_FILE, ShardDataset, build_shards
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    root = tmp_path / "ds"
+    for c, name in enumerate(("kawung", "parang")):
+        (root / name).mkdir(parents=True)
+        for i in range(3):
+            pixels = np.random.default_rng(10 * c + i).integers(0, 256, (40, 48, 3), dtype=np.uint8)
+            Image.fromarray(pixels).save(root / name / f"{i}.png")
+    return list_class_folders(root)
+
+
+def test_build_refuses_a_directory_that_holds_other_files(dataset, tmp_path):
+    with pytest.raises(FileExistsError):
+        build_shards(dataset, tmp_path, image_size=16)
+    assert (tmp_path / "ds" / "kawung" / "0.png").exists()
+
+
+def test_build_refuses_existing_shards(dataset, tmp_path):
+    out = tmp_path / "shards"
+    build_shards(dataset, out, image_size=16)
+    with pytest.raises(FileExistsError):
+        build_shards(dataset, out, image_size=16)
+
+
+def test_build_replaces_an_interrupted_build(dataset, tmp_path):
+    out = tmp_path / "shards"
+    out.mkdir()
+    for name in ("shard-00000.u8", "shard-00007.u8", "labels.npy", INDEX_FILE + ".tmp"):
+        (out / name).write_bytes(b"stale")
+    build_shards(dataset, out, image_size=16, shard_size=4)
+    assert sorted(path.name for path in out.iterdir()) == [
+        INDEX_FILE, "labels.npy", "shard-00000.u8", "shard-00001.u8",
+    ]
+    assert len(ShardDataset(out).index["paths"]) == 6
+
+
+def test_build_into_an_empty_directory(dataset, tmp_path):
+    out = tmp_path / "shards"
+    out.mkdir()
+    assert build_shards(dataset, out, image_size=16)["count"] == 6
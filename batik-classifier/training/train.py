@@ -0,0 +1,350 @@
+"""
+Two-phase transfer-learning training, importable and scriptable.
+
+Same recipe as the notebooks (frozen backbone, then fine-tuning everything
+at a 10x lower learning rate, with the same head and callbacks), fed by the
+tf.data pipelines in ``pipeline.py`` instead of ImageDataGenerator:
+
+    python train.py /data/batik_dataset --output-dir runs/mobilenet
+    python train.py /data/batik_shards --backbone efficientnetb4 --epochs-phase1 30 --epochs-phase2 50
+    python train.py /data/batik_dataset --val /data/batik_val --seed 7 --deterministic
+    python train.py /data/batik_shards --feature-cache cache/mnv2 --augment-passes 4
+    python train.py /data/batik_dataset.manifest.json     # the manifest's stored split
+
+Writes ``best_model_batik.keras`` and a ``batik_config_*.json`` in the format
+of ``data/batik_config_mobilenet_ultimate.json``.
+"""
+import argparse
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+import keras
+import numpy as np
+import tensorflow as tf
+
+import features
+import pipeline
+from dataset import ClassFolderDataset, split_indices
+from manifest import open_dataset
+from shards import ShardDataset
+
+# name -> (constructor, in-model input scaling from [0, 255])
+BACKBONES = {
+    # MobileNetV2 expects [-1, 1]: the same x/127.5 - 1 the server applies.
+    "mobilenetv2": (keras.applications.MobileNetV2, lambda: keras.layers.Rescaling(1 / 127.5, offset=-1.0)),
+    # Keras' EfficientNet rescales internally and takes raw [0, 255] pixels.
+    "efficientnetb4": (keras.applications.EfficientNetB4, None),
+}
+
+
+def set_seed(seed: int, deterministic_ops: bool = False) -> None:
+    """Seed Python, NumPy and TF; optionally force deterministic TF kernels (slower)."""
+    keras.utils.set_random_seed(seed)
+    if deterministic_ops:
+        tf.config.experimental.enable_op_determinism()
+
+
+def build_head(feature_dim: int, num_classes: int) -> keras.Model:
+    """The notebooks' classifier head, on pooled backbone features."""
+    return keras.Sequential(
+        [
+            keras.Input((feature_dim,), name="features"),
+            keras.layers.BatchNormalization(),
+            keras.layers.Dense(1024, activation="relu"),
+            keras.layers.Dropout(0.5),
+            keras.layers.Dense(512, activation="relu"),
+            keras.layers.BatchNormalization(),
+            keras.layers.Dropout(0.3),
+            keras.layers.Dense(num_classes, activation="softmax", name="predictions"),
+        ],
+        name="head",
+    )
+
+
+def build_model(
+    num_classes: int,
+    backbone: str = "mobilenetv2",
+    image_size: int = 224,
+    weights: Optional[str] = "imagenet",
+) -> Tuple[keras.Model, keras.Model]:
+    """(model, backbone) with the notebooks' head; the backbone starts frozen.
+
+    The model takes float pixels in [0, 255] and scales them itself. The
+    backbone runs in inference mode even when unfrozen, so fine-tuning does
+    not disturb its BatchNorm statistics. The pooled backbone output is the
+    ``features`` layer and the classifier is the nested ``head`` model, so
+    the head can also be trained on its own from cached features.
+    """
+    constructor, scaling = BACKBONES[backbone]
+    inputs = keras.Input((image_size, image_size, 3), name="image")
+    x = scaling()(inputs) if scaling else inputs
+    base = constructor(include_top=False, weights=weights, input_shape=(image_size, image_size, 3))
+    base.trainable = False
+    x = base(x, training=False)
+    features = keras.layers.GlobalAveragePooling2D(name="features")(x)
+    outputs = build_head(features.shape[-1], num_classes)(features)
+    return keras.Model(inputs, outputs, name=f"batik_{backbone}"), base
+
+
+def feature_extractor(model: keras.Model) -> keras.Model:
+    """Image -> pooled backbone features, sharing ``model``'s weights."""
+    return keras.Model(model.input, model.get_layer("features").output, name="feature_extractor")
+
+
+def _compile(model: keras.Model, learning_rate: float) -> None:
+    model.compile(
+        optimizer=keras.optimizers.AdamW(learning_rate=learning_rate),
+        loss="categorical_crossentropy",
+        metrics=[
+            "accuracy",
+            keras.metrics.TopKCategoricalAccuracy(3, name="top3"),
+            keras.metrics.TopKCategoricalAccuracy(5, name="top5"),
+        ],
+    )
+
+
+def _callbacks(output_dir: Path) -> list:
+    return [
+        keras.callbacks.ModelCheckpoint(
+            str(output_dir / "best_model_batik.keras"), monitor="val_accuracy", save_best_only=True, mode="max", verbose=1
+        ),
+        keras.callbacks.EarlyStopping(monitor="val_accuracy", patience=15, restore_best_weights=True, mode="max", verbose=1),
+        keras.callbacks.ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=5, min_lr=1e-7, verbose=1),
+    ]
+
+
+class Split(NamedTuple):
+    """One side of the train/validation split: its samples, and where to
+    read them from (image files, or ``indices`` into ``shards``)."""
+
+    samples: ClassFolderDataset
+    shards: Optional[ShardDataset] = None
+    indices: Optional[np.ndarray] = None
+
+
+def open_splits(source: Path, val_source: Optional[Path] = None, validation_split: float = 0.2) -> Tuple[Split, Split]:
+    """(train, validation) from a class folder, zip of one, manifest or shard directory.
+
+    Without ``val_source`` the validation set is the manifest's stored split,
+    or else ImageDataGenerator's ``validation_split`` subset of ``source``.
+    """
+
+    def open_source(path: Path, class_names=None):
+        if ShardDataset.is_shard_dir(path):
+            shards = ShardDataset(path)
+            return shards, shards.as_class_folders()
+        return None, open_dataset(path, class_names)
+
+    if val_source is None and not ShardDataset.is_shard_dir(source):
+        # Split first, then leave out quarantined files: the split stays the notebooks'.
+        samples = open_dataset(source, None, "training", validation_split)
+        return Split(samples), Split(open_dataset(source, samples.class_names, "validation", validation_split))
+    shards, samples = open_source(source)
+    if val_source is not None:
+        val_shards, val_samples = open_source(val_source, samples.class_names)
+        if val_samples.class_names != samples.class_names:
+            raise ValueError(f"{val_source} has a different class list than {source}")
+        return Split(samples, shards), Split(val_samples, val_shards)
+    train_idx, val_idx = split_indices(samples.labels, validation_split)
+    return (
+        Split(samples.select(train_idx), shards, train_idx if shards is not None else None),
+        Split(samples.select(val_idx), shards, val_idx if shards is not None else None),
+    )
+
+
+def make_dataset(
+    split: Split,
+    batch_size: int = 32,
+    image_size: int = 224,
+    training: bool = True,
+    seed: int = 42,
+    cache: Optional[str] = "",
+    augment: bool = True,
+    shuffle: Optional[bool] = None,
+) -> tf.data.Dataset:
+    if split.shards is not None:
+        return pipeline.from_shards(
+            split.shards, split.indices, batch_size, training, seed, augment, shuffle=shuffle
+        )
+    return pipeline.from_files(
+        split.samples, batch_size, image_size, training, seed, cache, augment, shuffle=shuffle
+    )
+
+
+def load_datasets(
+    source: Path,
+    val_source: Optional[Path] = None,
+    validation_split: float = 0.2,
+    batch_size: int = 32,
+    image_size: int = 224,
+    seed: int = 42,
+    cache: Optional[str] = "",
+    augment: bool = True,
+) -> Tuple[tf.data.Dataset, tf.data.Dataset, ClassFolderDataset]:
+    """(train, validation, training samples); see ``open_splits``."""
+    train_split, val_split = open_splits(source, val_source, validation_split)
+    train_ds = make_dataset(train_split, batch_size, image_size, True, seed, cache, augment)
+    val_ds = make_dataset(val_split, batch_size, image_size, False, seed, cache, augment=False)
+    return train_ds, val_ds, train_split.samples
+
+
+def train(
+    train_ds: tf.data.Dataset,
+    val_ds: tf.data.Dataset,
+    class_names: list,
+    output_dir: Path,
+    backbone: str = "mobilenetv2",
+    image_size: int = 224,
+    epochs_phase1: int = 30,
+    epochs_phase2: int = 40,
+    weights: Optional[str] = "imagenet",
+    class_counts: Optional[dict] = None,
+    model_and_base: Optional[Tuple[keras.Model, keras.Model]] = None,
+    head_data: Optional[Tuple[tf.data.Dataset, tf.data.Dataset]] = None,
+) -> Tuple[keras.Model, dict]:
+    """Phase 1 trains the head on a frozen backbone, phase 2 fine-tunes everything.
+
+    With ``head_data`` (train/validation datasets of cached backbone
+    features, see ``features.py``) phase 1 trains the ``head`` sub-model on
+    those instead of running every image through the frozen backbone; pass
+    the ``model_and_base`` the features were extracted with.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    model, base = model_and_base or build_model(len(class_names), backbone, image_size, weights)
+
+    # Shared by both phases, as in the notebooks: "best" spans the whole run.
+    callbacks = _callbacks(output_dir)
+
+    if head_data is not None:
+        print(f"Phase 1: head only, on cached features ({epochs_phase1} epochs, lr 1e-3)")
+        head = model.get_layer("head")
+        _compile(head, 1e-3)
+        history1 = head.fit(
+            head_data[0], epochs=epochs_phase1, validation_data=head_data[1], callbacks=_callbacks(output_dir)[1:]
+        )
+        # The head lives inside ``model``: checkpoint the whole model as the score phase 2 has to beat.
+        callbacks[0].best = head.evaluate(head_data[1], return_dict=True, verbose=0)["accuracy"]
+        model.save(output_dir / "best_model_batik.keras")
+    else:
+        print(f"Phase 1: head only ({epochs_phase1} epochs, lr 1e-3)")
+        _compile(model, 1e-3)
+        history1 = model.fit(train_ds, epochs=epochs_phase1, validation_data=val_ds, callbacks=callbacks)
+    history = {key: list(values) for key, values in history1.history.items()}
+
+    if epochs_phase2 > 0:
+        print(f"Phase 2: fine-tuning all layers ({epochs_phase2} epochs, lr 1e-4)")
+        base.trainable = True
+        _compile(model, 1e-4)
+        history2 = model.fit(
+            train_ds,
+            epochs=epochs_phase1 + epochs_phase2,
+            initial_epoch=len(history["loss"]),
+            validation_data=val_ds,
+            callbacks=callbacks,
+        )
+        for key, values in history2.history.items():
+            history.setdefault(key, []).extend(values)
+
+    results = model.evaluate(val_ds, return_dict=True, verbose=0)
+    model.save(output_dir / "final_model_batik.keras")
+    config = {
+        "img_size": image_size,
+        "classes": list(class_names),
+        "num_classes": len(class_names),
+        "accuracy": float(results["accuracy"]),
+        "top3": float(results["top3"]),
+        "top5": float(results["top5"]),
+        "loss": float(results["loss"]),
+        "model": BACKBONES[backbone][0].__name__,
+        "training_strategy": ("Two-stage (frozen + fine-tuning)" if epochs_phase2 > 0 else "Frozen backbone")
+        + (" with cached features" if head_data is not None else ""),
+        "stage1_epochs": epochs_phase1,
+        "stage2_epochs": epochs_phase2,
+        "total_time_minutes": (time.perf_counter() - started) / 60,
+        "input_range": "0-255 (scaled inside the model)",
+    }
+    if class_counts is not None:
+        config["class_counts"] = class_counts
+    (output_dir / f"batik_config_{backbone}.json").write_text(json.dumps(config, indent=2), encoding="utf-8")
+    (output_dir / f"history_{backbone}.json").write_text(json.dumps(history), encoding="utf-8")
+    return model, config
+
+
+def _fingerprint(samples: ClassFolderDataset) -> str:
+    digest = hashlib.sha1(str(samples.root).encode())
+    digest.update("\n".join(samples.paths).encode())
+    digest.update(samples.labels.tobytes())
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", type=Path, help="Class-folder dataset, zip, manifest or shard directory")
+    parser.add_argument("--val", type=Path, help="Separate validation folder/shards (default: --validation-split)")
+    parser.add_argument("--validation-split", type=float, default=0.2)
+    parser.add_argument("--backbone", choices=sorted(BACKBONES), default="mobilenetv2")
+    parser.add_argument("--weights", default="imagenet", help="'imagenet' or 'none'")
+    parser.add_argument("--image-size", type=int, default=224)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--epochs-phase1", type=int, default=30)
+    parser.add_argument("--epochs-phase2", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--deterministic", action="store_true", help="Also force deterministic TF kernels (slower)")
+    parser.add_argument("--cache", default="", help="'' caches decoded images in memory, a path caches to disk, 'none' disables")
+    parser.add_argument("--no-augment", action="store_true")
+    parser.add_argument("--feature-cache", type=Path,
+                        help="Run phase 1 on backbone features cached in this directory (built on first use)")
+    parser.add_argument("--augment-passes", type=int, default=0,
+                        help="Augmented copies of every training image in the feature cache")
+    parser.add_argument("--output-dir", type=Path, default=Path("runs") / time.strftime("%Y%m%d-%H%M%S"))
+    args = parser.parse_args()
+
+    set_seed(args.seed, args.deterministic)
+    cache = None if args.cache == "none" else args.cache
+    weights = None if args.weights == "none" else args.weights
+    train_split, val_split = open_splits(args.dataset, args.val, args.validation_split)
+    train_ds = make_dataset(train_split, args.batch_size, args.image_size, True, args.seed, cache, not args.no_augment)
+    val_ds = make_dataset(val_split, args.batch_size, args.image_size, False, args.seed, cache, augment=False)
+    samples = train_split.samples
+    counts = samples.class_counts()
+    print(f"{len(samples.paths)} training images, {len(samples.class_names)} classes "
+          f"({counts.min()}-{counts.max()} per class) -> {args.output_dir}")
+
+    model_and_base = head_data = None
+    if args.feature_cache:
+        model_and_base = build_model(len(samples.class_names), args.backbone, args.image_size, weights)
+        splits = {"train": train_split, "val": val_split}
+
+        def extraction_dataset(which: str, seed: int, augment: bool, decode_cache: str) -> tf.data.Dataset:
+            return make_dataset(
+                splits[which], args.batch_size, args.image_size, augment, seed, decode_cache, augment, shuffle=False
+            )
+
+        signature = {
+            "backbone": args.backbone,
+            "weights": weights,
+            "image_size": args.image_size,
+            "train": _fingerprint(train_split.samples),
+            "val": _fingerprint(val_split.samples),
+        }
+        print(f"Feature cache {args.feature_cache} ({args.augment_passes} augmented passes)")
+        features.build_cache(
+            args.feature_cache, feature_extractor(model_and_base[0]), extraction_dataset, signature,
+            args.augment_passes, args.seed,
+        )
+        head_data = features.feature_datasets(args.feature_cache, len(samples.class_names), args.batch_size, args.seed)
+
+    _, config = train(
+        train_ds, val_ds, samples.class_names, args.output_dir, args.backbone, args.image_size,
+        args.epochs_phase1, args.epochs_phase2, weights, dict(zip(samples.class_names, counts.tolist())),
+        model_and_base, head_data,
+    )
+    print(f"Validation: accuracy {config['accuracy']:.4f}, top3 {config['top3']:.4f}, top5 {config['top5']:.4f}")
+
+
+if __name__ == "__main__":
+    main()